@@ -0,0 +1,157 @@
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import request
+from werkzeug.exceptions import HTTPException
+
+from app import create_app
+from asyncdb import dispose, init_async_db
+from views.aio import ASYNC_VIEWS
+
+
+# Optional ASGI entry point. GETs of the home page, the venue, artist and show listings and the venue
+# and artist pages are answered on the event loop by the async views in views/aio.py, so a worker
+# waiting on the database for them is free to take other requests. Every other request goes to the
+# regular Flask app through asgiref's WSGI adapter, which runs it on a thread pool. The WSGI app in
+# app.py is unchanged and remains the default way to serve Fyyur.
+#
+#   pip install asgiref uvicorn asyncpg   # aiosqlite instead of asyncpg for SQLite
+#   uvicorn --factory asgi:create_asgi_app --workers 4
+#
+# The async views run through the app's own request handling (before/after request hooks, sessions,
+# error handlers and teardown), so instrumentation, the caches and replica routing behave as in the
+# sync app. See benchmarks/bench_asgi.py for a load test of both modes.
+
+
+def _environ(scope):
+    # The WSGI environ of an ASGI HTTP request without a body, which is all the async views take.
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin1'),
+        'PATH_INFO': scope['path'].encode().decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class AsgiApp:
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            environ = _environ(scope)
+            view = self.async_view(environ)
+            if view is not None:
+                return await self.dispatch(view, environ, send)
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await dispose(self.app)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def async_view(self, environ):
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            # Not found, wrong method or a redirect: Flask answers those.
+            return None
+        return ASYNC_VIEWS.get(endpoint)
+
+    async def dispatch(self, view, environ, send):
+        # Flask.wsgi_app() with the view awaited; the request context lives in this request's task.
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                response = await self.full_dispatch(view)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            except:  # noqa: E722
+                error = sys.exc_info()[1]
+                raise
+            await self.respond(response, environ, send)
+        finally:
+            if app.should_ignore_error(error):
+                error = None
+            ctx.auto_pop(error)
+
+    async def full_dispatch(self, view):
+        app = self.app
+        app.try_trigger_before_first_request_functions()
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await view(**request.view_args)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        return app.finalize_request(rv)
+
+    async def respond(self, response, environ, send):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        body = response(environ, start_response)
+        try:
+            content = b''.join(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        status, headers = started
+        await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': content})
+
+
+def create_asgi_app(config='config'):
+    app = create_app(config)
+    init_async_db(app)
+    return AsgiApp(app)
+
+
+def __getattr__(name):
+    # Like app.app: `uvicorn asgi:app` builds the default app on first use.
+    if name == 'app':
+        global app
+        app = create_asgi_app()
+        return app
+    raise AttributeError(name)
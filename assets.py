@@ -0,0 +1,205 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are written without it
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # optional: scripts are then fingerprinted and compressed but not minified
+    rjsmin = None
+
+
+# Static asset pipeline. `flask assets build` copies everything under static/ into static/dist/ with
+# the content hash in the file name (css/main.css -> css/main.3f2a9c1e5b7d.css), minifies CSS and JS
+# that are not minified already, points url(...) references in stylesheets at the hashed files and
+# writes .gz (and, with the `brotli` package, .br) variants next to every text asset. The mapping
+# from original to hashed names is kept in static/dist/manifest.json.
+#
+# While a manifest exists, url_for('static', filename=...) returns the hashed name, and the hashed
+# files are served precompressed according to Accept-Encoding with a one year, immutable
+# Cache-Control: a changed file gets a new name, so browsers never need to revalidate. Without a
+# manifest (e.g. while working on the stylesheets; see `flask assets clean`) the original files are
+# served as before.
+#
+# The build also compiles every template into the Jinja bytecode cache (TEMPLATE_BYTECODE_DIR), so
+# new workers load compiled templates instead of parsing them on their first requests.
+
+assets_cli = AppGroup('assets', help='Build fingerprinted, minified and precompressed static assets.')
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.ttf', '.eot', '.otf', '.json', '.txt', '.html'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+# Strings, unquoted url()s and comments, whichever starts first: a "/*" inside a string is not a
+# comment and a quote inside a comment does not start a string.
+_CSS_VERBATIM = re.compile(r'''"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|url\(\s*[^'"\s)][^)]*\)|/\*.*?\*/''', re.S)
+_CSS_PLACEHOLDER = re.compile(r'\x00(\d+)\x00')
+
+
+def minify_css(css):
+    # Conservative: drops comments and whitespace that cannot matter, and leaves selectors such as
+    # "a :hover" alone. Strings and unquoted url()s are set aside first and put back as they were.
+    verbatim = []
+
+    def set_aside(match):
+        if match.group(0).startswith('/*'):
+            return ' '
+        verbatim.append(match.group(0))
+        return '\x00%d\x00' % (len(verbatim) - 1)
+    css = _CSS_VERBATIM.sub(set_aside, css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}').strip()
+    return _CSS_PLACEHOLDER.sub(lambda match: verbatim[int(match.group(1))], css)
+
+
+def _minify(path, data):
+    name = os.path.basename(path)
+    if '.min.' in name:
+        return data
+    if path.endswith('.css'):
+        return minify_css(data.decode('utf-8')).encode('utf-8')
+    if path.endswith('.js') and rjsmin is not None:
+        return rjsmin.jsmin(data.decode('utf-8')).encode('utf-8')
+    return data
+
+
+def _fingerprint(path, data):
+    base, ext = os.path.splitext(path)
+    return '%s.%s%s' % (base, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def _rewrite_urls(path, css, manifest):
+    # url(...) in a stylesheet is relative to the stylesheet; dist/ keeps the directory layout, so
+    # the rewritten reference stays relative.
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/')):
+            return match.group(0)
+        target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        resolved = posixpath.normpath(posixpath.join(directory, target))
+        if resolved not in manifest:
+            return match.group(0)
+        hashed = posixpath.relpath(manifest[resolved], directory or '.')
+        return 'url(%s%s%s%s)' % (quote, hashed, suffix, quote)
+    return _CSS_URL.sub(replace, css)
+
+
+def _write_compressed(path, data):
+    variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+
+
+def build(static_folder):
+    dist = os.path.join(static_folder, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            sources.append(os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/'))
+    # Stylesheets last, so the fonts and images they refer to already have their hashed names.
+    sources.sort(key=lambda path: path.endswith('.css'))
+
+    manifest, sizes = {}, [0, 0]
+    for path in sources:
+        with open(os.path.join(static_folder, path), 'rb') as file:
+            data = file.read()
+        sizes[0] += len(data)
+        data = _minify(path, data)
+        if path.endswith('.css'):
+            data = _rewrite_urls(path, data.decode('utf-8'), manifest).encode('utf-8')
+        hashed = manifest[path] = _fingerprint(path, data)
+        target = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as file:
+            file.write(data)
+        sizes[1] += len(data)
+        if os.path.splitext(path)[1] in COMPRESSIBLE:
+            _write_compressed(target, data)
+    with open(os.path.join(dist, MANIFEST), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest, sizes
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def init_assets(app):
+    manifest = app.extensions['assets'] = load_manifest(app.static_folder)
+    dist = os.path.join(app.static_folder, DIST)
+
+    @app.url_defaults
+    def fingerprinted_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = DIST + '/' + manifest[values['filename']]
+
+    def dist_view(filename):
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in request.accept_encodings and os.path.isfile(os.path.join(dist, filename + suffix)):
+                encoding, filename = candidate, filename + suffix
+                break
+        response = send_from_directory(dist, filename, mimetype=mimetype, max_age=31536000, conditional=False)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
+    app.add_url_rule(app.static_url_path + '/' + DIST + '/<path:filename>', 'static_dist', dist_view)
+
+    return manifest
+
+
+def compile_templates(app):
+    # Loading a template stores its bytecode in the cache; returns the number of templates.
+    if app.jinja_env.bytecode_cache is None:
+        return 0
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+@assets_cli.command('build', help='Fingerprint, minify and precompress everything under static/.')
+def build_command():
+    manifest, (before, after) = build(current_app.static_folder)
+    click.echo(f'{len(manifest)} files, {before / 1024:.0f} KiB -> {after / 1024:.0f} KiB minified '
+               f'(gzip{", brotli" if brotli else ""} variants written)')
+    if rjsmin is None:
+        click.echo('rjsmin is not installed: scripts were not minified', err=True)
+    click.echo(f'{compile_templates(current_app)} templates compiled')
+
+
+@assets_cli.command('clean', help='Remove static/dist/ so the original files are served again.')
+def clean_command():
+    shutil.rmtree(os.path.join(current_app.static_folder, DIST), ignore_errors=True)
@@ -0,0 +1,77 @@
+import asyncio
+
+from flask import current_app, g
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import configure_mappers
+
+
+# Database access for the async views served by asgi.py. The primary and every replica bind of the
+# app get an AsyncEngine on the same URL with an asyncio driver in place of the sync one (asyncpg for
+# Postgres, aiosqlite for SQLite; neither is in requirements.txt) and the same DATABASE_POOL_*
+# settings, so a worker in ASGI mode holds a second set of pools next to the one its sync routes use.
+#
+# The async views read with Core select()s of the mapped columns and get plain rows back. A
+# connection (or AsyncSession) runs one statement at a time, so fetch_all() gives each statement its
+# own pooled connection and awaits them together: independent lookups of a page cost one round
+# trip instead of one per query.
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_url(uri):
+    url = make_url(uri)
+    try:
+        return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    except KeyError:
+        raise ValueError('No asyncio driver for %s' % url.drivername) from None
+
+
+def _engine_options(app, url):
+    # The async counterpart of RoutingSQLAlchemy.apply_driver_hacks() in routing.py.
+    options = {'pool_pre_ping': app.config.get('DATABASE_POOL_PRE_PING', False)}
+    if url.get_backend_name() == 'sqlite':
+        return options
+    for option, key in (('pool_size', 'DATABASE_POOL_SIZE'), ('max_overflow', 'DATABASE_MAX_OVERFLOW'),
+                        ('pool_timeout', 'DATABASE_POOL_TIMEOUT'), ('pool_recycle', 'DATABASE_POOL_RECYCLE')):
+        if app.config.get(key) is not None:
+            options[option] = app.config[key]
+    timeout = app.config.get('DATABASE_STATEMENT_TIMEOUT_MS')
+    if timeout:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}}
+    return options
+
+
+def init_async_db(app):
+    # Engines by bind name; None is the primary, the replicas are named as in routing.py.
+    # The async views join along backrefs such as Show.artist, which only exist once the mappers are
+    # configured; the ORM would do that on the first sync query.
+    configure_mappers()
+    uris = {None: app.config['SQLALCHEMY_DATABASE_URI']}
+    for name in app.extensions.get('replicas', {}).get('names', ()):
+        uris[name] = app.config['SQLALCHEMY_BINDS'][name]
+    engines = app.extensions['async_db'] = {}
+    for name, uri in uris.items():
+        url = async_url(uri)
+        engines[name] = create_async_engine(url, **_engine_options(app, url))
+    return engines
+
+
+async def dispose(app):
+    for engine in app.extensions.get('async_db', {}).values():
+        await engine.dispose()
+
+
+def reader():
+    # The engine for this request's reads: the replica picked by @read_only, or the primary.
+    return current_app.extensions['async_db'][g.get('replica')]
+
+
+async def fetch(statement):
+    async with reader().connect() as connection:
+        return (await connection.execute(statement)).all()
+
+
+async def fetch_all(*statements):
+    # Runs the statements concurrently and returns their rows in the same order.
+    return await asyncio.gather(*(fetch(statement) for statement in statements))
@@ -0,0 +1,140 @@
+# Route benchmarks: p50/p99 latency, queries per request and peak memory for every route in app.py.
+#
+#   python -m benchmarks run [--scale 1k|100k|1m] [--seed 42] [--samples 50] [--cold-cache]
+#                            [--database-uri postgresql://...] [--output results.json]
+#   python -m benchmarks compare before.json after.json
+#
+# Without --database-uri the run uses a fresh in-memory SQLite database filled by the seeded
+# generator (benchmarks/datagen.py). A Postgres database must already be migrated (`flask db
+# upgrade`); it is filled on the first run and reused as is afterwards, so keep one database per
+# scale. --cold-cache clears the object and page caches before every request.
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    config.SQLALCHEMY_DATABASE_URI = args.database_uri
+    # The image proxy is on (it needs a secret) and keeps its variants in a scratch directory;
+    # /metrics needs a token.
+    config.IMAGE_PROXY_SECRET = config.IMAGE_PROXY_SECRET or 'bench-routes'
+    config.METRICS_TOKEN = config.METRICS_TOKEN or 'bench-routes'
+    config.IMAGE_CACHE_DIR = tempfile.mkdtemp(prefix='fyyur-bench-images-')
+
+    from app import app
+    from models import db, Venue, Artist
+    from benchmarks import datagen
+    from benchmarks.routes import CASES, run_case
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    only = set(args.routes.split(',')) if args.routes else None
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        if Venue.query.first() is None:
+            start = time.perf_counter()
+            counts = datagen.generate(args.scale, seed=args.seed)
+            print(f'generated {counts} in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+        counts = datagen.existing_counts()
+
+        # Detail and edit pages use a venue and an artist from the middle of the id range.
+        venue = Venue.query.get(counts['venues'] // 2 or 1)
+        artist = Artist.query.get(counts['artists'] // 2 or 1)
+        ctx = SimpleNamespace(app=app, engine=db.engine, venue_id=venue.id, venue_name=venue.name,
+                              artist_id=artist.id, artist_name=artist.name, prefix='Bench %d' % time.time(),
+                              serial=itertools.count())
+        dialect = db.engine.dialect.name
+
+    print(f'{"route":<26}{"p50 ms":>10}{"p99 ms":>10}{"queries":>9}{"peak KiB":>11}  statuses', file=sys.stderr)
+    results = {}
+    for case in CASES:
+        if only and case.name not in only:
+            continue
+        results[case.name] = result = run_case(case, ctx, args.samples, cold_cache=args.cold_cache)
+        print(f'{case.name:<26}{result.get("p50_ms", 0):>10.2f}{result.get("p99_ms", 0):>10.2f}'
+              f'{result.get("queries", 0):>9.1f}{result.get("peak_kib") or 0:>11.0f}  {result["statuses"]}',
+              file=sys.stderr)
+
+    shutil.rmtree(config.IMAGE_CACHE_DIR, ignore_errors=True)
+
+    output = {
+        'meta': {'scale': args.scale, 'seed': args.seed, 'samples': args.samples, 'cold_cache': args.cold_cache,
+                 'database': dialect, 'rows': counts, 'revision': _git_revision(),
+                 'python': platform.python_version(), 'date': datetime.utcnow().isoformat(timespec='seconds')},
+        'routes': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+
+def _change(old, new):
+    if old is None or new is None:
+        return ''
+    return f'{(new - old) / old * 100:+.0f}%' if old else ''
+
+
+def compare(args):
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+    print(f'{"route":<26}{"p50 ms":>18}{"":>7}{"p99 ms":>18}{"":>7}{"queries":>14}')
+    for name, new in after['routes'].items():
+        old = before['routes'].get(name, {})
+        row = f'{name:<26}'
+        for metric in ('p50_ms', 'p99_ms'):
+            row += f'{old.get(metric, float("nan")):>9.2f}{new.get(metric, float("nan")):>9.2f}' \
+                   f'{_change(old.get(metric), new.get(metric)):>7}'
+        row += f'{old.get("queries", float("nan")):>7.1f}{new.get("queries", float("nan")):>7.1f}'
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Benchmark every route and write the results as JSON.')
+    run_parser.add_argument('--scale', default='1k', help='1k, 100k, 1m or a number of shows.')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--samples', type=int, default=50, help='Timed requests per route.')
+    run_parser.add_argument('--routes', help='Comma separated route names, e.g. venues,show_venue.')
+    run_parser.add_argument('--cold-cache', action='store_true')
+    run_parser.add_argument('--database-uri', default='sqlite://')
+    run_parser.add_argument('--output')
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files.')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
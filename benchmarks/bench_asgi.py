@@ -0,0 +1,179 @@
+# Load test of the two serving modes: requests/sec and latency percentiles of the read-heavy pages
+# under the same concurrency, served by gunicorn (WSGI, app.py) and by uvicorn (ASGI, asgi.py).
+#
+#   python benchmarks/bench_asgi.py [--database-uri postgresql://...] [--workers 4] [--threads 8]
+#                                   [--concurrency 64] [--duration 20] [--warmup 3] [--cache]
+#                                   [--modes wsgi,asgi] [--output results.json]
+#
+# Needs gunicorn, uvicorn, asgiref and asyncpg (aiosqlite for a SQLite file). The database must
+# already hold data, e.g. a Postgres filled by `python -m benchmarks run --scale 100k --database-uri ...`.
+# Both servers get the same number of worker processes; WSGI workers additionally get --threads
+# threads each. The page and object caches are off unless --cache, so every request reaches the
+# database. Requests are spread over the home page, the listings and random venue and artist pages.
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+PAGES = ['/', '/venues', '/artists', '/shows', '/venues/{venue_id}', '/artists/{artist_id}',
+         '/venues/{venue_id}', '/artists/{artist_id}']
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _server(mode, port, args):
+    env = dict(os.environ, FLASK_SQLALCHEMY_DATABASE_URI=args.database_uri, FLASK_DEBUG='false')
+    if not args.cache:
+        env.update(FLASK_PAGE_CACHE_ENABLED='false', FLASK_CACHE_MAX_ENTRIES='0')
+    if mode == 'wsgi':
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--threads', str(args.threads),
+                   '--bind', '127.0.0.1:%d' % port, '--log-level', 'warning', 'app:create_app()']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', '--factory', 'asgi:create_asgi_app', '--workers',
+                   str(args.workers), '--port', str(port), '--log-level', 'warning', '--no-access-log']
+    return subprocess.Popen(command, cwd=ROOT, env=env)
+
+
+def _wait_until_up(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('server exited with status %d' % process.returncode)
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit('server did not come up on port %d' % port)
+
+
+def _client(port, paths, threads, warmup, duration, seed):
+    # One load generating process: `threads` keep-alive connections requesting random pages as fast
+    # as they are answered. Returns the latencies (ms) of the requests completed after the warmup.
+    start = time.monotonic() + warmup
+    stop = start + duration
+    latencies, errors = [], []
+
+    def loop(rng):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        mine, failed = [], 0
+        while True:
+            now = time.monotonic()
+            if now >= stop:
+                break
+            sent = time.perf_counter()
+            try:
+                connection.request('GET', rng.choice(paths))
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                ok = False
+            if now >= start:
+                if ok:
+                    mine.append((time.perf_counter() - sent) * 1000)
+                else:
+                    failed += 1
+        latencies.extend(mine)
+        errors.append(failed)
+
+    workers = [threading.Thread(target=loop, args=(random.Random(seed * 1000 + number),)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, sum(errors)
+
+
+def _paths(args, seed, count=2000):
+    from sqlalchemy import create_engine, func, select
+    from models import Artist, Venue
+    engine = create_engine(args.database_uri)
+    with engine.connect() as connection:
+        venues = connection.execute(select(func.max(Venue.id))).scalar() or 1
+        artists = connection.execute(select(func.max(Artist.id))).scalar() or 1
+    engine.dispose()
+    rng = random.Random(seed)
+    return [rng.choice(PAGES).format(venue_id=rng.randint(1, venues), artist_id=rng.randint(1, artists))
+            for _ in range(count)]
+
+
+def run_mode(mode, args, paths):
+    port = _free_port()
+    process = _server(mode, port, args)
+    try:
+        _wait_until_up(port, process)
+        processes = min(args.concurrency, os.cpu_count() or 1)
+        per_process = [args.concurrency // processes + (number < args.concurrency % processes)
+                       for number in range(processes)]
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [pool.submit(_client, port, paths, threads, args.warmup, args.duration, args.seed + number)
+                       for number, threads in enumerate(per_process)]
+            results = [future.result() for future in futures]
+    finally:
+        process.terminate()
+        process.wait()
+    latencies = sorted(latency for result in results for latency in result[0])
+    if not latencies:
+        raise SystemExit('%s: no request succeeded' % mode)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        'requests': len(latencies),
+        'errors': sum(result[1] for result in results),
+        'rps': round(len(latencies) / args.duration, 1),
+        'p50_ms': round(quantiles[49], 2),
+        'p90_ms': round(quantiles[89], 2),
+        'p99_ms': round(quantiles[98], 2),
+        'max_ms': round(latencies[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=config.SQLALCHEMY_DATABASE_URI)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cache', action='store_true', help='Keep the page and object caches on.')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    paths = _paths(args, args.seed)
+    results = {}
+    for mode in args.modes.split(','):
+        results[mode] = result = run_mode(mode, args, paths)
+        print(f'{mode:<5} {result["rps"]:8.1f} req/s  p50 {result["p50_ms"]:7.2f} ms  p90 {result["p90_ms"]:7.2f} ms  '
+              f'p99 {result["p99_ms"]:7.2f} ms  max {result["max_ms"]:7.2f} ms  '
+              f'({result["requests"]} requests, {result["errors"]} errors)')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Cold start of a worker: import of app.py, create_app() and the first response, each in a fresh
+# interpreter, with and without precompiled templates.
+#
+#   python benchmarks/bench_coldstart.py [--runs 15] [--path /venues/create] [--database-uri postgresql://...]
+#                                        [--max-ms 400]
+#
+# The default path renders a full page without reading the database. --max-ms fails the run (exit
+# status 1) when the median import-to-first-response time with compiled templates is over budget.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Runs in the child: times every step from the first import of the app on.
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import config
+config.SQLALCHEMY_DATABASE_URI = sys.argv[1]
+config.TEMPLATE_BYTECODE_DIR = sys.argv[3] or None
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get(sys.argv[2])
+responded = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_response': responded - created, 'total': responded - start,
+                  'modules': len(sys.modules)}))
+'''
+
+
+def compile_into(directory, database_uri):
+    import config
+    config.SQLALCHEMY_DATABASE_URI = database_uri
+    config.TEMPLATE_BYTECODE_DIR = directory
+    from app import create_app
+    from assets import compile_templates
+    return compile_templates(create_app())
+
+
+def sample(args, bytecode_dir):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD, args.database_uri, args.path, bytecode_dir or ''],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.splitlines()[-1])
+    timings['process'] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--path', default='/venues/create')
+    parser.add_argument('--database-uri', default='sqlite://')
+    parser.add_argument('--max-ms', type=float)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as bytecode_dir:
+        print(f'{compile_into(bytecode_dir, args.database_uri)} templates compiled', file=sys.stderr)
+        medians = {}
+        for label, directory in (('no bytecode cache', None), ('compiled templates', bytecode_dir)):
+            runs = [sample(args, directory) for _ in range(args.runs)]
+            medians[label] = {key: statistics.median(run[key] for run in runs) * (1 if key == 'modules' else 1000)
+                              for key in runs[0]}
+            m = medians[label]
+            print(f'{label:<19} import {m["import"]:6.1f} ms  create_app {m["create_app"]:5.1f} ms  '
+                  f'first response {m["first_response"]:5.1f} ms  total {m["total"]:6.1f} ms  '
+                  f'(process {m["process"]:6.1f} ms, {m["modules"]:.0f} modules)')
+
+    total = medians['compiled templates']['total']
+    if args.max_ms is not None and total > args.max_ms:
+        print(f'cold start {total:.1f} ms is over the {args.max_ms:.0f} ms budget', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
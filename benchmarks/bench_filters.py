@@ -0,0 +1,60 @@
+# The `datetime` Jinja filter before and after memoization, over the show times of 10k shows.
+#
+#   python benchmarks/bench_filters.py [--shows 10000] [--distinct 2000]
+#
+# Show times repeat in practice (many shows start at the same hour), --distinct controls how many
+# different values the 10k shows share.
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import babel.dates  # noqa: E402
+import dateutil.parser  # noqa: E402
+
+from filters import format_datetime, _format_datetime  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    # The filter as it was: string round trip and pattern/locale resolved on every call.
+    date = dateutil.parser.parse(str(value))
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def run(fn, values, format):
+    start = time.perf_counter()
+    for value in values:
+        fn(value, format)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--distinct', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    base = datetime(2026, 1, 1, 18, 0)
+    times = [base + timedelta(hours=rng.randrange(args.distinct)) for _ in range(args.shows)]
+
+    for format in ('full', 'medium'):
+        assert all(format_datetime(t, format) == legacy_format_datetime(t, format) for t in times[:100])
+        legacy = run(legacy_format_datetime, times, format)
+        _format_datetime.cache_clear()
+        cold = run(format_datetime, times, format)
+        warm = run(format_datetime, times, format)
+        print(f'{format:<7} {args.shows} shows: legacy {legacy:7.1f} ms   new (cold cache) {cold:6.1f} ms   '
+              f'new (warm cache) {warm:6.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
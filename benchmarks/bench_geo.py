@@ -0,0 +1,95 @@
+# Nearby venues at scale: a full scan ranked in Python against geo.nearby() and geo.in_box(), for
+# points in the middle of the generated cities (thousands of venues within the radius) and random
+# points across the US (mostly nothing nearby).
+#
+#   python benchmarks/bench_geo.py [--venues 100000] [--radius 25] [--limit 20]
+#                                  [--database-uri postgresql://...]
+#
+# Without --database-uri the benchmark runs on an in-memory SQLite database (in-process geohash
+# grid). A Postgres database must already be migrated (`flask db upgrade`) so the GiST index exists;
+# venues are generated into it only if it has fewer than --venues.
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+
+def timed(fn, points):
+    samples = []
+    for point in points:
+        start = time.perf_counter()
+        fn(point)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--radius', type=float, default=25)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--points', type=int, default=50)
+    parser.add_argument('--database-uri', default='sqlite://')
+    args = parser.parse_args()
+    config.SQLALCHEMY_DATABASE_URI = args.database_uri
+
+    from app import create_app
+    from models import db, Venue
+    from importer import write_chunk
+    from benchmarks import datagen
+    import geo
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        existing = Venue.query.count()
+        if existing < args.venues:
+            # Names get a suffix so they do not clash with venues generated by other benchmarks.
+            rows = islice(datagen.venue_rows(random.Random(42), args.venues, random.Random(43)), existing, None)
+            while True:
+                chunk = [dict(row, name=row['name'] + ' geo') for row in islice(rows, datagen.CHUNK_SIZE)]
+                if not chunk:
+                    break
+                write_chunk(db.session, Venue.__table__, chunk)
+            db.session.commit()
+
+        located = db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(Venue.latitude.isnot(None)).all()
+        start = time.perf_counter()
+        geo.nearby(0, 0, 1, 1)
+        print(f'{db.engine.dialect.name}, {len(located)} located venues (first search/grid build: '
+              f'{(time.perf_counter() - start) * 1000:.0f} ms), nearest {args.limit} within {args.radius:g} km')
+
+        def scan(point):
+            # What a search without an index does: every venue's distance, then sort.
+            distances = sorted((geo.haversine(*point, latitude, longitude), id) for id, latitude, longitude in located)
+            return [id for distance, id in distances if distance <= args.radius][:args.limit]
+
+        def nearby(point):
+            return [row.id for row in geo.nearby(*point, args.radius, args.limit)]
+
+        def in_box(point):
+            return geo.in_box(geo.around(*point, args.radius), args.limit)
+
+        rng = random.Random(42)
+        centres = [geo.geocode(city, state) for city, state in datagen.CITIES]
+        sets = {'city centres': [rng.choice(centres) for _ in range(args.points)],
+                'random points': [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(args.points)]}
+        print(f'{"":<15}{"scan p50":>10}{"nearby p50":>12}{"max":>8}{"box p50":>10}{"max":>8}  same results')
+        for label, points in sets.items():
+            same = all(scan(point) == nearby(point) for point in points[:5])
+            scan_ms = timed(scan, points[:5])[0]
+            nearby_ms, box_ms = timed(nearby, points), timed(in_box, points)
+            print(f'{label:<15}{scan_ms:>10.1f}{nearby_ms[0]:>12.2f}{nearby_ms[1]:>8.2f}{box_ms[0]:>10.2f}'
+                  f'{box_ms[1]:>8.2f}  {"yes" if same else "NO"}')
+
+
+if __name__ == '__main__':
+    main()
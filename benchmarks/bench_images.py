@@ -0,0 +1,159 @@
+# Image proxy against a local stand-in origin: bytes of the images on /shows and on a venue page with
+# the original links and through the proxy (WebP and JPEG), the latency of the page itself with a
+# cold and a warm image cache, and of an image request that has to fetch and resize (miss) against
+# one served from the disk cache (hit).
+#
+#   python benchmarks/bench_images.py [--images 20] [--source-size 2400x1600] [--origin-latency-ms 50]
+#                                     [--scale 1k]
+#
+# The origin is an http.server on 127.0.0.1 serving generated JPEGs, so the proxy runs with
+# IMAGE_FETCH_PRIVATE on. Needs Pillow.
+import argparse
+import http.server
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+WEBP = 'image/avif,image/webp,*/*;q=0.8'
+JPEG = 'image/png,image/*;q=0.8'
+
+
+class Origin(http.server.SimpleHTTPRequestHandler):
+    latency = 0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_origin(directory, latency):
+    handler = type('Handler', (Origin,), {'latency': latency})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d' % server.server_address[1]
+
+
+def make_images(directory, count, size):
+    from PIL import Image, ImageFilter
+    for number in range(count):
+        # Blurred noise compresses about as well as a photo does.
+        bands = [Image.effect_noise(size, 40 + number).filter(ImageFilter.GaussianBlur(2)) for _ in range(3)]
+        Image.merge('RGB', bands).save(os.path.join(directory, '%d.jpg' % number), quality=90)
+
+
+def image_sources(html):
+    return re.findall(r'<img src="([^"]+)"', html)
+
+
+def wait_for_fetches(proxy):
+    for future in list(proxy._pending.values()):
+        future.result()
+
+
+def page_weight(client, path, origin_dir, accept):
+    html = client.get(path, headers={'Accept': 'text/html'}).get_data(as_text=True)
+    sources = image_sources(html)
+    total = 0
+    for source in sources:
+        if source.startswith('http'):
+            total += os.path.getsize(os.path.join(origin_dir, source.rsplit('/', 1)[1]))
+        else:
+            total += len(client.get(source, headers={'Accept': accept}).get_data())
+    return len(sources), total
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--source-size', default='2400x1600')
+    parser.add_argument('--origin-latency-ms', type=float, default=50)
+    parser.add_argument('--scale', default='1k')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    origin_dir = os.path.join(work, 'origin')
+    os.makedirs(origin_dir)
+    make_images(origin_dir, args.images, tuple(int(side) for side in args.source_size.split('x')))
+    server, origin = start_origin(origin_dir, args.origin_latency_ms / 1000)
+
+    config.SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    config.PAGE_CACHE_ENABLED = False
+    config.IMAGE_CACHE_DIR = os.path.join(work, 'cache')
+    config.IMAGE_FETCH_PRIVATE = True
+    config.IMAGE_PROXY_SECRET = 'bench-images'
+    config.IMAGE_FETCH_WAIT = 30
+
+    from app import create_app
+    from images import ImageCache, thumbnail
+    from models import db, Artist, Venue
+    from benchmarks import datagen
+
+    app = create_app()
+    proxy = app.extensions['images']
+    client = app.test_client()
+    try:
+        with app.app_context():
+            db.create_all()
+            datagen.generate(args.scale, seed=42)
+            for model in (Artist, Venue):
+                db.session.query(model).update({model.image_link: origin + '/' +
+                                                db.cast(model.id % args.images, db.String) + '.jpg'},
+                                               synchronize_session=False)
+            db.session.commit()
+            venue_id = Venue.query.first().id
+
+        pages = ['/shows', '/venues/%d' % venue_id]
+        for path in pages:
+            # The original links, as rendered without the proxy.
+            app.jinja_env.filters['thumbnail'] = lambda url, size='tile': url or ''
+            original = page_weight(client, path, origin_dir, WEBP)
+            app.jinja_env.filters['thumbnail'] = thumbnail
+            webp = page_weight(client, path, origin_dir, WEBP)
+            jpeg = page_weight(client, path, origin_dir, JPEG)
+            print(f'{path:<12} {original[0]:3d} images: original {original[1] / 1024:8.0f} KiB   '
+                  f'proxied WebP {webp[1] / 1024:6.0f} KiB   JPEG {jpeg[1] / 1024:6.0f} KiB')
+
+        # Page latency does not depend on the image cache: missing images are only queued.
+        shutil.rmtree(config.IMAGE_CACHE_DIR)
+        proxy.cache = ImageCache(config.IMAGE_CACHE_DIR, app.config['IMAGE_CACHE_MAX_BYTES'])
+        cold_page = timed(lambda: client.get('/shows', headers={'Accept': WEBP}))
+        wait_for_fetches(proxy)
+        warm_page = statistics.median(timed(lambda: client.get('/shows', headers={'Accept': WEBP}))
+                                      for _ in range(5))
+        print(f'/shows page: cold image cache {cold_page:6.1f} ms   warm {warm_page:6.1f} ms')
+
+        # Image requests for links no page has queued yet: fetch and resize, then hit.
+        urls = ['/images/detail/' + proxy.signer.dumps('%s/%d.jpg' % (origin, number))
+                for number in range(args.images)]
+        misses = [timed(lambda: client.get(url, headers={'Accept': WEBP})) for url in urls]
+        hits = [timed(lambda: client.get(url, headers={'Accept': WEBP})) for url in urls]
+        print(f'detail image: miss p50 {statistics.median(misses):6.1f} ms   hit p50 {statistics.median(hits):5.2f} ms')
+
+        missing = client.get('/images/tile/' + proxy.signer.dumps(origin + '/missing.jpg'))
+        print(f'missing origin image -> {missing.status_code} {missing.headers.get("Location")}')
+    finally:
+        server.shutdown()
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# Throughput of the bulk importer (importer.import_file) in rows/sec.
+#
+#   python benchmarks/bench_import.py [--venues 20000] [--artists 20000] [--shows 200000]
+#                                     [--database-uri postgresql://...]
+#
+# Synthetic CSV files are written to a temporary directory first. Without --database-uri the rows
+# go into an in-memory SQLite database (executemany); a migrated Postgres database uses COPY.
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+GENRES = ['Jazz', 'Blues', 'Folk', 'Rock n Roll', 'Pop', 'R&B', 'Soul', 'Classical']
+STATES = ['CA', 'NY', 'TX', 'IL', 'WA', 'TN', 'CO', 'MA']
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=20000)
+    parser.add_argument('--artists', type=int, default=20000)
+    parser.add_argument('--shows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--database-uri', default='sqlite://')
+    args = parser.parse_args()
+    config.SQLALCHEMY_DATABASE_URI = args.database_uri
+
+    from app import app
+    from models import db
+    from importer import import_file
+
+    rng = random.Random(42)
+    directory = tempfile.mkdtemp()
+    files = {
+        'venues': os.path.join(directory, 'venues.csv'),
+        'artists': os.path.join(directory, 'artists.csv'),
+        'shows': os.path.join(directory, 'shows.csv'),
+    }
+    write_csv(files['venues'], ['name', 'city', 'state', 'address', 'genres', 'seeking_talent'],
+              ([f'Venue {i}', f'City {i % 500}', rng.choice(STATES), f'{i} Main St',
+                ';'.join(rng.sample(GENRES, 2)), rng.choice(['y', ''])] for i in range(args.venues)))
+    write_csv(files['artists'], ['name', 'city', 'state', 'genres', 'seeking_venue'],
+              ([f'Artist {i}', f'City {i % 500}', rng.choice(STATES), rng.choice(GENRES), rng.choice(['y', ''])]
+               for i in range(args.artists)))
+    start = datetime(2020, 1, 1)
+    write_csv(files['shows'], ['artist', 'venue_id', 'start_time'],
+              ([f'Artist {rng.randrange(args.artists)}', rng.randrange(args.venues) + 1,
+                (start + timedelta(hours=rng.randrange(24 * 3650))).strftime('%Y-%m-%d %H:%M:%S')]
+               for _ in range(args.shows)))
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        print(f'{db.engine.dialect.name}, batch size {args.batch_size}')
+        for kind in ('venues', 'artists', 'shows'):
+            result = import_file(kind, files[kind], batch_size=args.batch_size)
+            print(f'{kind:<8} {result.inserted:>8} rows  {result.seconds:7.1f} s  {result.rows_per_second:>9.0f} rows/s'
+                  f'  ({result.rejected} rejected)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Full-page cache: latency of a rendered page (miss), a cached page (hit) and a revalidation that
+# ends in 304 Not Modified, for the cached routes.
+#
+#   python benchmarks/bench_pagecache.py [--scale 100k] [--repeat 200] [--database-uri postgresql://...]
+#
+# Without --database-uri the data is generated into an in-memory SQLite database.
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+ROUTES = ['/', '/venues', '/artists', '/shows', '/venues/{venue_id}', '/artists/{artist_id}']
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='100k')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--database-uri', default='sqlite://')
+    args = parser.parse_args()
+    config.SQLALCHEMY_DATABASE_URI = args.database_uri
+
+    from app import app
+    from models import db, Venue
+    from benchmarks import datagen
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        if Venue.query.first() is None:
+            datagen.generate(args.scale)
+        counts = datagen.existing_counts()
+        dialect = db.engine.dialect.name
+    ids = {'venue_id': counts['venues'] // 2, 'artist_id': counts['artists'] // 2}
+    page_cache = app.extensions['page_cache']
+    object_cache = app.extensions['object_cache']
+    client = app.test_client()
+
+    print(f'{dialect}, {counts}')
+    print(f'{"route":<16}{"miss ms":>10}{"hit ms":>10}{"304 ms":>10}')
+    for route in ROUTES:
+        path = route.format(**ids)
+
+        def miss():
+            page_cache.clear()
+            object_cache.clear()
+            client.get(path).get_data()
+
+        def hit():
+            client.get(path).get_data()
+
+        # A streamed page only has an ETag once it has been cached, after its first response.
+        client.get(path).get_data()
+        etag = client.get(path).headers['ETag']
+
+        def revalidate():
+            client.get(path, headers={'If-None-Match': etag}).get_data()
+
+        print(f'{path:<16}{timed(miss, args.repeat):>10.2f}{timed(hit, args.repeat):>10.3f}'
+              f'{timed(revalidate, args.repeat):>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
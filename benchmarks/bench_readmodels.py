@@ -0,0 +1,80 @@
+# Listing reads through full ORM instances against the column projections in readmodels.py: time
+# and peak Python memory (tracemalloc) to load --rows artists and venues the way the listing pages
+# order them, plus the /artists and /venues routes with a page of --page-size rows.
+#
+#   python benchmarks/bench_readmodels.py [--rows 100000] [--page-size 1000]
+#                                         [--database-uri postgresql://...]
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+
+def measure(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(samples), peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-uri', default='sqlite://')
+    args = parser.parse_args()
+    config.SQLALCHEMY_DATABASE_URI = args.database_uri
+    config.PAGE_CACHE_ENABLED = False
+
+    from app import app
+    from models import db, Venue, Artist
+    from readmodels import ARTIST_LISTING, VENUE_LISTING
+    from benchmarks import datagen
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        if Venue.query.first() is None:
+            # Ten shows per venue/artist, so --rows venues and --rows artists.
+            datagen.generate(str(args.rows * 10))
+        print(f'{db.engine.dialect.name}, {datagen.existing_counts()}')
+        print(f'{"read":<34}{"ORM ms":>10}{"ORM MiB":>10}{"rows ms":>10}{"rows MiB":>10}')
+
+        cases = [
+            ('all artists by name', lambda: Artist.query.order_by(Artist.name, Artist.id).all(),
+             lambda: ARTIST_LISTING.all(ARTIST_LISTING.query().order_by(Artist.name, Artist.id))),
+            ('all venues by area', lambda: Venue.query.order_by(Venue.state, Venue.city, Venue.id).all(),
+             lambda: VENUE_LISTING.all(VENUE_LISTING.query().order_by(Venue.state, Venue.city, Venue.id))),
+        ]
+        for name, orm, projection in cases:
+            def run_orm():
+                orm()
+                db.session.remove()
+            orm_ms, orm_mib = measure(run_orm, args.repeat)
+            rows_ms, rows_mib = measure(projection, args.repeat)
+            print(f'{name:<34}{orm_ms:>10.1f}{orm_mib:>10.1f}{rows_ms:>10.1f}{rows_mib:>10.1f}')
+
+    app.config['PAGE_SIZE'] = args.page_size
+    app.config['STREAM_TEMPLATES'] = False
+    client = app.test_client()
+    for path in ('/artists', '/venues'):
+        client.get(path)
+        ms, mib = measure(lambda: client.get(path).get_data(), args.repeat)
+        print(f'{"GET " + path + " (projection rows)":<34}{"":>20}{ms:>10.1f}{mib:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Venue search at scale: the old ilike('%term%') scan against search.search().
+#
+#   python benchmarks/bench_search.py [--rows 100000] [--database-uri postgresql://...]
+#
+# Without --database-uri the benchmark runs on an in-memory SQLite database (in-process inverted
+# index). A Postgres database must already be migrated (`flask db upgrade`) so the GIN indexes exist.
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+TERMS = ['san', 'san fran', 'hop', 'park square', 'ny', 'jazz club', 'zzz']
+WORDS = ['the', 'musical', 'hop', 'park', 'square', 'live', 'dueling', 'pianos', 'bar', 'club', 'hall',
+         'jazz', 'room', 'cellar', 'garden', 'lounge', 'theatre', 'house', 'blue', 'red']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Chicago', 'IL'),
+          ('Seattle', 'WA'), ('Nashville', 'TN'), ('Denver', 'CO'), ('Boston', 'MA')]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-uri', default='sqlite://')
+    args = parser.parse_args()
+    config.SQLALCHEMY_DATABASE_URI = args.database_uri
+
+    from app import app
+    from models import db, Venue
+    import search
+
+    rng = random.Random(42)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        if Venue.query.count() < args.rows:
+            rows = []
+            for i in range(args.rows):
+                city, state = rng.choice(CITIES)
+                name = ' '.join(rng.sample(WORDS, 3)).title() + f' {i}'
+                rows.append({'name': name, 'city': city, 'state': state, 'genres': []})
+            db.session.execute(Venue.__table__.insert(), rows)
+            db.session.commit()
+
+        start = time.perf_counter()
+        search.search(Venue, 'warmup')
+        print(f'{db.engine.dialect.name}, {args.rows} venues (first search/index build: '
+              f'{(time.perf_counter() - start) * 1000:.0f} ms)')
+        print(f'{"term":<14}{"matches":>9}{"ilike ms":>11}{"search ms":>11}')
+        for term in TERMS:
+            def ilike():
+                query = Venue.query.filter(Venue.city.ilike('%' + term + '%') | Venue.name.ilike('%' + term + '%') |
+                                           Venue.state.ilike('%' + term + '%'))
+                query.count()
+                query.order_by(Venue.name, Venue.id).limit(50).all()
+
+            def ranked():
+                return search.search(Venue, term)
+            count = ranked()[1]
+            print(f'{term:<14}{count:>9}{timed(ilike, args.repeat):>11.1f}{timed(ranked, args.repeat):>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Streamed against buffered rendering of the big listing pages: time to first byte, total time and
+# peak Python memory (tracemalloc) while a page of --page-sizes rows is rendered and sent.
+#
+#   python benchmarks/bench_streaming.py [--scale 100k] [--page-sizes 1000,10000,50000]
+#                                        [--database-uri postgresql://...]
+#
+# With streaming, peak memory should stay about flat as the page grows; buffered, it grows with
+# the page. Without --database-uri the data is generated into an in-memory SQLite database.
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+ROUTES = ['/artists', '/shows']
+
+
+def measure(client, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(path, buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks, b''))
+    first = time.perf_counter() - start
+    for chunk in chunks:
+        size += len(chunk)
+    response.close()
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first * 1000, total * 1000, peak / 1024 / 1024, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='100k')
+    parser.add_argument('--page-sizes', default='1000,10000,50000')
+    parser.add_argument('--database-uri', default='sqlite://')
+    args = parser.parse_args()
+    config.SQLALCHEMY_DATABASE_URI = args.database_uri
+    config.PAGE_CACHE_ENABLED = False
+
+    from app import app
+    from models import db, Venue
+    from benchmarks import datagen
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        if Venue.query.first() is None:
+            datagen.generate(args.scale)
+        counts = datagen.existing_counts()
+        dialect = db.engine.dialect.name
+    client = app.test_client()
+
+    print(f'{dialect}, {counts}')
+    print(f'{"route":<10}{"rows":>7}{"mode":>10}{"first byte ms":>15}{"total ms":>10}{"peak MiB":>10}{"KiB sent":>10}')
+    for route in ROUTES:
+        for page_size in [int(size) for size in args.page_sizes.split(',')]:
+            app.config['PAGE_SIZE'] = page_size
+            for streamed in (False, True):
+                app.config['STREAM_TEMPLATES'] = streamed
+                client.get(route)  # warm up templates and caches
+                first, total, peak, size = measure(client, route)
+                print(f'{route:<10}{page_size:>7}{"streamed" if streamed else "buffered":>10}{first:>15.1f}'
+                      f'{total:>10.1f}{peak:>10.1f}{size / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import math
+import random
+from datetime import datetime, timedelta
+from itertools import islice
+
+from models import db, Venue, Artist, Show, refresh_show_counters
+from geo import geocode
+from importer import write_chunk
+
+
+# Seeded synthetic data: the same scale and seed always produce the same venues, artists and shows,
+# so two benchmark runs against freshly generated databases see identical data. A scale names the
+# number of shows; there is one venue and one artist for every ten shows.
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+CHUNK_SIZE = 10000
+
+WORDS = ['the', 'musical', 'hop', 'park', 'square', 'live', 'dueling', 'pianos', 'bar', 'club', 'hall',
+         'jazz', 'room', 'cellar', 'garden', 'lounge', 'theatre', 'house', 'blue', 'red', 'wild', 'sons']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Chicago', 'IL'),
+          ('Seattle', 'WA'), ('Nashville', 'TN'), ('Denver', 'CO'), ('Boston', 'MA'), ('Portland', 'OR'),
+          ('Atlanta', 'GA'), ('Miami', 'FL'), ('Detroit', 'MI')]
+GENRES = ['Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop', 'Jazz', 'Pop', 'Punk',
+          'R&B', 'Reggae', 'Rock n Roll', 'Soul']
+
+# Venues are scattered around their city's centre with this standard deviation in km.
+CITY_SPREAD_KM = 8
+
+# Shows are spread over ten years around this date, so about half of them are upcoming for the next
+# few years of benchmark runs.
+EPOCH = datetime(2021, 1, 1)
+CREATED = datetime(2020, 1, 1)
+
+
+def sizes(scale):
+    shows = SCALES[scale] if scale in SCALES else int(scale)
+    return {'venues': max(shows // 10, 10), 'artists': max(shows // 10, 10), 'shows': shows}
+
+
+def venue_rows(rng, count, places):
+    # Locations come from their own generator `places`, so the other columns stay as they were.
+    for i in range(count):
+        city, state = rng.choice(CITIES)
+        latitude, longitude = geocode(city, state)
+        latitude += places.gauss(0, CITY_SPREAD_KM / 111.2)
+        longitude += places.gauss(0, CITY_SPREAD_KM / (111.2 * math.cos(math.radians(latitude))))
+        yield {'name': ' '.join(rng.sample(WORDS, 3)).title() + f' {i}', 'city': city, 'state': state,
+               'latitude': round(latitude, 6), 'longitude': round(longitude, 6),
+               'address': f'{rng.randrange(1, 2000)} {rng.choice(WORDS).title()} St',
+               'phone': f'{rng.randrange(200, 999)}-555-{rng.randrange(10000):04d}',
+               'genres': rng.sample(GENRES, rng.randrange(1, 4)), 'image_link': None,
+               'website_link': None, 'facebook_link': None, 'looking_for_talent': rng.random() < 0.5,
+               'seeking_description': None, 'date_created': CREATED + timedelta(minutes=i)}
+
+
+def artist_rows(rng, count):
+    for i in range(count):
+        city, state = rng.choice(CITIES)
+        yield {'name': ' '.join(rng.sample(WORDS, 2)).title() + f' {i}', 'city': city, 'state': state,
+               'phone': None, 'genres': rng.sample(GENRES, rng.randrange(1, 3)), 'image_link': None,
+               'website_link': None, 'facebook_link': None, 'looking_for_venues': rng.random() < 0.5,
+               'seeking_description': None, 'date_created': CREATED + timedelta(minutes=i)}
+
+
+def show_rows(rng, count, venues, artists):
+    # Shows are dealt out in rounds, each round one show per venue within its own slice of the ten
+    # years and every artist at most once, so no venue or artist is ever double-booked (Postgres
+    # rejects that, see scheduling.py).
+    rounds = -(-count // venues)
+    window = 24 * 1825 * 2 // rounds
+    emitted = 0
+    for round in range(rounds):
+        performers = rng.sample(range(artists), min(venues, artists))
+        for venue, artist in enumerate(performers):
+            if emitted == count:
+                return
+            show_time = EPOCH + timedelta(hours=-24 * 1825 + round * window + rng.randrange(window - 2))
+            yield {'artist_id': artist + 1, 'venue_id': venue + 1, 'show_time': show_time,
+                   'end_time': show_time + timedelta(hours=2)}
+            emitted += 1
+
+
+def _write(session, model, rows):
+    table = model.__table__
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            break
+        write_chunk(session, table, chunk)
+        session.commit()
+
+
+def generate(scale, seed=42, session=None):
+    # Fills empty venues/artists/shows tables; ids are assumed to start at 1. Returns the row counts.
+    session = session or db.session
+    if session.query(Venue.id).first() is not None or session.query(Artist.id).first() is not None:
+        raise ValueError('generate() needs empty venues and artists tables')
+    counts = sizes(scale)
+    rng = random.Random(seed)
+    _write(session, Venue, venue_rows(rng, counts['venues'], random.Random(seed + 1)))
+    _write(session, Artist, artist_rows(rng, counts['artists']))
+    _write(session, Show, show_rows(rng, counts['shows'], counts['venues'], counts['artists']))
+    # Bulk inserts bypass the ORM events that maintain the show counters.
+    refresh_show_counters(session)
+    session.commit()
+    return counts
+
+
+def existing_counts(session=None):
+    session = session or db.session
+    return {'venues': session.query(db.func.count(Venue.id)).scalar(),
+            'artists': session.query(db.func.count(Artist.id)).scalar(),
+            'shows': session.query(db.func.count(Show.id)).scalar()}
@@ -0,0 +1,251 @@
+import math
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, or_
+
+from images import encode
+from models import db, Venue, Show
+
+
+# Drives every route in app.py through the Flask test client. Each case yields the requests it
+# makes as (method, path, form data or Json); whatever it does between requests (e.g. looking up
+# the ids of venues to delete) is neither timed nor counted.
+
+# A JSON request body (or None), with extra headers, for the API routes and /metrics.
+Json = namedtuple('Json', 'payload headers', defaults=(None,))
+
+class Case:
+    def __init__(self, name, requests, samples=None):
+        self.name = name
+        self.requests = requests
+        self.samples = samples  # caps the number of timed requests for slow routes such as exports
+
+
+def _get(path):
+    def requests(ctx, count):
+        for _ in range(count):
+            yield 'GET', path(ctx) if callable(path) else path, None
+    return requests
+
+
+def _venue_form(name, description=''):
+    return {'name': name, 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+            'phone': '123-123-1234', 'genres': ['Jazz', 'Folk'], 'seeking_talent': 'y',
+            'seeking_description': description}
+
+
+def _artist_form(name, description=''):
+    return {'name': name, 'city': 'Austin', 'state': 'TX', 'phone': '326-123-5000', 'genres': ['Soul'],
+            'seeking_venue': 'y', 'seeking_description': description}
+
+
+def _create_venues(ctx, count):
+    for _ in range(count):
+        yield 'POST', '/venues/create', _venue_form(f'{ctx.prefix} Venue {next(ctx.serial)}')
+
+
+def _delete_venues(ctx, count):
+    # Deletes the venues made by the create case (which runs first and makes as many requests), so
+    # venues do not pile up between runs. Artists and shows created by later cases do remain.
+    with ctx.app.app_context():
+        ids = [id for id, in db.session.query(Venue.id).filter(Venue.name.like(ctx.prefix + ' Venue %'))]
+    for id in ids[:count]:
+        yield 'GET', f'/venues/delete/{id}', None
+
+
+def _create_artists(ctx, count):
+    for _ in range(count):
+        yield 'POST', '/artists/create', _artist_form(f'{ctx.prefix} Artist {next(ctx.serial)}')
+
+
+def _edit_artist(ctx, count):
+    for i in range(count):
+        yield 'POST', f'/artists/{ctx.artist_id}/edit', _artist_form(ctx.artist_name, f'edit {i}')
+
+
+def _edit_venue(ctx, count):
+    for i in range(count):
+        yield 'POST', f'/venues/{ctx.venue_id}/edit', _venue_form(ctx.venue_name, f'edit {i}')
+
+
+def _create_shows(ctx, count):
+    # Books the venue and artist back to back after their last show, so no request is turned away as
+    # a double booking.
+    with ctx.app.app_context():
+        last = db.session.query(func.max(Show.end_time)).filter(
+            or_(Show.venue_id == ctx.venue_id, Show.artist_id == ctx.artist_id)).scalar()
+    start = max(last or datetime.min, datetime(2030, 1, 1)).replace(second=0, microsecond=0) + timedelta(hours=1)
+    for i in range(count):
+        yield 'POST', '/shows/create', {'artist_id': ctx.artist_id, 'venue_id': ctx.venue_id,
+                                        'start_time': f'{start + timedelta(hours=3 * i):%Y-%m-%d %H:%M:%S}'}
+
+
+def _batch_artists(ctx, count):
+    # 50 new artists per request through the bulk write API.
+    for _ in range(count):
+        yield 'POST', '/api/artists:batch', Json([
+            {'name': f'{ctx.prefix} Batch Artist {next(ctx.serial)}', 'city': 'Austin', 'state': 'TX',
+             'genres': ['Soul']} for _ in range(50)])
+
+
+def _replay_batch(ctx, count):
+    # The same batch under the same Idempotency-Key: written by the untimed first request, replayed
+    # from the stored response after that.
+    batch = Json([{'name': f'{ctx.prefix} Replayed Artist {i}', 'city': 'Austin', 'state': 'TX',
+                   'genres': ['Soul']} for i in range(50)], {'Idempotency-Key': f'{ctx.prefix} replay'})
+    for _ in range(count):
+        yield 'POST', '/api/artists:batch', batch
+
+
+def _check_schedule(ctx, count):
+    # A dry run of 100 shows for the detail venue and artist, one every two hours.
+    shows = [{'venue_id': ctx.venue_id, 'artist_id': ctx.artist_id, 'duration': 90,
+              'start_time': f'{datetime(2031, 1, 1) + timedelta(hours=2 * i):%Y-%m-%d %H:%M}'} for i in range(100)]
+    for _ in range(count):
+        yield 'POST', '/shows/schedule', Json({'shows': shows})
+
+
+def _metrics(ctx, count):
+    headers = {'Authorization': 'Bearer %s' % ctx.app.config['METRICS_TOKEN']}
+    for _ in range(count):
+        yield 'GET', '/metrics', Json(None, headers)
+
+
+# A 1x1 GIF, the image behind the image proxy case.
+_PIXEL = bytes.fromhex('47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b')
+
+
+def _proxied_image(ctx, count):
+    # A cached variant served by the image proxy (only on when IMAGE_PROXY_SECRET is set).
+    proxy = ctx.app.extensions.get('images')
+    if proxy is None:
+        return
+    url = 'https://images.example.com/bench.gif'
+    # The test client sends no Accept header, so it gets the JPEG variant.
+    key = proxy.cache.key(url, 'tile', 'jpeg')
+    if proxy.cache.get(key) is None:
+        proxy.cache.put(key, *encode(_PIXEL, 'image/gif', proxy.sizes['tile'], 'jpeg'))
+    with ctx.app.test_request_context():
+        path = f'/images/tile/{proxy.signer.dumps(url)}'
+    for _ in range(count):
+        yield 'GET', path, None
+
+
+def _search(path, term):
+    def requests(ctx, count):
+        for _ in range(count):
+            yield 'POST', path, {'search_term': term}
+    return requests
+
+
+CASES = [
+    Case('index', _get('/')),
+    Case('venues', _get('/venues')),
+    Case('browse_venues', _get('/venues/browse?genre=Jazz&state=CA')),
+    Case('browse_artists_json', _get('/artists/browse.json?genre=Jazz&seeking=1')),
+    Case('search_venues', _search('/venues/search', 'san fran')),
+    Case('nearby_venues', _get('/venues/near?city=San+Francisco&state=CA&radius=10')),
+    Case('show_venue', _get(lambda ctx: f'/venues/{ctx.venue_id}')),
+    Case('create_venue_form', _get('/venues/create')),
+    Case('create_venue_submission', _create_venues),
+    Case('delete_venue', _delete_venues),
+    Case('artists', _get('/artists')),
+    Case('search_artists', _search('/artists/search', 'blue')),
+    Case('show_artist', _get(lambda ctx: f'/artists/{ctx.artist_id}')),
+    Case('edit_artist', _get(lambda ctx: f'/artists/{ctx.artist_id}/edit')),
+    Case('edit_artist_submission', _edit_artist),
+    Case('edit_venue', _get(lambda ctx: f'/venues/{ctx.venue_id}/edit')),
+    Case('edit_venue_submission', _edit_venue),
+    Case('create_artist_form', _get('/artists/create')),
+    Case('create_artist_submission', _create_artists),
+    Case('shows', _get('/shows')),
+    Case('create_shows', _get('/shows/create')),
+    Case('create_show_submission', _create_shows),
+    Case('check_schedule', _check_schedule),
+    Case('batch_artists', _batch_artists),
+    Case('batch_artists_replay', _replay_batch),
+    Case('export_venues_jsonl', _get('/venues.jsonl'), samples=3),
+    Case('export_artists_csv', _get('/artists.csv'), samples=3),
+    Case('export_shows_jsonl', _get('/shows.jsonl'), samples=3),
+    Case('export_shows_csv', _get('/shows.csv'), samples=3),
+    Case('cache_stats', _get('/cache/stats')),
+    Case('metrics', _metrics),
+    Case('image_proxy', _proxied_image),
+]
+
+
+def percentile(samples, p):
+    # Nearest-rank percentile of an already sorted list.
+    return samples[max(math.ceil(p / 100 * len(samples)) - 1, 0)]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def _send(client, method, path, data):
+    if isinstance(data, Json):
+        response = client.open(path, method=method, json=data.payload, headers=data.headers)
+    else:
+        response = client.open(path, method=method, data=data)
+    # Reading the body makes streamed responses (exports) run to completion.
+    response.get_data()
+    return response.status_code
+
+
+def run_case(case, ctx, samples, cold_cache=False):
+    # Must run outside an app context: each request then gets its own and the database session is
+    # removed after it, as in production.
+    caches = [ctx.app.extensions[name] for name in ('object_cache', 'page_cache') if name in ctx.app.extensions]
+    client = ctx.app.test_client()
+    counter = QueryCounter(ctx.engine)
+    timings, queries, statuses = [], [], set()
+    count = min(samples, case.samples or samples)
+
+    # One untimed request first, so template compilation and first-use setup are not measured.
+    for method, path, data in case.requests(ctx, 1):
+        _send(client, method, path, data)
+    for method, path, data in case.requests(ctx, count):
+        if cold_cache:
+            for cache in caches:
+                cache.clear()
+        counter.count = 0
+        start = time.perf_counter()
+        statuses.add(_send(client, method, path, data))
+        timings.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count)
+
+    # Peak memory comes from one extra, separately traced request: tracing slows everything down,
+    # so it is kept out of the timed ones.
+    peak = None
+    for method, path, data in case.requests(ctx, 1):
+        if cold_cache:
+            for cache in caches:
+                cache.clear()
+        tracemalloc.start()
+        statuses.add(_send(client, method, path, data))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    event.remove(ctx.engine, 'before_cursor_execute', counter)
+
+    if not timings:
+        return {'requests': 0, 'statuses': sorted(statuses)}
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': round(statistics.mean(queries), 2),
+        'peak_kib': round(peak / 1024, 1) if peak is not None else None,
+        'statuses': sorted(statuses),
+    }
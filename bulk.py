@@ -0,0 +1,132 @@
+import hashlib
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError
+
+from cache import affected_keys, invalidate_on_commit
+from geo import locate_on_commit
+from importer import KINDS, validate_rows, write_chunk
+from models import IdempotencyKey, count_inserted_shows
+from search import index_on_commit
+
+
+# Bulk writes behind POST /api/<venues|artists|shows>:batch. A batch is a JSON array of records
+# shaped like the import rows (see importer.py): every record is validated with the web form and
+# checked against the database with one IN query per referenced table (plus one for double bookings
+# of shows), and then either the whole batch is written in one transaction or nothing is and every
+# failing record is reported by its index.
+#
+# With an Idempotency-Key header the response is stored under the key in that same transaction, and
+# a retry with the same key and body gets the stored response instead of writing the batch again.
+# Reusing a key for a different body is an error. Keys are forgotten after IDEMPOTENCY_KEY_TTL
+# seconds; failed batches are not stored, so they can be fixed and retried under the same key.
+# Keys longer than the column holding them are refused before anything is read.
+
+BatchResult = namedtuple('BatchResult', 'status body replayed')
+
+KEY_MAX_LENGTH = IdempotencyKey.__table__.c.key.type.length
+
+
+def valid_key(key):
+    return key is None or 0 < len(key) <= KEY_MAX_LENGTH
+
+
+def fingerprint(kind, records):
+    return hashlib.sha256(json.dumps([kind, records], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _replay(session, key, digest):
+    saved = session.get(IdempotencyKey, key)
+    if saved is None:
+        return None
+    if saved.created < datetime.utcnow() - timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL']):
+        session.delete(saved)
+        session.flush()
+        return None
+    if saved.fingerprint != digest:
+        return BatchResult(422, {'errors': [{'idempotency_key': ['This key was used for a different batch.']}]},
+                           False)
+    return BatchResult(saved.status, json.loads(saved.response), True)
+
+
+def _insert(session, table, rows):
+    # Returns the new ids in the order of `rows`. Postgres hands out the ids from the table's
+    # sequence in one query so the rows can go in through COPY; other databases insert row by row.
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        sequence = func.pg_get_serial_sequence(table.name, 'id')
+        ids = [id for id, in connection.execute(select(func.nextval(sequence)).select_from(
+            func.generate_series(1, len(rows))))]
+        write_chunk(session, table, [dict(row, id=id) for row, id in zip(rows, ids)])
+        return ids
+    return [connection.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+
+def write_batch(session, kind, records, key=None):
+    handler = KINDS[kind]()
+    digest = fingerprint(kind, records)
+    if key is not None:
+        replayed = _replay(session, key, digest)
+        if replayed is not None:
+            session.rollback()
+            return replayed
+
+    form = handler.form_class(formdata=None, meta={'csrf': False})
+    accepted, errors = validate_rows(handler, form, session, list(enumerate(records)))
+    if errors:
+        session.rollback()
+        return BatchResult(422, {'errors': [{'index': index, 'errors': problems} for index, problems in errors]},
+                           False)
+
+    rows = [values for _, values in accepted]
+    try:
+        ids = _insert(session, handler.model.__table__, rows) if rows else []
+        if kind == 'shows':
+            count_inserted_shows(session.connection(), rows)
+        keys = set()
+        for values in rows:
+            keys.update(affected_keys(session, handler.model(**values)))
+        invalidate_on_commit(session, keys)
+        if kind in ('venues', 'artists'):
+            index_on_commit(session, handler.model, ids, rows)
+        if kind == 'venues':
+            locate_on_commit(session, ids, rows)
+        result = BatchResult(201, {'ids': ids}, False)
+        if key is not None:
+            session.add(IdempotencyKey(key=key, fingerprint=digest, status=result.status,
+                                       response=json.dumps(result.body)))
+        session.commit()
+        return result
+    except IntegrityError as error:
+        # A concurrent write got in between the checks and the insert, e.g. the same retry.
+        session.rollback()
+        if key is not None:
+            replayed = _replay(session, key, digest)
+            if replayed is not None:
+                session.rollback()
+                return replayed
+        return BatchResult(409, {'errors': [{'database': [str(error.orig)]}]}, False)
+    except DataError:
+        # A value the forms let through but the column cannot hold (e.g. too long for a VARCHAR on
+        # Postgres): find the records that carry one, so they are reported like the form errors.
+        session.rollback()
+        errors = _failing_records(session, handler.model.__table__, accepted)
+        return BatchResult(422, {'errors': errors}, False)
+
+
+def _failing_records(session, table, accepted):
+    # Inserts each (index, values) on its own in a savepoint and rolls everything back.
+    errors = []
+    for index, values in accepted:
+        savepoint = session.begin_nested()
+        try:
+            _insert(session, table, [values])
+        except DBAPIError as error:
+            errors.append({'index': index, 'errors': {'database': [str(error.orig)]}})
+        savepoint.rollback()
+    session.rollback()
+    return errors
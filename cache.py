@@ -0,0 +1,209 @@
+import pickle
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm.attributes import get_history
+
+from models import db, Venue, Artist, Show
+from routing import may_lag
+
+
+# Read-through cache for venue/artist pages. Values are plain snapshots (never ORM instances), looked
+# up by keys such as "venue:42", "artist:7" or "index". Every commit that touches a venue, artist or
+# show deletes the keys it affects, see the session listeners at the bottom. The same keys, plus
+# "venues", "artists" and "shows" for the listing pages, purge the full-page cache (pagecache.py).
+
+class LocalBackend:
+    # In-process store: entries expire after `ttl` seconds and the least recently used entry is
+    # dropped once `max_entries` is reached.
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedBackend:
+    # Store shared by every worker. `client` only needs the get/set/delete subset of the redis-py
+    # API (set with an `ex` expiry), so anything speaking it can be plugged in.
+    def __init__(self, client, ttl=300, prefix='fyyur:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class ObjectCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader):
+        # `loader` may return None (e.g. unknown id); that is passed through without being cached.
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = loader()
+        if value is not None and not (has_app_context() and may_lag()):
+            self.backend.set(key, value)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        # get_or_load() for the async views of asgi.py; `loader` is a coroutine function.
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await loader()
+        if value is not None and not (has_app_context() and may_lag()):
+            self.backend.set(key, value)
+        return value
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        stats = {'hits': self.hits, 'misses': self.misses}
+        if isinstance(self.backend, LocalBackend):
+            stats['entries'] = len(self.backend)
+        return stats
+
+
+def init_cache(app):
+    if app.config.get('CACHE_REDIS_URL'):
+        import redis
+        backend = SharedBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']), ttl=app.config['CACHE_TTL'])
+    else:
+        backend = LocalBackend(max_entries=app.config['CACHE_MAX_ENTRIES'], ttl=app.config['CACHE_TTL'])
+    cache = app.extensions['object_cache'] = ObjectCache(backend)
+    return cache
+
+
+#  Invalidation
+#  ----------------------------------------------------------------
+
+def _previous_and_current(instance, attribute):
+    history = get_history(instance, attribute)
+    return [value for value in list(history.deleted) + [getattr(instance, attribute)] if value is not None]
+
+
+def affected_keys(session, instance):
+    # Keys whose cached snapshot includes `instance`. Venue and artist pages also show the name and
+    # image of the other side of each show, so renaming a venue touches its artists' pages too.
+    if isinstance(instance, Show):
+        # /venues shows each venue's upcoming show count.
+        return ['shows', 'venues'] + \
+               ['venue:%s' % id for id in _previous_and_current(instance, 'venue_id')] + \
+               ['artist:%s' % id for id in _previous_and_current(instance, 'artist_id')]
+    if not isinstance(instance, (Venue, Artist)):
+        return []
+    keys = ['index', 'shows', 'venues' if isinstance(instance, Venue) else 'artists',
+            'facets:venues' if isinstance(instance, Venue) else 'facets:artists']
+    if instance.id is not None:
+        if isinstance(instance, Venue):
+            keys.append('venue:%s' % instance.id)
+            related = session.query(Show.artist_id).filter(Show.venue_id == instance.id)
+            keys.extend('artist:%s' % id for id, in related.distinct() if id is not None)
+        else:
+            keys.append('artist:%s' % instance.id)
+            related = session.query(Show.venue_id).filter(Show.artist_id == instance.id)
+            keys.extend('venue:%s' % id for id, in related.distinct() if id is not None)
+    return keys
+
+
+_pending = weakref.WeakKeyDictionary()
+
+
+@event.listens_for(db.Session, 'before_flush')
+def _collect_keys(session, flush_context, instances):
+    # Collected before the flush so deleted venues/artists still have their shows to look up.
+    keys = _pending.setdefault(session, set())
+    with session.no_autoflush:
+        for instance in session.new:
+            keys.update(affected_keys(session, instance))
+        for instance in session.dirty:
+            if session.is_modified(instance):
+                keys.update(affected_keys(session, instance))
+        for instance in session.deleted:
+            keys.update(affected_keys(session, instance))
+
+
+def invalidate_on_commit(session, keys):
+    # For writes the listeners above cannot see, such as Core inserts.
+    if isinstance(session, scoped_session):
+        session = session()
+    _pending.setdefault(session, set()).update(keys)
+
+
+@event.listens_for(db.Session, 'after_commit')
+def _invalidate(session):
+    keys = _pending.pop(session, None)
+    if not keys or not has_app_context():
+        return
+    if 'object_cache' in current_app.extensions:
+        current_app.extensions['object_cache'].invalidate(*keys)
+    if 'page_cache' in current_app.extensions:
+        current_app.extensions['page_cache'].purge(*keys)
+
+
+@event.listens_for(db.Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    _pending.pop(session, None)
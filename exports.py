@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from models import db, Venue, Artist, Show
+
+
+# Streaming exports behind /<venues|artists|shows>.<jsonl|csv>. Rows are read as plain column tuples
+# from a server-side cursor in batches of BATCH_SIZE and written out one line at a time, so memory
+# use does not depend on the size of the table. `since` restricts venues and artists to records
+# created at or after that time, and shows to those starting at or after it.
+
+BATCH_SIZE = 1000
+
+VENUE_COLUMNS = (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone, Venue.genres,
+                 Venue.image_link, Venue.website_link, Venue.facebook_link, Venue.looking_for_talent,
+                 Venue.seeking_description, Venue.date_created, Venue.num_upcoming_shows, Venue.num_past_shows)
+ARTIST_COLUMNS = (Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone, Artist.genres,
+                  Artist.image_link, Artist.website_link, Artist.facebook_link, Artist.looking_for_venues,
+                  Artist.seeking_description, Artist.date_created, Artist.num_upcoming_shows,
+                  Artist.num_past_shows)
+SHOW_COLUMNS = (Show.id, Show.artist_id, Artist.name.label('artist_name'), Show.venue_id,
+                Venue.name.label('venue_name'), Show.show_time, Show.end_time)
+
+
+def export_query(kind, since=None):
+    if kind == 'shows':
+        query = (db.session.query(*SHOW_COLUMNS)
+                 .outerjoin(Artist, Artist.id == Show.artist_id)
+                 .outerjoin(Venue, Venue.id == Show.venue_id))
+        if since is not None:
+            query = query.filter(Show.show_time >= since)
+        return query.order_by(Show.id)
+    model, columns = (Venue, VENUE_COLUMNS) if kind == 'venues' else (Artist, ARTIST_COLUMNS)
+    query = db.session.query(*columns)
+    if since is not None:
+        query = query.filter(model.date_created >= since)
+    return query.order_by(model.id)
+
+
+def _rows(query):
+    return query.execution_options(stream_results=True).yield_per(BATCH_SIZE)
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_value(value):
+    # Same conventions as `flask import`: genres joined with ";", datetimes in ISO format.
+    if isinstance(value, list):
+        return ';'.join(value)
+    return _json_value(value)
+
+
+def stream_jsonl(query):
+    for row in _rows(query):
+        yield json.dumps({key: _json_value(value) for key, value in row._mapping.items()}) + '\n'
+
+
+def stream_csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column['name'] for column in query.column_descriptions])
+    for row in _rows(query):
+        writer.writerow([_csv_value(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
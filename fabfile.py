@@ -13,6 +13,11 @@ def test():
         abort("Aborted at user request.")
 
 
+def bench(scale='1k', output='bench.json'):
+    # e.g. `fab bench:scale=100k,output=after.json`, then `python -m benchmarks compare before.json after.json`
+    local("python -m benchmarks run --scale {} --output {}".format(scale, output))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
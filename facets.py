@@ -0,0 +1,123 @@
+import uuid
+
+from flask import current_app
+from sqlalchemy import String, cast, exists, func, literal, select, union_all
+from sqlalchemy.dialects import postgresql
+
+from models import db, Venue, Artist
+from pagination import keyset_paginate
+from readmodels import BY_NAME, LISTINGS
+
+
+# Faceted browse over artists and venues: filter by genres (a record must have all of them), states
+# and the seeking flag, and count how many of the matching records fall under every genre, state
+# and seeking value. The counts come from one statement: the filtered rows are read once into a
+# CTE and grouped three ways. On Postgres the genre filter is an array containment (@>) served by
+# the GIN indexes from the genre_indexes migration; SQLite stores genres as JSON and goes through
+# json_each() instead.
+#
+# Counts are cached in the object cache under a per-model version key ("facets:artists"). A commit
+# that touches an artist deletes that key (see cache.affected_keys), which orphans every cached
+# count for artists at once; the orphans age out of the cache.
+
+SEEKING = {Artist: Artist.looking_for_venues, Venue: Venue.looking_for_talent}
+VERSION_KEYS = {Artist: 'facets:artists', Venue: 'facets:venues'}
+
+
+class Filters:
+    # The query args read by from_args().
+    ARGS = ('genre', 'state', 'seeking')
+
+    def __init__(self, genres=(), states=(), seeking=False):
+        self.genres = tuple(sorted(set(genres)))
+        self.states = tuple(sorted(set(states)))
+        self.seeking = bool(seeking)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.getlist('genre'), args.getlist('state'), args.get('seeking') in ('1', 'y', 'true'))
+
+    def key(self):
+        return '%s|%s|%d' % (','.join(self.genres), ','.join(self.states), self.seeking)
+
+    def args(self, **changes):
+        # Query arguments for these filters with `changes` applied, for the facet links.
+        values = {'genre': list(self.genres), 'state': list(self.states), 'seeking': self.seeking}
+        values.update(changes)
+        args = {'genre': values['genre'], 'state': values['state']}
+        if values['seeking']:
+            args['seeking'] = '1'
+        return args
+
+    def toggle(self, name, value):
+        selected = getattr(self, name + 's')
+        values = [v for v in selected if v != value] if value in selected else list(selected) + [value]
+        return self.args(**{name: values})
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _genre_elements(column):
+    # A FROM item with one row per genre in `column`, exposing it as .c.value.
+    if _is_postgres():
+        return func.unnest(column).table_valued('value').render_derived(name='genre')
+    return func.json_each(column).table_valued('value')
+
+
+def conditions(model, filters):
+    clauses = []
+    if filters.genres:
+        if _is_postgres():
+            # Cast to the column's own type: varchar[] @> text[] does not resolve.
+            wanted = cast(postgresql.array(list(filters.genres)), postgresql.ARRAY(String(100)))
+            clauses.append(model.genres.op('@>')(wanted))
+        else:
+            for genre in filters.genres:
+                elements = _genre_elements(model.genres)
+                clauses.append(exists(select(literal(1)).select_from(elements).where(elements.c.value == genre)))
+    if filters.states:
+        clauses.append(model.state.in_(filters.states))
+    if filters.seeking:
+        clauses.append(SEEKING[model].is_(True))
+    return clauses
+
+
+def facet_counts(model, filters):
+    matching = (select(model.genres, model.state, SEEKING[model].label('seeking'))
+                .where(*conditions(model, filters)).cte('matching'))
+    count = func.count().label('count')
+    genres = _genre_elements(matching.c.genres)
+    statement = union_all(
+        select(literal('total').label('facet'), literal('').label('value'), count).select_from(matching),
+        select(literal('genre'), cast(genres.c.value, String), count).select_from(matching)
+        .join(genres, literal(True)).group_by(genres.c.value),
+        select(literal('state'), matching.c.state, count).group_by(matching.c.state),
+        select(literal('seeking'), cast(matching.c.seeking, String), count).group_by(matching.c.seeking),
+    )
+    counts = {'total': 0, 'genre': {}, 'state': {}, 'seeking': 0}
+    for facet, value, number in db.session.execute(statement):
+        if facet == 'total':
+            counts['total'] = number
+        elif facet == 'seeking':
+            if value in ('1', 'true'):
+                counts['seeking'] = number
+        elif value is not None:
+            counts[facet][value] = number
+    return counts
+
+
+def cached_facet_counts(model, filters):
+    cache = current_app.extensions['object_cache']
+    version = cache.get_or_load(VERSION_KEYS[model], lambda: uuid.uuid4().hex[:12])
+    return cache.get_or_load('%s:%s:%s' % (VERSION_KEYS[model], version, filters.key()),
+                             lambda: facet_counts(model, filters))
+
+
+def browse(model, filters, after=None, before=None, per_page=50):
+    # One page of matching listing rows by name, plus the facet counts for the whole match.
+    listing = LISTINGS[model]
+    query = listing.query().filter(*conditions(model, filters))
+    page = keyset_paginate(query, BY_NAME[model], after, before, per_page, factory=listing.make)
+    return page, cached_facet_counts(model, filters)
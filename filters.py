@@ -0,0 +1,39 @@
+import functools
+from datetime import datetime
+
+
+# Jinja filters. Babel and dateutil are imported on first use rather than at startup.
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@functools.lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+    # Parsed Babel pattern and Locale for each (format, locale) pair, resolved once per process.
+    import babel
+    import babel.dates
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_datetime(value, format, locale):
+    pattern, locale = datetime_pattern(format, locale)
+    if value.tzinfo is None:
+        import babel.dates
+        value = value.replace(tzinfo=babel.dates.UTC)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    # show_time comes straight from the database as a datetime; anything else is parsed first.
+    if not isinstance(value, datetime):
+        import dateutil.parser
+        value = dateutil.parser.parse(str(value))
+    return _format_datetime(value, format, locale)
+
+
+def init_filters(app):
+    app.jinja_env.filters['datetime'] = format_datetime
@@ -0,0 +1,394 @@
+import csv
+import heapq
+import math
+import os
+import re
+import time
+import weakref
+from collections import defaultdict, namedtuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, event, func
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm.attributes import get_history
+
+from models import db, Venue
+from readmodels import VENUE_LISTING
+
+
+# Venue locations and the "venues near me" search.
+#
+# Venues carry a latitude/longitude. They are not looked up on a geocoding service: the city and
+# state of a venue are matched against a bundled gazetteer (data/gazetteer.csv, the city centres of
+# the state capitals and larger US cities), so a location is as precise as the city. Venues written
+# through the ORM are located when they are created or move to another city; existing rows are
+# filled by `flask geo geocode` and imports take explicit latitude/longitude columns.
+#
+# A search returns the venues nearest to a point, within a radius or inside a bounding box, with
+# their distance and upcoming show count; a bounding box is searched from its centre. On Postgres
+# the location is indexed with GiST over the built-in point type (see the venue_location migration,
+# no PostGIS needed): the index hands out the nearest venues by planar distance in degrees, and the
+# farthest of those bounds a box query that is then ranked by great-circle distance. Other
+# databases, i.e. SQLite in tests, get an in-process geohash grid with the same results.
+
+EARTH_RADIUS_KM = 6371.0088
+GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.csv')
+
+NearbyVenue = namedtuple('NearbyVenue', 'id name city state num_upcoming_shows latitude longitude distance_km')
+
+
+class Box(namedtuple('Box', 'south west north east')):
+    def contains(self, latitude, longitude):
+        return self.south <= latitude <= self.north and self.west <= longitude <= self.east
+
+    @property
+    def center(self):
+        return (self.south + self.north) / 2, (self.west + self.east) / 2
+
+    def intersect(self, other):
+        # Empty (south > north or west > east) if they do not overlap.
+        return Box(max(self.south, other.south), max(self.west, other.west),
+                   min(self.north, other.north), min(self.east, other.east))
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great-circle distance in km.
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def around(latitude, longitude, radius_km):
+    # The smallest box holding the circle. Boxes stop at the poles and at the antimeridian.
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos = math.cos(math.radians(latitude))
+    dlon = 180.0 if cos <= 1e-9 else min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos)))
+    if latitude + dlat >= 90 or latitude - dlat <= -90:
+        dlon = 180.0
+    return Box(max(-90.0, latitude - dlat), max(-180.0, longitude - dlon),
+               min(90.0, latitude + dlat), min(180.0, longitude + dlon))
+
+
+def check_location(latitude, longitude):
+    # (latitude, longitude) as floats; ValueError for anything that is not a point on Earth.
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('latitude must be within [-90, 90] and longitude within [-180, 180]')
+    return latitude, longitude
+
+
+#  Gazetteer
+#  ----------------------------------------------------------------
+
+_ABBREVIATIONS = {'saint': 'st', 'sainte': 'ste', 'fort': 'ft', 'mount': 'mt'}
+
+
+def normalize_city(city):
+    # "St. Louis", "Saint Louis" and "st louis" are the same place.
+    words = re.findall(r'\w+', (city or '').lower())
+    return ' '.join(_ABBREVIATIONS.get(word, word) for word in words)
+
+
+class Gazetteer:
+    def __init__(self, path=GAZETTEER):
+        self.places = {}
+        with open(path, newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                self.places[(normalize_city(row['city']), row['state'].upper())] = \
+                    (float(row['latitude']), float(row['longitude']))
+
+    def lookup(self, city, state):
+        return self.places.get((normalize_city(city), (state or '').strip().upper()))
+
+
+_gazetteer = None
+
+
+def geocode(city, state):
+    # (latitude, longitude) of the city, or None if the gazetteer does not have it.
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer()
+    return _gazetteer.lookup(city, state)
+
+
+@event.listens_for(db.Session, 'before_flush')
+def _locate(session, flush_context, instances):
+    # New venues, and venues moved to another city, get the location of their city unless the
+    # same flush sets one.
+    for instance in list(session.new) + list(session.dirty):
+        if not isinstance(instance, Venue):
+            continue
+        if instance in session.new:
+            if instance.latitude is not None or instance.longitude is not None:
+                continue
+        elif not any(get_history(instance, name).has_changes() for name in ('city', 'state')) or \
+                any(get_history(instance, name).has_changes() for name in ('latitude', 'longitude')):
+            continue
+        instance.latitude, instance.longitude = geocode(instance.city, instance.state) or (None, None)
+
+
+#  Search
+#  ----------------------------------------------------------------
+
+def nearby(latitude, longitude, radius_km, limit=20, box=None):
+    # The `limit` venues nearest to the point, at most `radius_km` away and inside `box` if given,
+    # nearest first.
+    if db.engine.dialect.name == 'postgresql':
+        return _nearby_postgres(latitude, longitude, radius_km, limit, box)
+    return _grid().nearby(latitude, longitude, radius_km, limit, box)
+
+
+def in_box(box, limit=20):
+    # The `limit` venues inside the box nearest to its centre. No point of the box is farther from
+    # the centre than its farthest corner.
+    latitude, longitude = box.center
+    reach = max(haversine(latitude, longitude, lat, lon) for lat in (box.south, box.north)
+                for lon in (box.west, box.east))
+    return nearby(latitude, longitude, reach + 1e-6, limit, box)
+
+
+def _rows(ranked):
+    # NearbyVenue rows for (distance, id) pairs, in that order.
+    if not ranked:
+        return []
+    query = VENUE_LISTING.query().add_columns(Venue.latitude, Venue.longitude)
+    rows = {row.id: row for row in query.filter(Venue.id.in_([id for _, id in ranked]))}
+    return [NearbyVenue(*rows[id], round(distance, 3)) for distance, id in ranked if id in rows]
+
+
+#  Postgres
+#  ----------------------------------------------------------------
+
+def _location():
+    # Must stay identical to the indexed expression in migrations/versions/*_venue_location.py.
+    return func.point(Venue.longitude, Venue.latitude)
+
+
+def _distance_sql(latitude, longitude):
+    lat, lon = func.radians(Venue.latitude), func.radians(Venue.longitude)
+    lat0, lon0 = math.radians(latitude), math.radians(longitude)
+    a = func.power(func.sin((lat - lat0) / 2), 2) + \
+        math.cos(lat0) * func.cos(lat) * func.power(func.sin((lon - lon0) / 2), 2)
+    return 2 * EARTH_RADIUS_KM * func.asin(func.least(1.0, func.sqrt(a)))
+
+
+def _inside(box):
+    return _location().op('<@')(func.box(func.point(box.west, box.south), func.point(box.east, box.north)))
+
+
+def _nearby_postgres(latitude, longitude, radius_km, limit, box):
+    # Planar distance in degrees overrates east-west distances, so the `limit` nearest venues by
+    # that measure need not be the nearest ones; but the truly nearest are no farther away than the
+    # farthest of them, which makes a small box to rank exactly.
+    nearest = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.latitude.isnot(None))
+    if box is not None:
+        nearest = nearest.filter(_inside(box))
+    nearest = nearest.order_by(_location().op('<->')(func.point(longitude, latitude))).limit(limit).all()
+    if len(nearest) == limit:
+        radius_km = min(radius_km, max(haversine(latitude, longitude, *point) for point in nearest))
+    area = around(latitude, longitude, radius_km)
+    if box is not None:
+        area = area.intersect(box)
+    distance = _distance_sql(latitude, longitude).label('distance_km')
+    query = VENUE_LISTING.query().add_columns(Venue.latitude, Venue.longitude, distance) \
+        .filter(_inside(area), distance <= radius_km + 1e-9)
+    return [NearbyVenue(*row[:-1], round(row.distance_km, 3))
+            for row in query.order_by(distance, Venue.id).limit(limit)]
+
+
+#  In-process geohash grid
+#  ----------------------------------------------------------------
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(latitude, longitude, precision):
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            middle = (west + east) / 2
+            value = value * 2 + (longitude >= middle)
+            west, east = (middle, east) if longitude >= middle else (west, middle)
+        else:
+            middle = (south + north) / 2
+            value = value * 2 + (latitude >= middle)
+            south, north = (middle, north) if latitude >= middle else (south, middle)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (height, width) of a geohash cell in degrees.
+    lon_bits = (5 * precision + 1) // 2
+    return 180.0 / 2 ** (5 * precision - lon_bits), 360.0 / 2 ** lon_bits
+
+
+def covering(box, precision):
+    # The geohashes of the cells overlapping the box.
+    height, width = cell_size(precision)
+    rows = range(int((box.south + 90) // height), int((min(box.north, 89.999999) + 90) // height) + 1)
+    columns = range(int((box.west + 180) // width), int((min(box.east, 179.999999) + 180) // width) + 1)
+    return [geohash(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+            for row in rows for column in columns]
+
+
+class GeoGrid:
+    # Venue locations bucketed by geohash at a few precisions, so a box is covered by a handful of
+    # cells whatever its size: 3 characters (~156 km cells), 4 (~39 x 20 km) and 5 (~5 km).
+    PRECISIONS = (5, 4, 3)
+    MAX_CELLS = 64
+    # First reach of a nearest venues search, growing fourfold until enough venues are in reach.
+    INITIAL_REACH_KM = 2.0
+
+    def __init__(self):
+        self.cells = {precision: defaultdict(dict) for precision in self.PRECISIONS}  # geohash -> {id: point}
+        self.hashes = {}  # id -> finest geohash, so a venue can be removed again
+
+    def load(self, session):
+        for id, latitude, longitude in session.query(Venue.id, Venue.latitude, Venue.longitude) \
+                .filter(Venue.latitude.isnot(None), Venue.longitude.isnot(None)):
+            self.add(id, latitude, longitude)
+        return self
+
+    def add(self, id, latitude, longitude):
+        self.remove(id)
+        if latitude is None or longitude is None:
+            return
+        hash = geohash(latitude, longitude, max(self.PRECISIONS))
+        for precision, cells in self.cells.items():
+            cells[hash[:precision]][id] = (latitude, longitude)
+        self.hashes[id] = hash
+
+    def remove(self, id):
+        hash = self.hashes.pop(id, None)
+        if hash is None:
+            return
+        for precision, cells in self.cells.items():
+            cell = cells[hash[:precision]]
+            cell.pop(id, None)
+            if not cell:
+                del cells[hash[:precision]]
+
+    def within(self, box):
+        # (id, latitude, longitude) of the venues inside the box, from the finest cells that cover
+        # it in at most MAX_CELLS cells.
+        for precision in self.PRECISIONS:
+            hashes = covering(box, precision)
+            if len(hashes) <= self.MAX_CELLS or precision == self.PRECISIONS[-1]:
+                break
+        cells = self.cells[precision]
+        for hash in hashes:
+            for id, (latitude, longitude) in cells.get(hash, {}).items():
+                if box.contains(latitude, longitude):
+                    yield id, latitude, longitude
+
+    def nearby(self, latitude, longitude, radius_km, limit, box=None):
+        # Once `limit` venues are within reach, the nearest of them are the nearest overall.
+        reach = min(self.INITIAL_REACH_KM, radius_km)
+        while True:
+            area = around(latitude, longitude, reach)
+            if box is not None:
+                area = area.intersect(box)
+            found = []
+            for id, lat, lon in self.within(area):
+                distance = haversine(latitude, longitude, lat, lon)
+                if distance <= reach:
+                    found.append((distance, id))
+            if len(found) >= limit or reach >= radius_km:
+                return _rows(heapq.nsmallest(limit, found))
+            reach = min(reach * 4, radius_km)
+
+
+# One grid per engine, built on first use and then kept current from committed sessions, so only
+# writes made through this process are seen.
+_grids = weakref.WeakKeyDictionary()
+_pending = weakref.WeakKeyDictionary()
+
+
+def _grid():
+    engine = db.engine
+    if engine not in _grids:
+        _grids[engine] = GeoGrid().load(db.session)
+    return _grids[engine]
+
+
+@event.listens_for(db.Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = _pending.setdefault(session, [])
+    for instance in list(session.new) + list(session.dirty):
+        if isinstance(instance, Venue):
+            changes.append((instance.id, instance.latitude, instance.longitude))
+    for instance in session.deleted:
+        if isinstance(instance, Venue):
+            changes.append((instance.id, None, None))
+
+
+def locate_on_commit(session, ids, rows):
+    # For writes the listener above cannot see, such as Core inserts of venues.
+    if isinstance(session, scoped_session):
+        session = session()
+    _pending.setdefault(session, []).extend(
+        (id, row.get('latitude'), row.get('longitude')) for id, row in zip(ids, rows))
+
+
+@event.listens_for(db.Session, 'after_commit')
+def _apply_changes(session):
+    changes = _pending.pop(session, ())
+    grid = _grids.get(session.get_bind()) if changes else None
+    if grid is None:
+        return
+    for id, latitude, longitude in changes:
+        grid.add(id, latitude, longitude)
+
+
+@event.listens_for(db.Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    _pending.pop(session, None)
+
+
+#  Batch geocoding
+#  ----------------------------------------------------------------
+
+geo_cli = AppGroup('geo', help='Venue locations.')
+
+
+@geo_cli.command('geocode')
+@click.option('--all', 'everything', is_flag=True, help='Locate every venue again, not just those without a location.')
+@click.option('--batch-size', default=1000, show_default=True, help='Venues updated per transaction.')
+def geocode_command(everything, batch_size):
+    """Locate venues by city and state from the bundled gazetteer."""
+    started = time.perf_counter()
+    query = db.session.query(Venue.id, Venue.city, Venue.state).order_by(Venue.id)
+    if not everything:
+        query = query.filter(Venue.latitude.is_(None))
+    update = Venue.__table__.update().where(Venue.id == bindparam('venue_id')) \
+        .values(latitude=bindparam('latitude'), longitude=bindparam('longitude'))
+    located, unknown, after = 0, defaultdict(int), 0
+    while True:
+        # Paged by id, so rows updated in earlier batches (no longer matching) do not shift the pages.
+        batch = query.filter(Venue.id > after).limit(batch_size).all()
+        if not batch:
+            break
+        after = batch[-1].id
+        rows = []
+        for id, city, state in batch:
+            location = geocode(city, state)
+            if location is None:
+                unknown[(city, state)] += 1
+            else:
+                rows.append({'venue_id': id, 'latitude': location[0], 'longitude': location[1]})
+        if rows:
+            db.session.execute(update, rows)
+        db.session.commit()
+        located += len(rows)
+    click.echo(f'{located} venues located in {time.perf_counter() - started:.1f}s, '
+               f'{sum(unknown.values())} in cities not in the gazetteer')
+    for (city, state), count in sorted(unknown.items(), key=lambda item: -item[1])[:20]:
+        click.echo(f'  {count:6d}  {city}, {state}')
@@ -0,0 +1,347 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import abort, current_app, has_request_context, redirect, request, send_from_directory, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # optional: without Pillow the original images are cached and served as they are
+    Image = None
+
+
+# Image proxy for the venue and artist pictures. Templates pass image links through the `thumbnail`
+# filter, which turns them into /images/<size>/<token> URLs; the token is the original URL signed
+# with IMAGE_PROXY_SECRET, so the proxy only ever fetches links this app rendered. The secret has to
+# be the same in every worker and survive restarts (links end up in browser and CDN caches), so the
+# proxy stays off and the filter returns the original links when it is not set.
+#
+# The first request for an image fetches it from its origin, scales it down to fit IMAGE_SIZES[size]
+# and stores it as WebP (for browsers that accept it) or JPEG under the sha256 of its bytes, served
+# from then on with a one year, immutable Cache-Control. Variants live in IMAGE_CACHE_DIR:
+#
+#   variants/<sha256>.<ext>              the encoded images, shared by links that yield the same bytes
+#   links/<sha256(url)>-<size>-<format>  symlinks to the variant of one link, size and format
+#
+# The directory is kept under IMAGE_CACHE_MAX_BYTES by deleting the least recently served variants
+# (a hit refreshes the file's mtime) together with the links pointing at them.
+#
+# Fetching and resizing run on a pool of IMAGE_FETCH_WORKERS threads per worker process. Rendering
+# a page only queues the missing images of that page, so they are usually ready by the time the
+# browser asks; an image request waits at most IMAGE_FETCH_WAIT seconds for its image and is
+# otherwise redirected to the original, as is one whose origin failed in the last IMAGE_FAILURE_TTL
+# seconds. Origins on private or loopback addresses are refused unless IMAGE_FETCH_PRIVATE is set
+# (e.g. for a local stand-in origin, see benchmarks/bench_images.py).
+
+FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+# Formats of sources that are served as they are when Pillow is not installed.
+PASSTHROUGH = {'image/jpeg': 'jpeg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+MIMETYPES = dict(FORMATS, png='image/png', gif='image/gif')
+
+TOKEN_SALT = 'image-proxy'
+MAX_AGE = 365 * 24 * 3600
+# A hit refreshes the variant's mtime for the LRU at most this often.
+TOUCH_INTERVAL = 60
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class FetchError(Exception):
+    pass
+
+
+def _resolve(url, allow_private):
+    # The (host, port, address) to fetch `url` from. Every address the host resolves to is checked,
+    # and the connection is then made to the first one: resolving again on connect would let a host
+    # answer with a public address here and a private one there.
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise FetchError('unsupported URL %r' % url)
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        addresses = [info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)]
+    except (OSError, ValueError) as error:
+        raise FetchError('%s: %s' % (parts.hostname, error)) from None
+    if not allow_private:
+        for address in addresses:
+            ip = ipaddress.ip_address(address)
+            if ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast:
+                raise FetchError('%s resolves to a private address' % parts.hostname)
+    return parts.hostname, port, addresses[0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    # Connects to an already resolved address; the Host header still names the host.
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    # As above; the certificate is verified against the host name.
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout, context=ssl.create_default_context())
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def fetch(url, timeout=10, max_bytes=10 * 1024 * 1024, allow_private=False):
+    # Returns (bytes, mimetype) of the image at `url`. Redirects are followed only to hosts that pass
+    # the same check as the original URL.
+    for _ in range(MAX_REDIRECTS + 1):
+        host, port, address = _resolve(url, allow_private)
+        parts = urllib.parse.urlsplit(url)
+        connection_class = _PinnedHTTPSConnection if parts.scheme == 'https' else _PinnedHTTPConnection
+        connection = connection_class(host, port, address, timeout)
+        try:
+            connection.request('GET', urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, '')),
+                               headers={'User-Agent': 'fyyur-images'})
+            response = connection.getresponse()
+            location = response.getheader('Location')
+            if response.status in REDIRECTS and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if response.status != 200:
+                raise FetchError('%s: HTTP %d' % (url, response.status))
+            data = response.read(max_bytes + 1)
+            mimetype = response.msg.get_content_type()
+        except (OSError, ValueError, http.client.HTTPException) as error:
+            raise FetchError('%s: %s' % (url, error)) from None
+        finally:
+            connection.close()
+        if len(data) > max_bytes:
+            raise FetchError('%s is larger than %d bytes' % (url, max_bytes))
+        return data, mimetype
+    raise FetchError('%s: more than %d redirects' % (url, MAX_REDIRECTS))
+
+
+def encode(data, mimetype, box, format):
+    # The image scaled down to fit `box`, as (bytes, format). Without Pillow, supported sources are
+    # returned unchanged.
+    if Image is None:
+        if mimetype not in PASSTHROUGH:
+            raise FetchError('not an image: %s' % mimetype)
+        return data, PASSTHROUGH[mimetype]
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format == 'JPEG':
+            # Decode at the smallest scale that is still at least as large as the box.
+            image.draft('RGB', box)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(box, Image.LANCZOS)
+        output = io.BytesIO()
+        if format == 'webp':
+            image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB').save(
+                output, 'WEBP', quality=80, method=4)
+        else:
+            image.convert('RGB').save(output, 'JPEG', quality=82, optimize=True, progressive=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise FetchError('cannot decode image: %s' % error) from None
+    return output.getvalue(), format
+
+
+class ImageCache:
+    # Content-addressed variants on disk, bounded to `max_bytes`; see the top of the module.
+    def __init__(self, directory, max_bytes):
+        self.variants = os.path.join(directory, 'variants')
+        self.links = os.path.join(directory, 'links')
+        os.makedirs(self.variants, exist_ok=True)
+        os.makedirs(self.links, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.size = sum(stat.st_size for stat, _ in self._variants())
+
+    def _variants(self):
+        # (stat, path) of every variant; files still being written start with a dot.
+        return [(entry.stat(), entry.path) for entry in os.scandir(self.variants)
+                if entry.is_file() and not entry.name.startswith('.')]
+
+    @staticmethod
+    def key(url, size, format):
+        # The link of an image link, size and requested format. Without Pillow it may point at a
+        # variant in the source's own format.
+        return '%s-%s-%s' % (hashlib.sha256(url.encode()).hexdigest(), size, format)
+
+    def get(self, key):
+        # The variant file name of `key`, or None.
+        link = os.path.join(self.links, key)
+        try:
+            name = os.readlink(link)
+            stat = os.stat(link)
+        except OSError:
+            return None
+        if time.time() - stat.st_mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(link)
+            except OSError:
+                pass
+        return os.path.basename(name)
+
+    def put(self, key, data, format):
+        name = '%s.%s' % (hashlib.sha256(data).hexdigest(), format)
+        path = os.path.join(self.variants, name)
+        if not os.path.exists(path):
+            with tempfile.NamedTemporaryFile(dir=self.variants, prefix='.', delete=False) as file:
+                file.write(data)
+            os.replace(file.name, path)
+            with self._lock:
+                self.size += len(data)
+        link = os.path.join(self.links, key)
+        temporary = '%s.%d.%d' % (link, os.getpid(), threading.get_ident())
+        os.symlink(os.path.join('..', 'variants', name), temporary)
+        os.replace(temporary, link)
+        if self.size > self.max_bytes:
+            self.prune()
+        return name
+
+    def prune(self):
+        # Deletes the least recently served variants until the cache is back at 90% of its bound,
+        # then the links left dangling.
+        with self._lock:
+            entries = sorted(self._variants(), key=lambda item: item[0].st_mtime)
+            size = sum(stat.st_size for stat, _ in entries)
+            for stat, path in entries:
+                if size <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                size -= stat.st_size
+            self.size = size
+            for entry in os.scandir(self.links):
+                if not os.path.exists(entry.path):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+
+class ImageProxy:
+    def __init__(self, app):
+        config = app.config
+        self.cache = ImageCache(config['IMAGE_CACHE_DIR'], config['IMAGE_CACHE_MAX_BYTES'])
+        self.sizes = config['IMAGE_SIZES']
+        self.workers = config['IMAGE_FETCH_WORKERS']
+        self.wait = config['IMAGE_FETCH_WAIT']
+        self.failure_ttl = config['IMAGE_FAILURE_TTL']
+        self.fetch_options = {'timeout': config['IMAGE_FETCH_TIMEOUT'], 'max_bytes': config['IMAGE_MAX_SOURCE_BYTES'],
+                              'allow_private': config['IMAGE_FETCH_PRIVATE']}
+        self.signer = URLSafeSerializer(config['IMAGE_PROXY_SECRET'], salt=TOKEN_SALT)
+        self.webp = Image is not None and features.check('webp')
+        self.logger = app.logger
+        self._pending = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _executor(self):
+        # Created on first use in each process: threads do not survive the fork of a preloading server.
+        if self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='images')
+            self._pid = os.getpid()
+            self._pending.clear()
+        return self._pool
+
+    def _load(self, key, url, size, format):
+        try:
+            data, mimetype = fetch(url, **self.fetch_options)
+            return self.cache.put(key, *encode(data, mimetype, self.sizes[size], format))
+        except (FetchError, OSError) as error:
+            self.logger.info('image proxy: %s', error)
+            now = time.monotonic()
+            with self._lock:
+                if len(self._failed) > 1024:
+                    self._failed = {key: until for key, until in self._failed.items() if until > now}
+                self._failed[key] = now + self.failure_ttl
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def load(self, url, size, format):
+        # Returns (variant name or None, future or None): the cached variant, or the fetch of it.
+        key = self.cache.key(url, size, format)
+        name = self.cache.get(key)
+        if name is not None:
+            return name, None
+        with self._lock:
+            if self._failed.get(key, 0) > time.monotonic():
+                return None, None
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = self._executor().submit(self._load, key, url, size, format)
+        return None, future
+
+    def format_for(self, accept_mimetypes):
+        # WebP only for clients that name it: browsers without it still send image/* or */*.
+        return 'webp' if self.webp and 'image/webp' in accept_mimetypes.values() else 'jpeg'
+
+
+def thumbnail(url, size='tile'):
+    # Jinja filter: the proxied URL of an image link. Queues the image for this client's format if it
+    # is not cached yet.
+    if not url:
+        return ''
+    proxy = current_app.extensions.get('images')
+    if proxy is None:
+        return url
+    if has_request_context():
+        proxy.load(url, size, proxy.format_for(request.accept_mimetypes))
+    return url_for('images', size=size, token=proxy.signer.dumps(url))
+
+
+def image_view(size, token):
+    proxy = current_app.extensions['images']
+    if size not in proxy.sizes:
+        abort(404)
+    try:
+        url = proxy.signer.loads(token)
+    except BadSignature:
+        abort(404)
+    name, future = proxy.load(url, size, proxy.format_for(request.accept_mimetypes))
+    if future is not None:
+        try:
+            name = future.result(timeout=proxy.wait)
+        except TimeoutError:
+            name = None
+    if name is None:
+        response = redirect(url, 307)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    response = send_from_directory(proxy.cache.variants, name, mimetype=MIMETYPES[name.rsplit('.', 1)[1]],
+                                   etag=name.split('.')[0], max_age=MAX_AGE)
+    response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % MAX_AGE
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+def init_images(app):
+    enabled = app.config.get('IMAGE_PROXY_ENABLED')
+    if enabled and not app.config.get('IMAGE_PROXY_SECRET'):
+        app.logger.warning('image proxy: IMAGE_PROXY_SECRET is not set, serving the original images')
+        enabled = False
+    if not enabled:
+        app.add_template_filter(lambda url, size='tile': url or '', 'thumbnail')
+        return None
+    proxy = app.extensions['images'] = ImageProxy(app)
+    app.add_template_filter(thumbnail, 'thumbnail')
+    app.add_url_rule('/images/<size>/<token>', 'images', image_view)
+    return proxy
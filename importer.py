@@ -0,0 +1,376 @@
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+
+from forms import VenueForm, ArtistForm, ShowForm
+from geo import check_location, geocode
+from models import db, Venue, Artist, Show, refresh_show_counters, DEFAULT_SHOW_DURATION
+from scheduling import find_conflicts
+
+
+# Bulk import of venues, artists and shows from CSV or JSON Lines files, e.g.
+#
+#   flask import venues venues.csv
+#   flask import shows shows.jsonl --batch-size 10000 --errors rejected.jsonl
+#
+# Files are read one row at a time and written in chunks of --batch-size rows, each chunk in its
+# own transaction (COPY on Postgres, executemany elsewhere). Every row is validated with the same
+# form the web UI uses; rows that fail validation, reference an unknown artist/venue, clash with
+# an existing name or double-book a venue or artist are reported and skipped without stopping the
+# import, as are lines that cannot be read as a row at all (malformed JSON, a JSON value that is not
+# an object, bytes that are not UTF-8). In CSV files, genres are separated by ";". Shows may
+# reference artists and venues either by id (artist_id, venue_id) or by unique name (artist, venue).
+# Venues may carry latitude and longitude; without them they are placed at their city's centre from
+# the gazetteer (see geo.py).
+
+import_cli = AppGroup('import', help='Bulk import venues, artists and shows from CSV/JSONL files.')
+
+
+NOT_UTF8 = {'row': ['The line is not valid UTF-8.']}
+
+
+def _undecodable(text):
+    # Bytes that are not UTF-8 are read as lone surrogates (see read_rows()), which cannot be encoded.
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def read_rows(path, on_error):
+    # Yields (line number, row dict) without reading the whole file. Lines that are not a row are
+    # passed to on_error(line number, {'row': [message]}) and skipped. Undecodable bytes are kept as
+    # surrogates so that they fail their own line rather than the rest of the file.
+    with open(path, newline='', encoding='utf-8', errors='surrogateescape') as file:
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                if _undecodable(line):
+                    on_error(number, NOT_UTF8)
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as error:
+                    on_error(number, {'row': ['Not valid JSON: %s.' % error.msg]})
+                    continue
+                if not isinstance(row, dict):
+                    on_error(number, {'row': ['Each line must be a JSON object.']})
+                    continue
+                yield number, row
+        else:
+            reader = csv.DictReader(file)
+            number = 1
+            while True:
+                number += 1
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    break
+                except csv.Error as error:
+                    on_error(number, {'row': [str(error)]})
+                    continue
+                if any(_undecodable(str(value)) for value in row.values()):
+                    on_error(number, NOT_UTF8)
+                    continue
+                if row.get('genres'):
+                    row['genres'] = [genre.strip() for genre in row['genres'].split(';') if genre.strip()]
+                yield number, row
+
+
+def _formdata(row):
+    data = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                data.add(key, str(item))
+        elif isinstance(value, bool):
+            if value:
+                data.add(key, 'y')
+        elif value is not None and value != '':
+            data.add(key, str(value))
+    return data
+
+
+def _blank_to_none(value):
+    return value if value != '' else None
+
+
+class RowError(Exception):
+    pass
+
+
+def _location(row, city, state):
+    latitude, longitude = _blank_to_none(row.get('latitude')), _blank_to_none(row.get('longitude'))
+    if latitude is None and longitude is None:
+        return geocode(city, state) or (None, None)
+    try:
+        return check_location(latitude, longitude)
+    except (TypeError, ValueError):
+        raise RowError({'latitude': ['Latitude and longitude must both be given, within [-90, 90] '
+                                     'and [-180, 180].']})
+
+
+#  Row handlers
+#  ----------------------------------------------------------------
+# Each kind validates a row into the column values to insert and checks a whole chunk against the
+# database in one query (unique names, referenced ids).
+
+class VenueRows:
+    model = Venue
+    form_class = VenueForm
+
+    def values(self, form, row):
+        latitude, longitude = _location(row, form.city.data, form.state.data)
+        return {'name': form.name.data, 'city': form.city.data, 'state': form.state.data,
+                'latitude': latitude, 'longitude': longitude,
+                'address': form.address.data, 'phone': _blank_to_none(form.phone.data),
+                'genres': form.genres.data, 'image_link': _blank_to_none(form.image_link.data),
+                'website_link': _blank_to_none(form.website_link.data),
+                'facebook_link': _blank_to_none(form.facebook_link.data),
+                'looking_for_talent': form.seeking_talent.data,
+                'seeking_description': _blank_to_none(form.seeking_description.data),
+                'date_created': datetime.utcnow()}
+
+    def check_chunk(self, session, chunk):
+        names = [values['name'] for _, values in chunk]
+        taken = {name for name, in session.query(self.model.name).filter(self.model.name.in_(names))}
+        accepted, errors = [], []
+        for number, values in chunk:
+            if values['name'] in taken:
+                errors.append((number, {'name': ['A record with this name already exists.']}))
+            else:
+                taken.add(values['name'])
+                accepted.append((number, values))
+        return accepted, errors
+
+
+class ArtistRows(VenueRows):
+    model = Artist
+    form_class = ArtistForm
+
+    def values(self, form, row):
+        return {'name': form.name.data, 'city': form.city.data, 'state': form.state.data,
+                'phone': _blank_to_none(form.phone.data), 'genres': form.genres.data,
+                'image_link': _blank_to_none(form.image_link.data),
+                'website_link': _blank_to_none(form.website_link.data),
+                'facebook_link': _blank_to_none(form.facebook_link.data),
+                'looking_for_venues': form.seeking_venue.data,
+                'seeking_description': _blank_to_none(form.seeking_description.data),
+                'date_created': datetime.utcnow()}
+
+
+class ShowRows:
+    model = Show
+    form_class = ShowForm
+
+    def values(self, form, row):
+        duration = timedelta(minutes=form.duration.data) if form.duration.data else DEFAULT_SHOW_DURATION
+        values = {'show_time': form.start_time.data, 'end_time': form.start_time.data + duration}
+        for field in ('artist', 'venue'):
+            id, name = row.get(field + '_id'), row.get(field)
+            if id not in (None, ''):
+                try:
+                    values[field + '_id'] = int(id)
+                except (TypeError, ValueError):
+                    raise RowError({field + '_id': ['Not a valid id.']})
+            elif name:
+                values[field] = name
+            else:
+                raise RowError({field + '_id': ['Either %s_id or %s is required.' % (field, field)]})
+        return values
+
+    def check_chunk(self, session, chunk):
+        # One IN query per referenced table resolves every id and name used by the chunk.
+        resolved = {}
+        for field, model in (('artist', Artist), ('venue', Venue)):
+            ids = {values[field + '_id'] for _, values in chunk if field + '_id' in values}
+            names = {values[field] for _, values in chunk if field in values}
+            rows = session.query(model.id, model.name).filter(model.id.in_(ids) | model.name.in_(names))
+            resolved[field] = {'ids': set(), 'names': {}}
+            for id, name in rows:
+                resolved[field]['ids'].add(id)
+                resolved[field]['names'][name] = id
+
+        accepted, errors = [], []
+        for number, values in chunk:
+            problems = {}
+            for field in ('artist', 'venue'):
+                if field in values:
+                    id = resolved[field]['names'].get(values.pop(field))
+                    if id is None:
+                        problems[field] = ['No %s with this name.' % field]
+                    values[field + '_id'] = id
+                elif values[field + '_id'] not in resolved[field]['ids']:
+                    problems[field + '_id'] = ['No %s with this id.' % field]
+            if problems:
+                errors.append((number, problems))
+            else:
+                accepted.append((number, values))
+
+        # Shows already in the table (earlier chunks included) and the rest of this chunk.
+        conflicts = dict(find_conflicts(session, accepted))
+        errors.extend((number, problems) for number, problems in conflicts.items())
+        return [(number, values) for number, values in accepted if number not in conflicts], errors
+
+
+KINDS = {'venues': VenueRows, 'artists': ArtistRows, 'shows': ShowRows}
+
+
+#  Writing
+#  ----------------------------------------------------------------
+
+def _copy_value(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, list):
+        # Postgres array literal, every element quoted.
+        return '{%s}' % ','.join('"%s"' % item.replace('\\', '\\\\').replace('"', '\\"') for item in value)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return value
+
+
+def _copy(connection, table, rows):
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    # NULL is spelled \N so that empty strings survive as empty strings.
+    cursor.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')" % (table.name, ', '.join(columns)),
+                       buffer)
+
+
+def write_chunk(session, table, rows):
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        _copy(connection, table, rows)
+    else:
+        connection.execute(table.insert(), rows)
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return (self.inserted + self.rejected) / self.seconds if self.seconds else 0.0
+
+
+def validate_rows(handler, form, session, batch):
+    # Validates (number, row dict) pairs into (accepted [(number, values)], errors [(number, problems)]),
+    # with the form first and then against the database, one chunk check for the whole batch.
+    chunk, errors = [], []
+    for number, row in batch:
+        form.process(formdata=_formdata(row))
+        if not form.validate():
+            errors.append((number, form.errors))
+            continue
+        try:
+            chunk.append((number, handler.values(form, row)))
+        except RowError as error:
+            errors.append((number, error.args[0]))
+    accepted, problems = handler.check_chunk(session, chunk) if chunk else ([], [])
+    return accepted, sorted(errors + problems, key=lambda error: error[0])
+
+
+def import_file(kind, path, batch_size=5000, on_error=None):
+    # Streams `path` into the table for `kind` ('venues', 'artists' or 'shows'). `on_error` is called
+    # with (line number, {field: [messages]}) for every rejected row.
+    handler = KINDS[kind]()
+    form = handler.form_class(formdata=None, meta={'csrf': False})
+    table = handler.model.__table__
+    session = db.session
+    result = ImportResult()
+    start = time.perf_counter()
+
+    def reject(number, errors):
+        result.rejected += 1
+        if on_error is not None:
+            on_error(number, errors)
+
+    rows = read_rows(path, reject)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        accepted, errors = validate_rows(handler, form, session, batch)
+        for number, problems in errors:
+            reject(number, problems)
+        if accepted:
+            try:
+                write_chunk(session, table, [values for _, values in accepted])
+                session.commit()
+                result.inserted += len(accepted)
+            except DBAPIError:
+                # Something the pre-checks missed (e.g. a concurrent insert): retry the chunk row by
+                # row so only the offending rows are rejected.
+                session.rollback()
+                for number, values in accepted:
+                    try:
+                        session.execute(table.insert(), [values])
+                        session.commit()
+                        result.inserted += 1
+                    except DBAPIError as error:
+                        session.rollback()
+                        reject(number, {'database': [str(error.orig)]})
+
+    if kind == 'shows':
+        # Bulk inserts bypass the ORM events that maintain the show counters.
+        refresh_show_counters(session)
+        session.commit()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def _make_command(kind):
+    @import_cli.command(kind, help=f'Import {kind} from a CSV or JSONL file.')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--batch-size', default=5000, show_default=True, help='Rows written per transaction.')
+    @click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+                  help='Write rejected rows to this JSONL file instead of stderr.')
+    def command(path, batch_size, errors_path):
+        errors_file = open(errors_path, 'w') if errors_path else None
+
+        def on_error(number, problems):
+            if errors_file:
+                errors_file.write(json.dumps({'line': number, 'errors': problems}) + '\n')
+            else:
+                click.echo(f'line {number}: {json.dumps(problems)}', err=True)
+
+        try:
+            result = import_file(kind, path, batch_size=batch_size, on_error=on_error)
+        finally:
+            if errors_file:
+                errors_file.close()
+        # The session listeners do not see bulk inserts.
+        for name in ('object_cache', 'page_cache'):
+            if name in current_app.extensions:
+                current_app.extensions[name].clear()
+        click.echo(f'{kind}: {result.inserted} imported, {result.rejected} rejected in {result.seconds:.1f}s '
+                   f'({result.rows_per_second:.0f} rows/s)')
+        if result.rejected:
+            sys.exit(1)
+
+    return command
+
+
+for _kind in KINDS:
+    _make_command(_kind)
@@ -0,0 +1,211 @@
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, abort, g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Per-request timing: every request records its query count, database time, template render time and
+# total time. These are sent back in a Server-Timing header (visible in the browser's network panel)
+# and added to per-endpoint histograms served in the Prometheus text format at /metrics, to scrapers
+# that send METRICS_TOKEN as a bearer token (without one, /metrics is not served). Requests slower
+# than SLOW_REQUEST_MS are written to the slow request log together with their SQL; the log has the
+# path and the names of the query args, not their values, which may be search terms or tokens.
+#
+# Streamed responses (listing pages, exports) generate their body after the response has been handed
+# over: their queries and template time keep counting while it is sent, and they are recorded once it
+# has been sent in full. Their Server-Timing header would have to go out before any of that work, so
+# they do not get one.
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+slow_log = logging.getLogger('fyyur.slow_requests')
+
+
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.statements = []  # (seconds, SQL) of every query, for the slow request log
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+
+def _current():
+    return g.get('request_stats') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current()
+    if stats is None or not conn.info.get('query_start'):
+        return
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    stats.queries += 1
+    stats.db += elapsed
+    stats.statements.append((elapsed, statement))
+
+
+class TimedTemplate(Template):
+    # Jinja template class that adds its render time to the current request.
+    def render(self, *args, **kwargs):
+        stats = _current()
+        if stats is None:
+            return super().render(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats.templates += time.perf_counter() - start
+
+    def generate(self, *args, **kwargs):
+        # Streamed renders: adds the time spent producing each chunk.
+        chunks = super().generate(*args, **kwargs)
+        stats = _current()
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                if stats is not None:
+                    stats.templates += time.perf_counter() - start
+            yield chunk
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def lines(self, name, labels):
+        for bound, count in zip(BUCKETS, self.counts):
+            yield '%s_bucket{%s,le="%s"} %d' % (name, labels, bound, count)
+        yield '%s_bucket{%s,le="+Inf"} %d' % (name, labels, self.count)
+        yield '%s_sum{%s} %.6f' % (name, labels, self.sum)
+        yield '%s_count{%s} %d' % (name, labels, self.count)
+
+
+class Metrics:
+    # Per-process registry. With several workers each one reports its own numbers; Prometheus adds
+    # them up when the workers are scraped as separate targets.
+    HISTOGRAMS = (
+        ('fyyur_request_duration_seconds', 'Total time spent handling the request.'),
+        ('fyyur_request_db_seconds', 'Time spent in database queries per request.'),
+        ('fyyur_request_template_seconds', 'Time spent rendering templates per request.'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {name: defaultdict(Histogram) for name, _ in self.HISTOGRAMS}
+        self.queries = defaultdict(int)
+        self.requests = defaultdict(int)
+
+    def observe(self, endpoint, method, status, stats, total):
+        with self._lock:
+            self.histograms['fyyur_request_duration_seconds'][endpoint].observe(total)
+            self.histograms['fyyur_request_db_seconds'][endpoint].observe(stats.db)
+            self.histograms['fyyur_request_template_seconds'][endpoint].observe(stats.templates)
+            self.queries[endpoint] += stats.queries
+            self.requests[(endpoint, method, status)] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += ['# HELP fyyur_requests_total Requests handled.', '# TYPE fyyur_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append('fyyur_requests_total{endpoint="%s",method="%s",status="%s"} %d'
+                             % (endpoint, method, status, count))
+            lines += ['# HELP fyyur_request_queries_total Database queries issued.',
+                      '# TYPE fyyur_request_queries_total counter']
+            for endpoint, count in sorted(self.queries.items()):
+                lines.append('fyyur_request_queries_total{endpoint="%s"} %d' % (endpoint, count))
+            for name, help in self.HISTOGRAMS:
+                lines += ['# HELP %s %s' % (name, help), '# TYPE %s histogram' % name]
+                for endpoint, histogram in sorted(self.histograms[name].items()):
+                    lines.extend(histogram.lines(name, 'endpoint="%s"' % endpoint))
+        return '\n'.join(lines) + '\n'
+
+
+def _server_timing(stats, total):
+    return ('db;dur=%.1f;desc="%d queries", tpl;dur=%.1f, total;dur=%.1f'
+            % (stats.db * 1000, stats.queries, stats.templates * 1000, total * 1000))
+
+
+def init_instrumentation(app):
+    metrics = app.extensions['metrics'] = Metrics()
+    app.jinja_env.template_class = TimedTemplate
+    slow_ms = app.config['SLOW_REQUEST_MS']
+    if app.config.get('SLOW_REQUEST_LOG') and not slow_log.handlers:
+        slow_log.addHandler(logging.FileHandler(app.config['SLOW_REQUEST_LOG']))
+        slow_log.setLevel(logging.INFO)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    def record(stats, endpoint, method, path, args, status):
+        total = stats.total()
+        if endpoint != 'metrics':
+            metrics.observe(endpoint, method, status, stats, total)
+        if total * 1000 >= slow_ms and slow_log.isEnabledFor(logging.INFO):
+            slowest = sorted(stats.statements, key=lambda item: item[0], reverse=True)[:10]
+            slow_log.info(json.dumps({
+                'method': method, 'path': path, 'args': args, 'endpoint': endpoint,
+                'status': status, 'total_ms': round(total * 1000, 1),
+                'db_ms': round(stats.db * 1000, 1), 'template_ms': round(stats.templates * 1000, 1),
+                'queries': stats.queries,
+                'slowest_queries': [{'ms': round(elapsed * 1000, 1), 'sql': sql} for elapsed, sql in slowest],
+            }))
+        return total
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        request_info = (request.endpoint or 'unmatched', request.method, request.path, sorted(request.args),
+                        response.status_code)
+        if response.is_streamed:
+            # stream_with_context keeps g while the body is generated, so the stats stay in place
+            # for it and are recorded when the server closes the response.
+            response.call_on_close(lambda: record(stats, *request_info))
+            return response
+        del g.request_stats
+        response.headers['Server-Timing'] = _server_timing(stats, record(stats, *request_info))
+        return response
+
+    def metrics_view():
+        token = app.config.get('METRICS_TOKEN')
+        sent = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(sent.encode(), ('Bearer ' + token).encode()):
+            abort(404)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    return metrics
@@ -0,0 +1,38 @@
+"""search indexes
+
+Revision ID: 2b3c4d5e6f7a
+Revises: 1a2b3c4d5e6f
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2b3c4d5e6f7a'
+down_revision = '1a2b3c4d5e6f'
+branch_labels = None
+depends_on = None
+
+# Must stay identical to search._document(), otherwise the planner will not use the index.
+DOCUMENT = ("setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(city, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(state, '')), 'C')")
+
+
+def upgrade():
+    # Other databases use the in-process index in search.py.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('venues', 'artists'):
+        op.execute(f'CREATE INDEX ix_{table}_search_document ON {table} USING gin (({DOCUMENT}))')
+        op.execute(f'CREATE INDEX ix_{table}_name_trgm ON {table} USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('venues', 'artists'):
+        op.execute(f'DROP INDEX IF EXISTS ix_{table}_name_trgm')
+        op.execute(f'DROP INDEX IF EXISTS ix_{table}_search_document')
@@ -0,0 +1,44 @@
+"""show counters on venues and artists
+
+Revision ID: 3c4d5e6f7a8b
+Revises: 2b3c4d5e6f7a
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c4d5e6f7a8b'
+down_revision = '2b3c4d5e6f7a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('num_past_shows', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the existing shows; `flask roll-shows` keeps them current from here on. Show times
+    # are stored as naive UTC, so compare against the app's clock rather than the server's.
+    now = datetime.datetime.utcnow()
+    for table, foreign_key in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.get_bind().execute(sa.text(f'''
+            UPDATE {table} SET
+                num_upcoming_shows = (SELECT count(*) FROM shows
+                                      WHERE shows.{foreign_key} = {table}.id AND shows.show_time > :now),
+                num_past_shows = (SELECT count(*) FROM shows
+                                  WHERE shows.{foreign_key} = {table}.id AND shows.show_time <= :now)
+        '''), {'now': now})
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('num_past_shows')
+            batch_op.drop_column('num_upcoming_shows')
@@ -0,0 +1,33 @@
+"""indexes for the show-time and listing hot paths
+
+Revision ID: 4d5e6f7a8b9c
+Revises: 3c4d5e6f7a8b
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4d5e6f7a8b9c'
+down_revision = '3c4d5e6f7a8b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_show_time', 'shows', ['venue_id', 'show_time'], unique=False)
+    op.create_index('ix_shows_artist_id_show_time', 'shows', ['artist_id', 'show_time'], unique=False)
+    op.create_index('ix_shows_show_time_id', 'shows', ['show_time', 'id'], unique=False)
+    op.create_index('ix_venues_state_city_id', 'venues', ['state', 'city', 'id'], unique=False)
+    op.create_index(op.f('ix_venues_date_created'), 'venues', ['date_created'], unique=False)
+    op.create_index(op.f('ix_artists_date_created'), 'artists', ['date_created'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_artists_date_created'), table_name='artists')
+    op.drop_index(op.f('ix_venues_date_created'), table_name='venues')
+    op.drop_index('ix_venues_state_city_id', table_name='venues')
+    op.drop_index('ix_shows_show_time_id', table_name='shows')
+    op.drop_index('ix_shows_artist_id_show_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_show_time', table_name='shows')
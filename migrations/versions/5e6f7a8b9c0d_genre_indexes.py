@@ -0,0 +1,30 @@
+"""genre indexes for faceted browse
+
+Revision ID: 5e6f7a8b9c0d
+Revises: 4d5e6f7a8b9c
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e6f7a8b9c0d'
+down_revision = '4d5e6f7a8b9c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serves the genres @> ARRAY[...] filter in facets.py; SQLite filters through json_each().
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('venues', 'artists'):
+        op.execute(f'CREATE INDEX ix_{table}_genres ON {table} USING gin (genres)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('venues', 'artists'):
+        op.execute(f'DROP INDEX IF EXISTS ix_{table}_genres')
@@ -0,0 +1,53 @@
+"""show end times and double-booking constraints
+
+Revision ID: 6f7a8b9c0d1e
+Revises: 5e6f7a8b9c0d
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f7a8b9c0d1e'
+down_revision = '5e6f7a8b9c0d'
+branch_labels = None
+depends_on = None
+
+# Existing shows get the default length, models.DEFAULT_SHOW_DURATION.
+DEFAULT_MINUTES = 120
+
+
+def upgrade():
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.add_column(sa.Column('end_time', sa.DateTime(), nullable=True))
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    if postgres:
+        op.execute(f"UPDATE shows SET end_time = show_time + interval '{DEFAULT_MINUTES} minutes'")
+    else:
+        op.execute(f"UPDATE shows SET end_time = datetime(show_time, '+{DEFAULT_MINUTES} minutes')")
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_check_constraint('ck_shows_end_after_start', 'end_time > show_time')
+
+    if not postgres:
+        return
+    # No two shows of a venue (or of an artist) may overlap. The GiST indexes behind the constraints
+    # also answer "what is booked at this venue in this range". Existing double bookings have to be
+    # resolved first, e.g. find them with
+    #   SELECT a.id, b.id FROM shows a JOIN shows b ON a.venue_id = b.venue_id AND a.id < b.id
+    #   AND tsrange(a.show_time, a.end_time) && tsrange(b.show_time, b.end_time);
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column in ('venue_id', 'artist_id'):
+        op.execute(f'ALTER TABLE shows ADD CONSTRAINT ex_shows_{column}_overlap '
+                   f'EXCLUDE USING gist ({column} WITH =, tsrange(show_time, end_time) WITH &&)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in ('venue_id', 'artist_id'):
+            op.execute(f'ALTER TABLE shows DROP CONSTRAINT IF EXISTS ex_shows_{column}_overlap')
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.drop_constraint('ck_shows_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
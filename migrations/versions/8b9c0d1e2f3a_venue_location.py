@@ -0,0 +1,39 @@
+"""venue locations for the nearby venues search
+
+Revision ID: 8b9c0d1e2f3a
+Revises: 7a8b9c0d1e2f
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b9c0d1e2f3a'
+down_revision = '7a8b9c0d1e2f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('longitude', sa.Float(), nullable=True))
+    # Existing venues are located afterwards with `flask geo geocode`.
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite could only add the check by copying venues into a new table, which the foreign keys
+        # of shows do not allow.
+        return
+    op.create_check_constraint('ck_venues_location', 'venues',
+                               'latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180')
+    # Built-in point type, no extension needed. The expression must stay identical to
+    # geo._location(); the index answers both box containment (<@) and nearest first (<->).
+    op.execute('CREATE INDEX ix_venues_location ON venues USING gist (point(longitude, latitude))')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_venues_location')
+        op.drop_constraint('ck_venues_location', 'venues', type_='check')
+    op.drop_column('venues', 'longitude')
+    op.drop_column('venues', 'latitude')
@@ -0,0 +1,32 @@
+"""venue cities are required
+
+Revision ID: 9c0d1e2f3a4b
+Revises: 8b9c0d1e2f3a
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c0d1e2f3a4b'
+down_revision = '8b9c0d1e2f3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /venues pages by (state, city, id); a NULL city drops out of the cursor comparison and with it
+    # every venue after it. The forms always required a city, so only old rows can lack one.
+    op.execute("UPDATE venues SET city = '' WHERE city IS NULL")
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite could only change the column by copying venues into a new table, which the foreign
+        # keys of shows do not allow.
+        return
+    op.alter_column('venues', 'city', existing_type=sa.String(length=120), nullable=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('venues', 'city', existing_type=sa.String(length=120), nullable=True)
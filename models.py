@@ -1,24 +1,56 @@
 import datetime
-from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+import sqlite3
+from collections import Counter
+from sqlalchemy import bindparam, case, event, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm.attributes import get_history
+from routing import RoutingSQLAlchemy
+db = RoutingSQLAlchemy()
+
+# Postgres stores genres as a native ARRAY; SQLite (used for tests and local tooling) falls back to JSON.
+Genres = db.ARRAY(db.String(100)).with_variant(db.JSON(), 'sqlite')
+
+
+@event.listens_for(Engine, 'connect')
+def _enforce_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # Postgres always checks show references; SQLite only when asked to, per connection.
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+
+# Length of a show when none is given.
+DEFAULT_SHOW_DURATION = datetime.timedelta(hours=2)
 
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        # /venues lists venues by area; also serves exact city/state lookups.
+        db.Index('ix_venues_state_city_id', 'state', 'city', 'id'),
+        db.CheckConstraint('latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180',
+                           name='ck_venues_location'),
+        # On Postgres the venue_location migration also indexes the location with GiST for the
+        # nearby venues search; see geo.py.
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, unique=True)
-    city = db.Column(db.String(120))
+    city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(100), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(100)), default=[])
+    genres = db.Column(Genres, default=[])
     image_link = db.Column(db.String(500))
     website_link = db.Column(db.String(120), default=None)
     facebook_link = db.Column(db.String(120))
     looking_for_talent = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(200), default=None)
-    date_created = db.Column(db.DateTime(), default=datetime.datetime.utcnow())
+    date_created = db.Column(db.DateTime(), default=datetime.datetime.utcnow, index=True)
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # City centre from the gazetteer unless set explicitly, see geo.py.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     shows = db.relationship('Show', backref='venue', lazy=True)
     
     def __str__(self):
@@ -35,13 +67,15 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(100)), default=[])
+    genres = db.Column(Genres, default=[])
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     looking_for_venues = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(200))
-    date_created = db.Column(db.DateTime(), default=datetime.datetime.utcnow())
+    date_created = db.Column(db.DateTime(), default=datetime.datetime.utcnow, index=True)
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='artist', lazy=True)
     
     def __str__(self):
@@ -52,11 +86,112 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        # Venue/artist pages and the show counters look up shows per venue or artist by time.
+        db.Index('ix_shows_venue_id_show_time', 'venue_id', 'show_time'),
+        db.Index('ix_shows_artist_id_show_time', 'artist_id', 'show_time'),
+        # /shows is paged by (show_time, id).
+        db.Index('ix_shows_show_time_id', 'show_time', 'id'),
+        db.CheckConstraint('end_time > show_time', name='ck_shows_end_after_start'),
+        # On Postgres the show_end_time migration also adds exclusion constraints against double
+        # bookings of a venue or artist; see scheduling.py.
+    )
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'))
     venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'))
     show_time = db.Column(db.DateTime(), nullable=False)
+    end_time = db.Column(db.DateTime(), nullable=False,
+                         default=lambda context: context.get_current_parameters()['show_time'] + DEFAULT_SHOW_DURATION)
+
+    @property
+    def duration(self):
+        return self.end_time - self.show_time
  
     def __str__(self):
         return f'Name:{self.name}'
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+
+class IdempotencyKey(db.Model):
+    # Responses of the bulk write API by client-chosen key, written in the same transaction as the
+    # records, so a retried batch gets the original response instead of creating the records twice.
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created = db.Column(db.DateTime(), nullable=False, default=datetime.datetime.utcnow, index=True)
+
+
+# Show counters
+# num_upcoming_shows/num_past_shows on venues and artists are kept in step with every show that is
+# inserted, moved or deleted through the ORM. A show only moves from upcoming to past when
+# refresh_show_counters() runs (`flask roll-shows`), which also repairs drift from bulk writes.
+
+def _adjust_counters(connection, show_time, venue_id, artist_id, delta):
+    column = 'num_upcoming_shows' if show_time > datetime.datetime.utcnow() else 'num_past_shows'
+    for table, id in ((Venue.__table__, venue_id), (Artist.__table__, artist_id)):
+        if id is not None:
+            connection.execute(table.update().where(table.c.id == id).values({column: table.c[column] + delta}))
+
+
+def _previous(target, attribute):
+    history = get_history(target, attribute)
+    return history.deleted[0] if history.deleted else getattr(target, attribute)
+
+
+@event.listens_for(Show, 'after_insert')
+def _count_new_show(mapper, connection, target):
+    _adjust_counters(connection, target.show_time, target.venue_id, target.artist_id, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _uncount_deleted_show(mapper, connection, target):
+    _adjust_counters(connection, _previous(target, 'show_time'), _previous(target, 'venue_id'),
+                     _previous(target, 'artist_id'), -1)
+
+
+@event.listens_for(Show, 'after_update')
+def _recount_moved_show(mapper, connection, target):
+    attributes = ('show_time', 'venue_id', 'artist_id')
+    if any(get_history(target, attribute).has_changes() for attribute in attributes):
+        _adjust_counters(connection, *[_previous(target, attribute) for attribute in attributes], -1)
+        _adjust_counters(connection, *[getattr(target, attribute) for attribute in attributes], 1)
+
+
+def count_inserted_shows(connection, rows):
+    # Counter upkeep for shows written with Core inserts, which the ORM events above do not see: the
+    # increments are summed per venue/artist and applied with one executemany per counter column.
+    now = datetime.datetime.utcnow()
+    increments = {}
+    for row in rows:
+        column = 'num_upcoming_shows' if row['show_time'] > now else 'num_past_shows'
+        for table, id in ((Venue.__table__, row['venue_id']), (Artist.__table__, row['artist_id'])):
+            increments.setdefault((table, column), Counter())[id] += 1
+    for (table, column), counts in increments.items():
+        connection.execute(table.update().where(table.c.id == bindparam('_id'))
+                           .values({column: table.c[column] + bindparam('_delta')}),
+                           [{'_id': id, '_delta': delta} for id, delta in counts.items()])
+
+
+def refresh_show_counters(session):
+    # Recount every venue and artist from the shows table with one grouped scan per side, then only
+    # write the rows whose counters changed. Returns the number of rows updated.
+    now = datetime.datetime.utcnow()
+    updated = 0
+    for model, foreign_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        counts = {id: (upcoming, past) for id, upcoming, past in session.query(
+            foreign_key,
+            func.sum(case((Show.show_time > now, 1), else_=0)),
+            func.sum(case((Show.show_time <= now, 1), else_=0))).group_by(foreign_key)}
+        changes = [{'_id': id, 'upcoming': counts.get(id, (0, 0))[0], 'past': counts.get(id, (0, 0))[1]}
+                   for id, upcoming, past in session.query(model.id, model.num_upcoming_shows, model.num_past_shows)
+                   if counts.get(id, (0, 0)) != (upcoming, past)]
+        if changes:
+            table = model.__table__
+            session.execute(table.update().where(table.c.id == bindparam('_id'))
+                            .values(num_upcoming_shows=bindparam('upcoming'), num_past_shows=bindparam('past')),
+                            changes)
+        updated += len(changes)
+    return updated
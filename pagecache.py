@@ -0,0 +1,198 @@
+import functools
+import hashlib
+import inspect
+import uuid
+from urllib.parse import urlencode
+
+from flask import Response, current_app, make_response, request, session
+
+from cache import LocalBackend, SharedBackend
+from routing import may_lag
+
+
+# Full-page cache for anonymous GETs of the listing and detail pages. Rendered bodies are kept in a
+# bounded LRU store under the request path plus the query args the view reads (so every page of a
+# listing is its own entry, while args the view ignores cannot fill the cache) and tagged with
+# surrogate keys such as "venue:42" or "shows". The same commit hooks that invalidate the object
+# cache purge every page tagged with an affected key, see cache.py.
+#
+# A purge does not look for the pages it affects: every surrogate key has a version, a page is
+# stored with the versions its keys had when it started rendering, and a purge deletes the versions
+# of its keys, so pages stored under them stop matching and age out. A key without a version gets
+# a new one, so a page never matches a version that was forgotten in between. With CACHE_REDIS_URL
+# the pages and versions live in Redis, so every worker (and the CLI commands) sees the same pages
+# and purges; otherwise each worker has its own.
+#
+# Responses carry a strong ETag over the body, so a browser holding the current page gets a 304
+# without the body, whether the page came from the cache or not. Requests with pending flash
+# messages bypass the cache, as the message is part of the page.
+
+class CachedPage:
+    __slots__ = ('body', 'etag', 'mimetype', 'tags', 'versions')
+
+    def __init__(self, body, etag, mimetype, tags, versions):
+        self.body = body
+        self.etag = etag
+        self.mimetype = mimetype
+        self.tags = tags
+        self.versions = versions
+
+
+class PageCache:
+    def __init__(self, pages, versions):
+        # Both stores speak the get/set/delete/clear API of the cache.py backends.
+        self.pages = pages
+        self.versions = versions
+        self.hits = 0
+        self.misses = 0
+
+    def tag_versions(self, tags):
+        # The current versions of `tags`, for a page that starts rendering now.
+        versions = []
+        for tag in tags:
+            version = self.versions.get(tag)
+            if version is None:
+                version = uuid.uuid4().hex[:12]
+                self.versions.set(tag, version)
+            versions.append(version)
+        return versions
+
+    def get(self, key):
+        page = self.pages.get(key)
+        if page is not None and [self.versions.get(tag) for tag in page.tags] != page.versions:
+            page = None
+        if page is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return page
+
+    def set(self, key, page):
+        self.pages.set(key, page)
+
+    def purge(self, *tags):
+        self.versions.delete(*tags)
+
+    def clear(self):
+        self.versions.clear()
+        self.pages.clear()
+
+    def stats(self):
+        stats = {'hits': self.hits, 'misses': self.misses}
+        if isinstance(self.pages, LocalBackend):
+            stats['entries'] = len(self.pages)
+        return stats
+
+
+def init_page_cache(app):
+    if not app.config.get('PAGE_CACHE_ENABLED'):
+        return None
+    config = app.config
+    if config.get('CACHE_REDIS_URL'):
+        import redis
+        client = redis.Redis.from_url(config['CACHE_REDIS_URL'])
+        # Versions outlive the pages, so a page is not dropped early because its version expired.
+        pages = SharedBackend(client, ttl=config['PAGE_CACHE_TTL'], prefix='fyyur-page:')
+        versions = SharedBackend(client, ttl=config['PAGE_CACHE_TTL'] * 10, prefix='fyyur-tag:')
+    else:
+        pages = LocalBackend(max_entries=config['PAGE_CACHE_MAX_ENTRIES'], ttl=config['PAGE_CACHE_TTL'])
+        versions = LocalBackend(max_entries=config['PAGE_CACHE_MAX_ENTRIES'], ttl=config['PAGE_CACHE_TTL'] * 10)
+    cache = app.extensions['page_cache'] = PageCache(pages, versions)
+    return cache
+
+
+def strong_etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _respond(page, status):
+    response = Response(page.body, mimetype=page.mimetype)
+    response.set_etag(page.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Surrogate-Key'] = ' '.join(page.tags)
+    response.headers['X-Cache'] = status
+    return response.make_conditional(request)
+
+
+def _page_key(args):
+    # The path plus the values of `args`, in the order they are listed.
+    values = [(name, value) for name in args for value in request.args.getlist(name)]
+    return request.path + '?' + urlencode(values) if values else request.path
+
+
+def _tee(chunks, cache, key, tags, versions, mimetype, max_body):
+    parts, size = [], 0
+    for chunk in chunks:
+        yield chunk
+        if parts is not None:
+            size += len(chunk)
+            if size > max_body:
+                parts = None
+            else:
+                parts.append(chunk)
+    if parts is not None:
+        body = b''.join(parts)
+        cache.set(key, CachedPage(body, strong_etag(body), mimetype, tags, versions))
+
+
+def _store(cache, key, response, tags, versions):
+    if response.status_code != 200 or may_lag():
+        return response
+    if response.is_streamed:
+        # Streamed pages are stored once they have been sent in full; this first response goes out
+        # without an ETag.
+        response.response = _tee(response.iter_encoded(), cache, key, tags, versions,
+                                 response.mimetype, current_app.config['PAGE_CACHE_MAX_BODY'])
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Surrogate-Key'] = ' '.join(tags)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    body = response.get_data()
+    page = CachedPage(body, strong_etag(body), response.mimetype, tags, versions)
+    cache.set(key, page)
+    return _respond(page, 'MISS')
+
+
+def _cache_for_request():
+    cache = current_app.extensions.get('page_cache')
+    if cache is None or request.method != 'GET' or session.get('_flashes'):
+        return None
+    return cache
+
+
+def cached_page(*tags, args=()):
+    # `tags` may refer to the view arguments, e.g. @cached_page('venue:{venue_id}'); `args` are the
+    # query args the view reads. Works on the async views of asgi.py as well.
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(**kwargs):
+                cache = _cache_for_request()
+                if cache is None:
+                    return await view(**kwargs)
+                key = _page_key(args)
+                page = cache.get(key)
+                if page is not None:
+                    return _respond(page, 'HIT')
+                page_tags = [tag.format(**kwargs) for tag in tags]
+                # Taken before rendering: a purge while the page renders makes it stale on arrival.
+                versions = cache.tag_versions(page_tags)
+                response = make_response(await view(**kwargs))
+                return _store(cache, key, response, page_tags, versions)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            cache = _cache_for_request()
+            if cache is None:
+                return view(**kwargs)
+            key = _page_key(args)
+            page = cache.get(key)
+            if page is not None:
+                return _respond(page, 'HIT')
+            page_tags = [tag.format(**kwargs) for tag in tags]
+            versions = cache.tag_versions(page_tags)
+            response = make_response(view(**kwargs))
+            return _store(cache, key, response, page_tags, versions)
+        return wrapper
+    return decorator
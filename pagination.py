@@ -0,0 +1,133 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import tuple_
+
+
+# Keyset (cursor) pagination: instead of OFFSET, each page remembers the sort key of its first and
+# last row and the next page asks for rows strictly after that key. The key always ends with the
+# primary key so it is unique, which keeps paging stable while rows are inserted or deleted.
+
+# Rows fetched from the server-side cursor at a time by stream_paginate().
+STREAM_BATCH_SIZE = 500
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [datetime.fromisoformat(v) if v is not None and _is_datetime(column) else v
+                for v, column in zip(values, columns)]
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def _is_datetime(column):
+    try:
+        return column.type.python_type is datetime
+    except NotImplementedError:
+        return False
+
+
+class KeysetPage:
+    # `key` maps an item to its cursor values; the cursors are taken eagerly so callers are free to
+    # replace `items` afterwards (e.g. with the model instances behind a ranked row).
+    def __init__(self, items, key, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = encode_cursor(key(items[-1])) if has_next and items else None
+        self.prev_cursor = encode_cursor(key(items[0])) if has_prev and items else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(query, columns, after=None, before=None, per_page=50, key=None, factory=None):
+    # `columns` is the ascending sort key of the listing, e.g. (Artist.name, Artist.id). Unless a
+    # `key` function is given, every row returned by `query` must expose those columns as attributes.
+    # `factory`, if given, turns each result row into the item that ends up on the page.
+    statement = keyset_statement(query, columns, after, before, per_page)
+    return keyset_page(statement.all(), columns, after, before, per_page, key, factory)
+
+
+def keyset_statement(query, columns, after=None, before=None, per_page=50):
+    # The page's query, ORM Query or select(), with one row more than a page to tell whether there is
+    # another. Backward pages walk back from the cursor in descending order.
+    sort_key = tuple_(*columns)
+    if before is not None:
+        return (query.filter(sort_key < tuple_(*decode_cursor(before, columns)))
+                .order_by(*[column.desc() for column in columns])
+                .limit(per_page + 1))
+    if after is not None:
+        query = query.filter(sort_key > tuple_(*decode_cursor(after, columns)))
+    return query.order_by(*columns).limit(per_page + 1)
+
+
+def keyset_page(rows, columns, after=None, before=None, per_page=50, key=None, factory=None):
+    # Turns the rows of keyset_statement() into the page.
+    if key is None:
+        def key(item):
+            return [getattr(item, column.key) for column in columns]
+    if factory is not None:
+        rows = [factory(row) for row in rows]
+    if before is not None:
+        # Flip the rows of a backward page back into display order.
+        has_prev = len(rows) > per_page
+        return KeysetPage(rows[:per_page][::-1], key, has_next=True, has_prev=has_prev)
+    return KeysetPage(rows[:per_page], key, has_next=len(rows) > per_page, has_prev=after is not None)
+
+
+class StreamedPage:
+    # A forward page whose rows are read from a server-side cursor while they are iterated, e.g. by a
+    # streamed template, instead of being loaded up front. It can be iterated once; has_next and the
+    # cursors are only known after that, so templates must render the pager below the rows.
+    def __init__(self, rows, key, per_page, has_prev):
+        self._rows = rows
+        self._key = key
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = False
+        self.prev_cursor = None
+        self.next_cursor = None
+
+    def __iter__(self):
+        count, last = 0, None
+        for row in self._rows:
+            # The query asks for one row more than a page; its presence means there is a next page.
+            if count == self.per_page:
+                self.has_next = True
+                continue
+            if count == 0 and self.has_prev:
+                self.prev_cursor = encode_cursor(self._key(row))
+            count, last = count + 1, row
+            yield row
+        if self.has_next:
+            self.next_cursor = encode_cursor(self._key(last))
+
+
+def stream_paginate(query, columns, after=None, before=None, per_page=50, key=None, factory=None):
+    # Same arguments as keyset_paginate(). Backward pages have to be reversed before they can be
+    # shown, so those are still loaded in full.
+    if before is not None:
+        return keyset_paginate(query, columns, after, before, per_page, key, factory)
+    if key is None:
+        def key(item):
+            return [getattr(item, column.key) for column in columns]
+    if after is not None:
+        query = query.filter(tuple_(*columns) > tuple_(*decode_cursor(after, columns)))
+    rows = (query.order_by(*columns).limit(per_page + 1)
+            .execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE))
+    if factory is not None:
+        rows = map(factory, rows)
+    return StreamedPage(rows, key, per_page, has_prev=after is not None)
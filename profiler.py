@@ -0,0 +1,240 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import click
+from flask import abort, current_app, g, jsonify, request
+from flask.cli import AppGroup
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+# Sampling profiler for individual requests. Nothing is sampled unless PROFILER_ENABLED is set, and
+# then only requests to an endpoint listed in PROFILER_ENDPOINTS or carrying a signed token, either
+# as an X-Profile header or a ?profile= query argument (see `flask profiler token`). One background
+# thread looks at the stacks of the profiled request threads every PROFILER_INTERVAL seconds, so
+# the request itself runs at full speed.
+#
+# Every profiled request leaves two files in PROFILER_DIR: <name>.collapsed (one "frame;frame;...
+# count" line per stack, the input of flamegraph.pl) and <name>.speedscope.json (open it at
+# https://www.speedscope.app). The stacks of all requests profiled by this process are also added
+# up for /profiler/top; `flask profiler top` does the same over the files on disk.
+
+profiler_cli = AppGroup('profiler', help='Request profiler tools.')
+
+TOKEN_SALT = 'fyyur-profiler'
+
+
+def _frame_name(code):
+    # Functions are told apart by name, file and first line, so every line of a function counts
+    # towards the same frame. ";" separates frames in the collapsed format.
+    filename = code.co_filename
+    try:
+        filename = os.path.relpath(filename)
+    except ValueError:
+        pass
+    if filename.startswith('..'):
+        filename = os.path.basename(filename)
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+class Sample:
+    # The stacks collected for one request, root frame first.
+    def __init__(self, name):
+        self.name = name
+        self.stacks = Counter()
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+
+
+class Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}  # thread id -> Sample
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, name):
+        sample = Sample(name)
+        with self._lock:
+            self.active[threading.get_ident()] = sample
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+        return sample
+
+    def stop(self):
+        with self._lock:
+            sample = self.active.pop(threading.get_ident(), None)
+        if sample is not None:
+            sample.seconds = time.perf_counter() - sample.start
+        return sample
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.active:
+                    # Exit while idle; the next profiled request starts a new thread.
+                    self._thread = None
+                    return
+                active = list(self.active.items())
+            frames = sys._current_frames()
+            for thread_id, sample in active:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    sample.stacks[tuple(reversed(stack))] += 1
+
+
+def collapsed(stacks):
+    return ''.join('%s %d\n' % (';'.join(stack), count) for stack, count in stacks.items())
+
+
+def parse_collapsed(lines):
+    stacks = Counter()
+    for line in lines:
+        stack, _, count = line.rstrip('\n').rpartition(' ')
+        if stack:
+            stacks[tuple(stack.split(';'))] += int(count)
+    return stacks
+
+
+def speedscope(sample, interval):
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in sample.stacks.items():
+        ids = []
+        for name in stack:
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({'name': name})
+            ids.append(index[name])
+        samples.append(ids)
+        weights.append(count * interval)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': sample.name,
+        'exporter': 'fyyur',
+        'activeProfileIndex': 0,
+        'shared': {'frames': frames},
+        'profiles': [{'type': 'sampled', 'name': sample.name, 'unit': 'seconds', 'startValue': 0,
+                      'endValue': sum(weights), 'samples': samples, 'weights': weights}],
+    }
+
+
+def top_functions(stacks, limit=30):
+    # Self samples count the function running at the moment of the sample, total samples every
+    # function on the stack (once per sample, however deep the recursion).
+    own, total = Counter(), Counter()
+    samples = sum(stacks.values())
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for name in set(stack):
+            total[name] += count
+    return {'samples': samples, 'functions': [
+        {'function': name, 'self': own[name], 'total': total[name],
+         'self_percent': round(own[name] * 100 / samples, 1) if samples else 0.0,
+         'total_percent': round(total[name] * 100 / samples, 1) if samples else 0.0}
+        for name, _ in sorted(total.items(), key=lambda item: (own[item[0]], item[1]), reverse=True)[:limit]]}
+
+
+def _serializer(app):
+    # Tokens are only accepted with a PROFILER_SECRET: SECRET_KEY is random per process, so a token
+    # signed with it would not be valid in any other worker or after a restart.
+    secret = app.config.get('PROFILER_SECRET')
+    return URLSafeTimedSerializer(secret, salt=TOKEN_SALT) if secret else None
+
+
+def valid_token(app, token):
+    serializer = _serializer(app)
+    if serializer is None:
+        return False
+    try:
+        serializer.loads(token, max_age=app.config['PROFILER_TOKEN_MAX_AGE'])
+        return True
+    except BadSignature:
+        return False
+
+
+def init_profiler(app):
+    if not app.config.get('PROFILER_ENABLED'):
+        return None
+    interval = app.config['PROFILER_INTERVAL']
+    directory = app.config['PROFILER_DIR']
+    endpoints = set(app.config.get('PROFILER_ENDPOINTS') or ())
+    sampler = app.extensions['profiler'] = Sampler(interval)
+    totals = Counter()
+    totals_lock = threading.Lock()
+
+    def requested():
+        token = request.headers.get('X-Profile') or request.args.get('profile')
+        return token is not None and valid_token(app, token)
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint in endpoints or requested():
+            g.profile = sampler.start(request.endpoint or 'unmatched')
+
+    @app.teardown_request
+    def stop_profile(exc):
+        if g.pop('profile', None) is None:
+            return
+        sample = sampler.stop()
+        if sample is None or not sample.stacks:
+            return
+        with totals_lock:
+            totals.update(sample.stacks)
+        os.makedirs(directory, exist_ok=True)
+        name = '%s-%s-%s' % (time.strftime('%Y%m%d-%H%M%S'), sample.name, uuid.uuid4().hex[:8])
+        with open(os.path.join(directory, name + '.collapsed'), 'w') as file:
+            file.write(collapsed(sample.stacks))
+        with open(os.path.join(directory, name + '.speedscope.json'), 'w') as file:
+            json.dump(speedscope(sample, interval), file)
+
+    def top_view():
+        if not requested():
+            abort(404)
+        with totals_lock:
+            stacks = Counter(totals)
+        return jsonify(top_functions(stacks, request.args.get('limit', 30, type=int)))
+    app.add_url_rule('/profiler/top', 'profiler_top', top_view)
+
+    return sampler
+
+
+@profiler_cli.command('token', help='Print a token that turns on profiling for a request.')
+def token_command():
+    serializer = _serializer(current_app)
+    if serializer is None:
+        raise click.ClickException('PROFILER_SECRET is not set; tokens need a secret shared by every worker.')
+    token = serializer.dumps('profile')
+    click.echo(token)
+    click.echo(f'  curl -H "X-Profile: {token}" http://localhost:3000/venues', err=True)
+
+
+@profiler_cli.command('top', help='Hottest functions over the collapsed stack files in PROFILER_DIR.')
+@click.option('--dir', 'directory', help='Defaults to PROFILER_DIR.')
+@click.option('--endpoint', help='Only requests to this endpoint, e.g. venues.venues.')
+@click.option('--limit', default=30, show_default=True)
+def top_command(directory, endpoint, limit):
+    directory = directory or current_app.config['PROFILER_DIR']
+    stacks = Counter()
+    files = 0
+    for filename in sorted(os.listdir(directory)) if os.path.isdir(directory) else ():
+        if not filename.endswith('.collapsed') or (endpoint and f'-{endpoint}-' not in filename):
+            continue
+        with open(os.path.join(directory, filename)) as file:
+            stacks.update(parse_collapsed(file))
+        files += 1
+    top = top_functions(stacks, limit)
+    click.echo(f'{files} profiles, {top["samples"]} samples')
+    click.echo(f'{"self %":>7}{"total %":>9}  function')
+    for function in top['functions']:
+        click.echo(f'{function["self_percent"]:>7.1f}{function["total_percent"]:>9.1f}  {function["function"]}')
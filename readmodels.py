@@ -0,0 +1,64 @@
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+from models import db, Venue, Artist
+
+
+# Read models for the listing, search and home pages. They show a handful of columns per row, so
+# instead of full Venue/Artist instances (every column including genres and descriptions, plus
+# identity map and change tracking) these pages query just the columns they need and get compact,
+# immutable namedtuple rows back. Detail and edit pages keep using the ORM models.
+#
+# The row types are module level so they pickle, e.g. into the shared object cache.
+
+ArtistCard = namedtuple('ArtistCard', 'id name image_link')
+VenueCard = namedtuple('VenueCard', 'id name image_link')
+ArtistListing = namedtuple('ArtistListing', 'id name')
+VenueListing = namedtuple('VenueListing', 'id name city state num_upcoming_shows')
+
+
+class Projection:
+    # `columns` are read in order into the fields of `row`, so field names must match column keys
+    # (keyset pagination reads the sort key back from the row by column key).
+    def __init__(self, row, *columns):
+        self.row = row
+        self.columns = columns
+
+    def query(self, session=None):
+        return (session or db.session).query(*self.columns)
+
+    def select(self):
+        # The same columns as a Core select(), for the async views.
+        return select(*self.columns)
+
+    def make(self, values):
+        return self.row._make(values)
+
+    def all(self, query):
+        return [self.row._make(values) for values in query]
+
+
+# Names sort the artist listing and browse, but may be NULL (they are unique, so old rows without
+# one cannot be given a filler). They are read as '': a NULL in a keyset cursor would make the row
+# comparison NULL and drop every row after it from the following pages.
+ARTIST_NAME = func.coalesce(Artist.name, '').label('name')
+VENUE_NAME = func.coalesce(Venue.name, '').label('name')
+
+ARTIST_CARD = Projection(ArtistCard, Artist.id, Artist.name, Artist.image_link)
+VENUE_CARD = Projection(VenueCard, Venue.id, Venue.name, Venue.image_link)
+ARTIST_LISTING = Projection(ArtistListing, Artist.id, ARTIST_NAME)
+VENUE_LISTING = Projection(VenueListing, Venue.id, VENUE_NAME, Venue.city, Venue.state, Venue.num_upcoming_shows)
+
+# Rows of the listing and search pages, and their sort key by name, by model.
+LISTINGS = {Artist: ARTIST_LISTING, Venue: VENUE_LISTING}
+BY_NAME = {Artist: (ARTIST_NAME, Artist.id), Venue: (VENUE_NAME, Venue.id)}
+
+
+def recent(projection, model, limit=10):
+    # Most recently listed first, for the home page.
+    return projection.all(latest(projection.query(), model, limit))
+
+
+def latest(query, model, limit=10):
+    return query.order_by(model.date_created.desc(), model.id.desc()).limit(limit)
@@ -0,0 +1,126 @@
+import functools
+import inspect
+import random
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, session as flask_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+
+# Read-replica routing and connection pool settings for the Flask-SQLAlchemy layer.
+#
+# Views wrapped in @read_only send their queries to one of the replicas in SQLALCHEMY_REPLICA_URIS,
+# chosen per request. Everything else, and a read-only view from the moment its session writes
+# (a flush, or an INSERT/UPDATE/DELETE statement), uses the primary, so a request always reads its
+# own writes. After a request commits a write, the client's next requests also stay on the primary
+# for REPLICA_STICKY_SECONDS, long enough for the replicas to catch up with the page it is
+# redirected to.
+#
+# Replicas are ordinary Flask-SQLAlchemy binds named "replica0", "replica1"..., so they get the same
+# engine and pool options as the primary. To try the routing locally, point the primary and a
+# replica at two SQLite files with different data (SQLALCHEMY_DATABASE_URI = 'sqlite:///primary.db'
+# and DATABASE_REPLICA_URIS=sqlite:///replica.db): /venues then lists the replica's venues while
+# /venues/create writes to the primary.
+#
+# Pages and snapshots read from a replica shortly after a write in this process are not cached
+# (see may_lag()); otherwise a replica that has not caught up yet could refill the caches the
+# write just invalidated with the old data.
+
+PRIMARY_UNTIL = '_primary_until'
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+        replica = self.info.get('replica')
+        if replica is not None and not self.info.get('wrote'):
+            return replica
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if not session.info.get('wrote') or not has_app_context() or 'replicas' not in current_app.extensions:
+        return
+    now = time.time()
+    current_app.extensions['replicas']['last_write'] = now
+    seconds = current_app.config.get('REPLICA_STICKY_SECONDS')
+    if seconds and has_request_context():
+        flask_session[PRIMARY_UNTIL] = now + seconds
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        # Pool settings from the DATABASE_POOL_* config, for server databases only: SQLite runs on a
+        # static or null pool that takes no sizes.
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        options['pool_pre_ping'] = app.config.get('DATABASE_POOL_PRE_PING', False)
+        if sa_url.drivername.startswith('sqlite'):
+            return sa_url, options
+        for option, key in (('pool_size', 'DATABASE_POOL_SIZE'), ('max_overflow', 'DATABASE_MAX_OVERFLOW'),
+                            ('pool_timeout', 'DATABASE_POOL_TIMEOUT'), ('pool_recycle', 'DATABASE_POOL_RECYCLE')):
+            if app.config.get(key) is not None:
+                options[option] = app.config[key]
+        timeout = app.config.get('DATABASE_STATEMENT_TIMEOUT_MS')
+        if timeout and sa_url.drivername.startswith('postgresql'):
+            connect_args = options.setdefault('connect_args', {})
+            connect_args['options'] = ('%s -c statement_timeout=%d' % (connect_args.get('options', ''), timeout)).strip()
+        return sa_url, options
+
+
+def init_replicas(app):
+    uris = app.config.get('SQLALCHEMY_REPLICA_URIS')
+    if not uris:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    names = []
+    for number, uri in enumerate(uris):
+        names.append('replica%d' % number)
+        binds[names[-1]] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.extensions['replicas'] = {'names': names, 'last_write': 0.0}
+
+
+def replica_name():
+    # The replica bind for this request's reads, or None to stay on the primary.
+    replicas = current_app.extensions.get('replicas')
+    if replicas is None or flask_session.get(PRIMARY_UNTIL, 0) > time.time():
+        return None
+    return random.choice(replicas['names'])
+
+
+def may_lag():
+    # Whether this request reads from a replica that may not have this process's latest write yet.
+    replicas = current_app.extensions.get('replicas')
+    if replicas is None or g.get('replica') is None:
+        return False
+    return time.time() - replicas['last_write'] < current_app.config.get('REPLICA_STICKY_SECONDS', 0)
+
+
+def read_only(view):
+    # Also wraps the async views of asgi.py, which read the bind name from g.replica.
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            g.replica = replica_name()
+            return await view(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.replica = replica_name()
+        if g.replica is not None:
+            db = current_app.extensions['sqlalchemy'].db
+            db.session.info['replica'] = db.get_engine(current_app, bind=g.replica)
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,103 @@
+from sqlalchemy import or_
+
+from models import Show
+
+
+# Double-booking checks for shows. A show occupies [show_time, end_time) at its venue and for its
+# artist, and two shows of the same venue or the same artist may not overlap. On Postgres the
+# show_end_time migration enforces this with exclusion constraints over tsrange(show_time, end_time);
+# the checks here run first on every database so a clash is reported per show instead of failing
+# the whole transaction, and they are all SQLite has.
+#
+# find_conflicts() takes a whole batch of proposed shows, reads the existing shows that could clash
+# with any of them in one query, and answers every proposal from an interval tree per venue and per
+# artist, so checking a few hundred shows costs the same single round trip as checking one.
+
+
+class IntervalTree:
+    # Static centered tree over half-open (start, end, item) intervals: the intervals sorted by start
+    # form an implicit balanced BST (the middle of every slice is its root), and each root keeps the
+    # largest end in its slice, so subtrees that end before the query starts are skipped.
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals, key=lambda interval: interval[:2])
+        self._max_end = [None] * len(self.intervals)
+        self._build(0, len(self.intervals))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        end = self.intervals[mid][1]
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > end:
+                end = child
+        self._max_end[mid] = end
+        return end
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def overlapping(self, start, end):
+        found = []
+        stack = [(0, len(self.intervals))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self._max_end[mid] <= start:
+                continue
+            stack.append((lo, mid))
+            interval = self.intervals[mid]
+            if interval[0] < end:
+                if interval[1] > start:
+                    found.append(interval)
+                # Everything to the right starts at or after this interval.
+                stack.append((mid + 1, hi))
+        return found
+
+
+def _describe(item):
+    kind, key = item
+    return 'show %s' % key if kind == 'show' else 'entry %s of this batch' % key
+
+
+def find_conflicts(session, proposals):
+    # `proposals` is a list of (key, values) with artist_id, venue_id, show_time and end_time set.
+    # Returns (key, {field: [messages]}) for every proposal that overlaps an existing show or another
+    # proposal at the same venue or with the same artist; both sides of a clash within the batch are
+    # reported.
+    if not proposals:
+        return []
+    venue_ids = {values['venue_id'] for _, values in proposals}
+    artist_ids = {values['artist_id'] for _, values in proposals}
+    start = min(values['show_time'] for _, values in proposals)
+    end = max(values['end_time'] for _, values in proposals)
+    existing = session.query(Show.id, Show.venue_id, Show.artist_id, Show.show_time, Show.end_time).filter(
+        or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids)),
+        Show.show_time < end, Show.end_time > start)
+
+    booked = {}
+    for id, venue_id, artist_id, show_time, end_time in existing:
+        for resource in (('venue_id', venue_id), ('artist_id', artist_id)):
+            booked.setdefault(resource, []).append((show_time, end_time, ('show', id)))
+    for key, values in proposals:
+        for field in ('venue_id', 'artist_id'):
+            booked.setdefault((field, values[field]), []).append(
+                (values['show_time'], values['end_time'], ('proposal', key)))
+    trees = {resource: IntervalTree(intervals) for resource, intervals in booked.items()}
+
+    conflicts = []
+    for key, values in proposals:
+        problems = {}
+        for field in ('venue_id', 'artist_id'):
+            clashes = [interval[2] for interval in
+                       trees[(field, values[field])].overlapping(values['show_time'], values['end_time'])
+                       if interval[2] != ('proposal', key)]
+            if clashes:
+                noun = 'venue' if field == 'venue_id' else 'artist'
+                problems[field] = ['The %s is already booked at this time (%s).' %
+                                   (noun, ', '.join(_describe(item) for item in clashes))]
+        if problems:
+            conflicts.append((key, problems))
+    return conflicts
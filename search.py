@@ -0,0 +1,205 @@
+import bisect
+import re
+import weakref
+from collections import defaultdict
+
+from sqlalchemy import column, event, func, literal_column
+from sqlalchemy.orm import scoped_session
+
+from models import db, Venue, Artist
+from pagination import KeysetPage, decode_cursor, keyset_paginate
+from readmodels import LISTINGS
+
+
+# Venue and artist search. On Postgres the match runs against GIN indexes (a weighted tsvector over
+# name/city/state for prefix matching plus a trigram index on name for partial words, see the
+# search_indexes migration) and rows are ordered by relevance. Other databases, i.e. SQLite in
+# tests, get an in-process inverted index that ranks the same way. Both return a KeysetPage of
+# listing rows (readmodels.LISTINGS) paged with a (-score, id) cursor plus the total number of
+# matches.
+
+FIELD_WEIGHTS = (('name', 3), ('city', 2), ('state', 1))
+
+_SCORE = column('score', db.Float)
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def search(model, term, after=None, before=None, per_page=50):
+    tokens = tokenize(term)
+    if db.engine.dialect.name == 'postgresql':
+        return _search_postgres(model, term, tokens, after, before, per_page)
+    return _inverted_index(model).search(tokens, after, before, per_page)
+
+
+#  Postgres
+#  ----------------------------------------------------------------
+
+def _document(model):
+    # Must stay identical to the indexed expression in migrations/versions/*_search_indexes.py.
+    simple = literal_column("'simple'")
+    parts = [func.setweight(func.to_tsvector(simple, func.coalesce(getattr(model, name), '')),
+                            literal_column("'%s'" % label))
+             for (name, _), label in zip(FIELD_WEIGHTS, 'ABC')]
+    return parts[0].op('||')(parts[1]).op('||')(parts[2])
+
+
+def _search_postgres(model, term, tokens, after, before, per_page):
+    projection = LISTINGS[model]
+    query = projection.query()
+    score = literal_column('0', db.Float)
+    if tokens:
+        # Every word has to match, each one as a prefix so that results narrow down while the user
+        # is typing ("san fran" -> San Francisco); the trigram match catches partial words.
+        tsquery = func.to_tsquery(literal_column("'simple'"), ' & '.join(t + ':*' for t in tokens))
+        document = _document(model)
+        query = query.filter(document.op('@@')(tsquery) | model.name.op('%')(term))
+        score = func.ts_rank(document, tsquery) + func.similarity(model.name, term)
+    total = query.with_entities(func.count(model.id)).scalar()
+
+    neg_score = (-score).label('score')
+    page = keyset_paginate(query.add_columns(neg_score), (neg_score, model.id), after, before, per_page,
+                           key=_row_key)
+    page.items = [projection.make(row[:-1]) for row in page.items]
+    return page, total
+
+
+def _row_key(row):
+    return [row.score, row.id]
+
+
+#  In-process inverted index
+#  ----------------------------------------------------------------
+
+class InvertedIndex:
+    def __init__(self, model):
+        self.model = model
+        self.postings = defaultdict(dict)  # token -> {id: field weight}
+        self.documents = {}  # id -> tokens, so a row can be removed again
+        self.tokens = []  # sorted, for prefix lookups
+
+    def load(self, session):
+        fields = [getattr(self.model, name) for name, _ in FIELD_WEIGHTS]
+        for row in session.query(self.model.id, *fields):
+            self.add(row[0], row[1:])
+        return self
+
+    def add(self, id, values):
+        self.remove(id)
+        weights = {}
+        for value, (_, weight) in zip(values, FIELD_WEIGHTS):
+            for token in tokenize(value):
+                weights[token] = max(weight, weights.get(token, 0))
+        for token, weight in weights.items():
+            if token not in self.postings:
+                bisect.insort(self.tokens, token)
+            self.postings[token][id] = weight
+        self.documents[id] = weights.keys()
+
+    def remove(self, id):
+        for token in self.documents.pop(id, ()):
+            postings = self.postings[token]
+            postings.pop(id, None)
+            if not postings:
+                del self.postings[token]
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def rank(self, tokens):
+        # Each query word scores the best field it appears in, doubled for a whole-word match;
+        # a document has to match every word.
+        scores = None
+        for query_token in tokens:
+            matches = {}
+            start = bisect.bisect_left(self.tokens, query_token)
+            for token in self.tokens[start:]:
+                if not token.startswith(query_token):
+                    break
+                factor = 2 if token == query_token else 1
+                for id, weight in self.postings[token].items():
+                    matches[id] = max(matches.get(id, 0), weight * factor)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {id: score + matches[id] for id, score in scores.items() if id in matches}
+            if not scores:
+                return []
+        if scores is None:
+            return sorted((0, id) for id in self.documents)
+        return sorted((-score, id) for id, score in scores.items())
+
+    def search(self, tokens, after, before, per_page):
+        ranked = self.rank(tokens)
+        columns = (_SCORE, self.model.id)
+        if before is not None:
+            end = bisect.bisect_left(ranked, tuple(decode_cursor(before, columns)))
+            start = max(end - per_page, 0)
+            window, has_next, has_prev = ranked[start:end], True, start > 0
+        else:
+            start = bisect.bisect_right(ranked, tuple(decode_cursor(after, columns))) if after is not None else 0
+            window = ranked[start:start + per_page]
+            has_next, has_prev = start + per_page < len(ranked), after is not None
+        page = KeysetPage(window, list, has_next=has_next, has_prev=has_prev)
+        if window:
+            projection = LISTINGS[self.model]
+            rows = {row.id: row for row in
+                    projection.all(projection.query().filter(self.model.id.in_([id for _, id in window])))}
+            page.items = [rows[id] for _, id in window if id in rows]
+        return page, len(ranked)
+
+
+# One index per engine and model, built on first use and then kept current from committed
+# sessions, so only writes made through this process are seen.
+_indexes = weakref.WeakKeyDictionary()
+_pending = weakref.WeakKeyDictionary()
+
+
+def _inverted_index(model):
+    engine = db.engine
+    indexes = _indexes.setdefault(engine, {})
+    if model not in indexes:
+        indexes[model] = InvertedIndex(model).load(db.session)
+    return indexes[model]
+
+
+@event.listens_for(db.Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = _pending.setdefault(session, [])
+    for instance in list(session.new) + list(session.dirty):
+        if isinstance(instance, (Venue, Artist)):
+            changes.append((type(instance), instance.id,
+                            [getattr(instance, name) for name, _ in FIELD_WEIGHTS]))
+    for instance in session.deleted:
+        if isinstance(instance, (Venue, Artist)):
+            changes.append((type(instance), instance.id, None))
+
+
+def index_on_commit(session, model, ids, rows):
+    # For writes the listener above cannot see, such as Core inserts: `rows` are the column values
+    # of the rows inserted with `ids`.
+    if isinstance(session, scoped_session):
+        session = session()
+    _pending.setdefault(session, []).extend(
+        (model, id, [row.get(name) for name, _ in FIELD_WEIGHTS]) for id, row in zip(ids, rows))
+
+
+@event.listens_for(db.Session, 'after_commit')
+def _apply_changes(session):
+    changes = _pending.pop(session, ())
+    if not changes:
+        return
+    indexes = _indexes.get(session.get_bind(), {})
+    for model, id, values in changes:
+        index = indexes.get(model)
+        if index is None:
+            continue
+        if values is None:
+            index.remove(id)
+        else:
+            index.add(id, values)
+
+
+@event.listens_for(db.Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    _pending.pop(session, None)
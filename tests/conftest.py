@@ -0,0 +1,90 @@
+import logging
+import types
+
+import pytest
+from sqlalchemy import event
+
+import config
+from app import create_app
+from models import db
+
+
+# Every test builds its own app on an in-memory SQLite database, with the page cache and the image
+# proxy off and CSRF checks disabled so forms can be posted as they are. `make_app(**settings)`
+# overrides any other setting.
+
+TEST_SETTINGS = {
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'SQLALCHEMY_REPLICA_URIS': [],
+    'TESTING': True,
+    'WTF_CSRF_ENABLED': False,
+    'PAGE_CACHE_ENABLED': False,
+    'IMAGE_PROXY_ENABLED': False,
+    'TEMPLATE_BYTECODE_DIR': None,
+}
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    # create_app() logs to error.log in the working directory.
+    monkeypatch.chdir(tmp_path)
+    logger = logging.getLogger('app')
+    handlers = list(logger.handlers)
+
+    def make(**settings):
+        values = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+        values.update(TEST_SETTINGS, **settings)
+        app = create_app(types.SimpleNamespace(**values))
+        with app.app_context():
+            db.create_all()
+        return app
+
+    yield make
+    for handler in logger.handlers[len(handlers):]:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class QueryCounter:
+    # Counts the statements sent to the app's database inside each `with` block.
+    def __init__(self, app):
+        with app.app_context():
+            self.engine = db.engine
+        self.count = 0
+
+    def _before_cursor_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+@pytest.fixture
+def queries(app):
+    return QueryCounter(app)
+
+
+@pytest.fixture
+def get(client):
+    # The response to a GET with its body read, so streamed pages run to completion.
+    def get(path, **kwargs):
+        response = client.get(path, **kwargs)
+        response.get_data()
+        response.close()
+        return response
+    return get
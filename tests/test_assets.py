@@ -0,0 +1,52 @@
+import gzip
+import re
+
+from flask import Flask, url_for
+
+from assets import IMMUTABLE, build, init_assets, minify_css
+
+
+# `flask assets build` output and the route that serves it, on a static folder of its own.
+
+def test_minified_css_keeps_strings_and_urls():
+    css = '''a  :hover { content: "a  /* b */" ; background: url("x  y.png") }  /* gone */
+    b::after { content: 'it\\'s  ;}' ; background : url( data:image/png;base64,AA  BB ) ; }
+    c > d , e { margin : 0/**/auto; }'''
+    assert minify_css(css) == ('a :hover{content:"a  /* b */";background:url("x  y.png")}'
+                               "b::after{content:'it\\'s  ;}';background :url( data:image/png;base64,AA  BB )}"
+                               'c>d,e{margin :0 auto}')
+
+
+def test_built_assets_are_served_immutable(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'img').mkdir()
+    (static / 'img' / 'logo.png').write_bytes(b'\x89PNG not really')
+    rules = ''.join('.item-%d { color: red ; }\n' % number for number in range(50))
+    (static / 'css' / 'main.css').write_text(
+        '/* site styles */\nh1 { content: "a  /* b */"; background: url("../img/logo.png") }\n' + rules)
+    manifest, _ = build(str(static))
+
+    app = Flask(__name__, static_folder=str(static))
+    init_assets(app)
+    client = app.test_client()
+    with app.test_request_context():
+        path = url_for('static', filename='css/main.css')
+    assert re.fullmatch(r'/static/dist/css/main\.[0-9a-f]{12}\.css', path)
+
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == IMMUTABLE
+    assert response.headers['Content-Type'].startswith('text/css')
+    assert 'Content-Encoding' not in response.headers
+    body = response.get_data(as_text=True)
+    assert body.startswith('h1{content:"a  /* b */";background:url("../%s")}' % manifest['img/logo.png'])
+    assert '.item-49{color:red}' in body
+
+    compressed = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Cache-Control'] == IMMUTABLE
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(compressed.get_data()).decode() == body
+
+    assert client.get('/static/dist/css/missing.css').status_code == 404
@@ -0,0 +1,121 @@
+from sqlalchemy.exc import DataError
+
+import bulk
+from models import db, Venue, Artist, Show
+
+
+# POST /api/<kind>:batch writes a whole batch or nothing, and a retry under the same Idempotency-Key
+# gets the stored response instead of a second copy of the batch.
+
+def venues(*names, city='Austin', state='TX'):
+    return [{'name': name, 'city': city, 'state': state, 'address': '1 Main St', 'genres': ['Jazz']}
+            for name in names]
+
+
+def count(app, model):
+    with app.app_context():
+        return model.query.count()
+
+
+def test_retries_are_replayed(app, client):
+    batch = venues('The Hall', 'The Club')
+    headers = {'Idempotency-Key': 'retry-1'}
+    response = client.post('/api/venues:batch', json=batch, headers=headers)
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    assert response.json == {'ids': [1, 2]}
+
+    retry = client.post('/api/venues:batch', json=batch, headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.json == response.json
+    assert count(app, Venue) == 2
+
+    other = client.post('/api/venues:batch', json=venues('The Bar'), headers=headers)
+    assert other.status_code == 422
+    assert other.json == {'errors': [{'idempotency_key': ['This key was used for a different batch.']}]}
+    assert count(app, Venue) == 2
+
+
+def test_failed_batches_write_nothing(app, client):
+    batch = venues('The Hall', '', 'The Hall')
+    headers = {'Idempotency-Key': 'fix-and-retry'}
+    response = client.post('/api/venues:batch', json=batch, headers=headers)
+    assert response.status_code == 422
+    assert [error['index'] for error in response.json['errors']] == [1, 2]
+    assert count(app, Venue) == 0
+
+    # A failed batch is not stored: the fixed one can go in under the same key.
+    response = client.post('/api/venues:batch', json=venues('The Hall', 'The Club'), headers=headers)
+    assert response.status_code == 201
+    assert count(app, Venue) == 2
+
+
+def test_double_bookings_are_rejected(app, client):
+    client.post('/api/venues:batch', json=venues('The Hall'))
+    client.post('/api/artists:batch', json=[{'name': name, 'city': 'Austin', 'state': 'TX', 'genres': ['Jazz']}
+                                            for name in ('Ann', 'Bob')])
+    shows = [{'venue_id': 1, 'artist_id': 1, 'start_time': '2030-01-01 20:00', 'duration': 60},
+             {'venue_id': 1, 'artist_id': 2, 'start_time': '2030-01-01 20:30', 'duration': 60}]
+    response = client.post('/api/shows:batch', json=shows)
+    assert response.status_code == 422
+    assert [error['index'] for error in response.json['errors']] == [0, 1]
+    assert count(app, Show) == 0
+
+    shows[1]['start_time'] = '2030-01-01 21:00'
+    assert client.post('/api/shows:batch', json=shows).status_code == 201
+    assert count(app, Show) == 2
+
+
+def test_batch_writes_reach_search_and_nearby(app, client, get):
+    client.post('/api/venues:batch', json=venues('Old Hall'))
+    # The in-process search index and location grid are built now, before the batch below.
+    assert b'Old Hall' in get('/venues/search?search_term=hall').data
+    assert [row['name'] for row in get('/venues/near.json?city=Austin&state=TX').json['results']] == ['Old Hall']
+
+    response = client.post('/api/venues:batch', json=venues('New Hall') + venues('Far Hall', city='Seattle',
+                                                                                   state='WA'))
+    assert response.status_code == 201
+    page = get('/venues/search?search_term=hall').data
+    assert b'Old Hall' in page and b'New Hall' in page and b'Far Hall' in page
+    near = get('/venues/near.json?city=Austin&state=TX').json['results']
+    assert sorted(row['name'] for row in near) == ['New Hall', 'Old Hall']
+    assert b'Rock Star' not in get('/artists/search?search_term=star').data
+    response = client.post('/api/artists:batch', json=[{'name': 'Rock Star', 'city': 'Austin', 'state': 'TX',
+                                                        'genres': ['Rock n Roll']}])
+    assert response.status_code == 201
+    assert b'Rock Star' in get('/artists/search?search_term=star').data
+
+
+def test_idempotency_keys_must_fit_their_column(app, client):
+    for key in ('', 'k' * 256):
+        response = client.post('/api/venues:batch', json=venues('The Hall'), headers={'Idempotency-Key': key})
+        assert response.status_code == 400
+    assert count(app, Venue) == 0
+    response = client.post('/api/venues:batch', json=venues('The Hall'), headers={'Idempotency-Key': 'k' * 255})
+    assert response.status_code == 201
+
+
+def test_values_the_columns_refuse_are_reported_by_record(app, client, monkeypatch):
+    # SQLite stores any length, so the VARCHAR(120) check of a server database is played here.
+    insert = bulk._insert
+
+    def checked_insert(session, table, rows):
+        for row in rows:
+            if len(row['address']) > 120:
+                raise DataError('INSERT', row, Exception('value too long for type character varying(120)'))
+        return insert(session, table, rows)
+    monkeypatch.setattr(bulk, '_insert', checked_insert)
+
+    batch = venues('The Hall', 'The Club', 'The Bar')
+    batch[1]['address'] = 'x' * 121
+    response = client.post('/api/venues:batch', json=batch, headers={'Idempotency-Key': 'long-address'})
+    assert response.status_code == 422
+    assert response.json == {'errors': [{'index': 1, 'errors': {
+        'database': ['value too long for type character varying(120)']}}]}
+    assert count(app, Venue) == 0
+
+    batch[1]['address'] = '2 Main St'
+    response = client.post('/api/venues:batch', json=batch, headers={'Idempotency-Key': 'long-address'})
+    assert response.status_code == 201
+    assert count(app, Venue) == 3
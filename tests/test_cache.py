@@ -0,0 +1,119 @@
+import fnmatch
+from datetime import datetime
+
+import pytest
+
+from cache import ObjectCache, SharedBackend
+from models import db, Venue, Artist, Show
+
+
+# The object cache over the redis-py API (SharedBackend): every write drops exactly the keys that
+# cache.affected_keys() names for it, once it is committed, and nothing when it is rolled back.
+
+class FakeRedis:
+    # The part of redis.Redis that SharedBackend uses. Expiry is recorded, not enforced.
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.expiry[key] = ex
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, match='*'):
+        return iter([key for key in self.data if fnmatch.fnmatchcase(key, match)])
+
+
+KEYS = ['index', 'shows', 'venues', 'artists', 'facets:venues', 'facets:artists',
+        'venue:1', 'venue:2', 'artist:1', 'artist:2']
+
+
+@pytest.fixture
+def redis(app):
+    client = FakeRedis()
+    app.extensions['object_cache'] = ObjectCache(SharedBackend(client, ttl=30))
+    with app.app_context():
+        db.session.add_all([Venue(name='The Hall', city='Austin', state='TX', address='1 Main St', genres=['Jazz']),
+                            Venue(name='The Club', city='Austin', state='TX', address='2 Main St', genres=['Jazz']),
+                            Artist(name='Ann', city='Austin', state='TX', genres=['Jazz']),
+                            Artist(name='Bob', city='Austin', state='TX', genres=['Jazz'])])
+        db.session.flush()
+        db.session.add(Show(venue_id=1, artist_id=1, show_time=datetime(2030, 1, 1, 20)))
+        db.session.commit()
+    return client
+
+
+def warm(app):
+    cache = app.extensions['object_cache']
+    for key in KEYS:
+        cache.backend.set(key, {'key': key})
+
+
+def dropped(app):
+    cache = app.extensions['object_cache']
+    return {key for key in KEYS if cache.backend.get(key) is None}
+
+
+def venue_form(name, **values):
+    return dict({'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St', 'phone': '',
+                 'genres': ['Jazz']}, **values)
+
+
+def artist_form(name, **values):
+    return dict({'name': name, 'city': 'Austin', 'state': 'TX', 'phone': '', 'genres': ['Jazz']}, **values)
+
+
+def test_snapshots_are_stored_and_read_back(app, redis, get):
+    assert b'The Hall' in get('/venues/1').data
+    assert redis.expiry == {'fyyur:venue:1': 30}
+    cache = app.extensions['object_cache']
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert b'The Hall' in get('/venues/1').data
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.clear()
+    assert redis.data == {}
+
+
+@pytest.mark.parametrize('method, path, data, keys', [
+    ('post', '/venues/create', venue_form('The Bar'), {'index', 'shows', 'venues', 'facets:venues'}),
+    ('post', '/venues/1/edit', venue_form('The Big Hall'),
+     {'index', 'shows', 'venues', 'facets:venues', 'venue:1', 'artist:1'}),
+    ('get', '/venues/delete/2', None, {'index', 'shows', 'venues', 'facets:venues', 'venue:2'}),
+    ('post', '/artists/create', artist_form('Cat'), {'index', 'shows', 'artists', 'facets:artists'}),
+    ('post', '/artists/1/edit', artist_form('Ann Lee'),
+     {'index', 'shows', 'artists', 'facets:artists', 'artist:1', 'venue:1'}),
+    ('post', '/shows/create', {'venue_id': '2', 'artist_id': '2', 'start_time': '2030-02-01 20:00:00'},
+     {'shows', 'venues', 'venue:2', 'artist:2'}),
+], ids=['create venue', 'edit venue', 'delete venue', 'create artist', 'edit artist', 'create show'])
+def test_writes_drop_their_keys(app, redis, client, method, path, data, keys):
+    warm(app)
+    response = getattr(client, method)(path, data=data)
+    assert response.status_code == 302
+    assert dropped(app) == keys
+
+
+def test_deleting_an_artist_drops_its_keys(app, redis):
+    warm(app)
+    with app.app_context():
+        db.session.delete(Artist.query.get(2))
+        db.session.commit()
+    assert dropped(app) == {'index', 'shows', 'artists', 'facets:artists', 'artist:2'}
+
+
+def test_rollbacks_drop_nothing(app, redis):
+    warm(app)
+    with app.app_context():
+        Venue.query.get(1).name = 'Renamed'
+        db.session.add(Artist(name='Cat', city='Austin', state='TX', genres=['Jazz']))
+        db.session.flush()
+        db.session.rollback()
+        # The keys collected for the rolled back flush are not carried into the next commit.
+        db.session.commit()
+    assert dropped(app) == set()
@@ -0,0 +1,60 @@
+import pytest
+
+from models import db, Venue, Artist
+
+
+# Browse caches its facet counts (and, with the page cache on, the whole page); every way of writing
+# venues and artists must make the next browse count them.
+
+def add_listings(app):
+    with app.app_context():
+        db.session.add_all([Venue(name='Venue %d' % i, city='Austin', state='TX', genres=['Jazz']) for i in range(3)] +
+                           [Artist(name='Artist %d' % i, city='Austin', state='TX', genres=['Rock']) for i in range(2)])
+        db.session.commit()
+
+
+def facets(get, kind, query=''):
+    response = get('/%s/browse.json%s' % (kind, query))
+    assert response.status_code == 200
+    return response.json['facets']
+
+
+@pytest.fixture(params=[False, True], ids=['object cache', 'page cache'])
+def app(make_app, request):
+    return make_app(PAGE_CACHE_ENABLED=request.param)
+
+
+def test_counts_follow_the_forms(app, client, get):
+    add_listings(app)
+    assert facets(get, 'venues') == {'total': 3, 'genre': {'Jazz': 3}, 'state': {'TX': 3}, 'seeking': 0}
+    assert facets(get, 'venues', '?genre=Jazz')['total'] == 3
+
+    response = client.post('/venues/create', data={
+        'name': 'The Hall', 'city': 'Seattle', 'state': 'WA', 'address': '1 Main St', 'phone': '',
+        'genres': ['Jazz', 'Blues'], 'seeking_talent': 'y'})
+    assert response.status_code == 302
+    assert facets(get, 'venues') == {'total': 4, 'genre': {'Jazz': 4, 'Blues': 1}, 'state': {'TX': 3, 'WA': 1},
+                                     'seeking': 1}
+    assert facets(get, 'venues', '?genre=Jazz')['total'] == 4
+
+    with app.app_context():
+        venue_id = Venue.query.filter_by(name='Venue 0').one().id
+    client.get('/venues/delete/%d' % venue_id)
+    assert facets(get, 'venues')['state'] == {'TX': 2, 'WA': 1}
+    assert facets(get, 'venues', '?genre=Jazz')['total'] == 3
+    # The artist counts were not touched.
+    assert facets(get, 'artists') == {'total': 2, 'genre': {'Rock': 2}, 'state': {'TX': 2}, 'seeking': 0}
+
+
+def test_counts_follow_batch_writes(app, client, get):
+    add_listings(app)
+    assert facets(get, 'artists', '?state=TX')['genre'] == {'Rock': 2}
+
+    response = client.post('/api/artists:batch', json=[
+        {'name': 'New %d' % i, 'city': 'Austin', 'state': 'TX', 'genres': ['Folk']} for i in range(2)])
+    assert response.status_code == 201
+    counts = facets(get, 'artists', '?state=TX')
+    assert counts['total'] == 4
+    assert counts['genre'] == {'Rock': 2, 'Folk': 2}
+    # The venue counts were not touched.
+    assert facets(get, 'venues')['total'] == 3
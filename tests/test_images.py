@@ -0,0 +1,193 @@
+import http.server
+import os
+import socket
+import threading
+from collections import Counter
+
+import pytest
+from itsdangerous import URLSafeSerializer
+
+import images
+from images import FetchError, ImageCache, fetch
+from models import db, Venue
+
+
+# The image proxy against an http.server origin on 127.0.0.1, which the proxy only fetches from with
+# IMAGE_FETCH_PRIVATE on. Clients that do not name WebP get JPEG, or (without Pillow) the GIF as it is.
+
+PIXEL = bytes.fromhex('47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b')
+JPEG = {'Accept': 'image/png,image/*;q=0.8'}
+
+
+class Origin(http.server.BaseHTTPRequestHandler):
+    # /a.gif and /b.gif are the same image, /broken.gif fails, /to/<host> redirects to <host>/a.gif.
+    hits = None
+
+    def do_GET(self):
+        self.hits[self.path] += 1
+        if self.path in ('/a.gif', '/b.gif'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/gif')
+            self.send_header('Content-Length', str(len(PIXEL)))
+            self.end_headers()
+            self.wfile.write(PIXEL)
+        elif self.path.startswith('/to/'):
+            self.send_response(302)
+            self.send_header('Location', 'http://%s/a.gif' % self.path[len('/to/'):])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_error(500)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def origin():
+    handler = type('Handler', (Origin,), {'hits': Counter()})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    server.url = 'http://127.0.0.1:%d' % server.server_address[1]
+    server.hits = handler.hits
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_proxy_app(make_app, tmp_path):
+    def make(**settings):
+        values = dict(IMAGE_PROXY_ENABLED=True, IMAGE_PROXY_SECRET='test-secret', IMAGE_FETCH_PRIVATE=True,
+                      IMAGE_CACHE_DIR=str(tmp_path / 'images'), IMAGE_FETCH_WAIT=5)
+        values.update(settings)
+        return make_app(**values)
+    return make
+
+
+def proxied(app, url, size='tile'):
+    return '/images/%s/%s' % (size, app.extensions['images'].signer.dumps(url))
+
+
+def variants(app):
+    return os.listdir(app.extensions['images'].cache.variants)
+
+
+def test_images_are_fetched_once_and_stored_by_content(make_proxy_app, origin):
+    app = make_proxy_app()
+    client = app.test_client()
+    first = client.get(proxied(app, origin.url + '/a.gif'), headers=JPEG)
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert first.headers['Vary'] == 'Accept'
+
+    again = client.get(proxied(app, origin.url + '/a.gif'), headers=JPEG)
+    assert again.status_code == 200
+    assert again.get_data() == first.get_data()
+    assert origin.hits['/a.gif'] == 1
+
+    # Another link to the same bytes is fetched, but shares the stored variant.
+    other = client.get(proxied(app, origin.url + '/b.gif'), headers=JPEG)
+    assert other.status_code == 200
+    assert other.headers['ETag'] == first.headers['ETag']
+    assert origin.hits['/b.gif'] == 1
+    assert len(variants(app)) == 1
+
+
+def test_unsigned_links_are_not_fetched(make_proxy_app, origin):
+    app = make_proxy_app()
+    client = app.test_client()
+    forged = URLSafeSerializer('another-secret', salt=images.TOKEN_SALT).dumps(origin.url + '/a.gif')
+    for path in ('/images/tile/' + forged, '/images/tile/not-a-token', proxied(app, origin.url + '/a.gif', 'huge')):
+        assert client.get(path).status_code == 404
+    assert origin.hits == {}
+
+
+def test_failed_images_redirect_to_the_original(make_proxy_app, origin):
+    app = make_proxy_app()
+    client = app.test_client()
+    url = origin.url + '/broken.gif'
+    for _ in range(2):
+        response = client.get(proxied(app, url))
+        assert response.status_code == 307
+        assert response.headers['Location'] == url
+        assert response.headers['Cache-Control'] == 'no-store'
+    # The failure is remembered for IMAGE_FAILURE_TTL.
+    assert origin.hits['/broken.gif'] == 1
+    assert variants(app) == []
+
+
+def test_private_origins_are_refused(make_proxy_app, origin):
+    app = make_proxy_app(IMAGE_FETCH_PRIVATE=False)
+    url = origin.url + '/a.gif'
+    response = app.test_client().get(proxied(app, url))
+    assert response.status_code == 307
+    assert response.headers['Location'] == url
+    assert origin.hits == {}
+
+    with pytest.raises(FetchError, match='private address'):
+        fetch(url)
+    assert fetch(url, allow_private=True) == (PIXEL, 'image/gif')
+
+
+class FakeDNS:
+    # images.socket with public.example on a public address that is really the origin, and
+    # private.example on a private one.
+    IPPROTO_TCP = socket.IPPROTO_TCP
+    PUBLIC = '93.184.216.34'
+
+    def __init__(self, port):
+        self.port = port
+
+    def getaddrinfo(self, host, port, proto=0):
+        address = {'public.example': self.PUBLIC, 'private.example': '10.0.0.5'}[host]
+        return [(None, None, proto, '', (address, port))]
+
+    def create_connection(self, address, timeout=None):
+        assert address[0] == self.PUBLIC
+        return socket.create_connection(('127.0.0.1', self.port), timeout)
+
+
+def test_redirects_to_private_origins_are_refused(origin, monkeypatch):
+    port = origin.server_address[1]
+    monkeypatch.setattr(images, 'socket', FakeDNS(port))
+    assert fetch('http://public.example:%d/a.gif' % port) == (PIXEL, 'image/gif')
+    with pytest.raises(FetchError, match='private.example resolves to a private address'):
+        fetch('http://public.example:%d/to/private.example' % port)
+    assert origin.hits['/to/private.example'] == 1
+
+
+def test_the_cache_is_pruned_back_under_its_bound(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=2500)
+    names = [cache.put('link-%d' % number, bytes([number]) * 1000, 'gif') for number in range(2)]
+    # The second variant was served more recently than the first.
+    os.utime(os.path.join(cache.variants, names[0]), (1, 1))
+    assert cache.size == 2000
+
+    names.append(cache.put('link-2', b'\2' * 1000, 'gif'))
+    assert cache.size <= 2500 * 0.9
+    assert sorted(os.listdir(cache.variants)) == sorted(names[1:])
+    assert cache.get('link-0') is None
+    assert sorted(os.listdir(cache.links)) == ['link-1', 'link-2']
+    assert ImageCache(str(tmp_path), max_bytes=2500).size == cache.size
+
+
+def test_the_proxy_is_off_without_a_secret(make_proxy_app):
+    # The page with the proxy on queues the image, which is refused without a connection.
+    image = 'http://10.0.0.5/hall.jpg'
+    app = make_proxy_app(IMAGE_PROXY_SECRET=None)
+    assert 'images' not in app.extensions
+    with app.app_context():
+        db.session.add(Venue(name='The Hall', city='Austin', state='TX', genres=['Jazz'], image_link=image))
+        db.session.commit()
+    client = app.test_client()
+    page = client.get('/venues/1').get_data(as_text=True)
+    assert image in page
+    assert '/images/' not in page
+    assert client.get('/images/tile/anything').status_code == 404
+
+    app = make_proxy_app(IMAGE_FETCH_PRIVATE=False)
+    with app.app_context():
+        db.session.add(Venue(name='The Hall', city='Austin', state='TX', genres=['Jazz'], image_link=image))
+        db.session.commit()
+    assert '/images/' in app.test_client().get('/venues/1').get_data(as_text=True)
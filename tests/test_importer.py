@@ -0,0 +1,140 @@
+import json
+
+import pytest
+from sqlalchemy import event
+
+from importer import import_file
+from models import db, Venue, Show
+
+
+# `flask import` writes the valid rows of a file in chunks and reports every other line, whatever is
+# wrong with it, without stopping.
+
+def venue(name, **values):
+    return dict({'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St', 'genres': ['Jazz']}, **values)
+
+
+def write_jsonl(path, rows):
+    # `rows` are dicts, or bytes written as the line they are.
+    with open(path, 'wb') as file:
+        for row in rows:
+            file.write((row if isinstance(row, bytes) else json.dumps(row).encode()) + b'\n')
+    return str(path)
+
+
+def run_import(app, kind, path, batch_size=5000):
+    errors = []
+    with app.app_context():
+        result = import_file(kind, path, batch_size=batch_size,
+                             on_error=lambda number, problems: errors.append((number, problems)))
+    return result, dict(errors)
+
+
+def names(app, model):
+    with app.app_context():
+        return sorted(name for name, in db.session.query(model.name))
+
+
+@pytest.fixture
+def inserts(app):
+    # The number of INSERT statements sent, i.e. of chunks written.
+    with app.app_context():
+        engine = db.engine
+    counter = {'count': 0}
+
+    def count(connection, cursor, statement, *args):
+        if statement.startswith('INSERT'):
+            counter['count'] += 1
+    event.listen(engine, 'before_cursor_execute', count)
+    yield counter
+    event.remove(engine, 'before_cursor_execute', count)
+
+
+def test_rows_are_written_in_chunks(app, tmp_path, inserts):
+    path = write_jsonl(tmp_path / 'venues.jsonl', [venue('Venue %d' % i) for i in range(5)])
+    result, errors = run_import(app, 'venues', path, batch_size=2)
+    assert (result.inserted, result.rejected, errors) == (5, 0, {})
+    assert inserts['count'] == 3
+    assert names(app, Venue) == ['Venue %d' % i for i in range(5)]
+
+
+def test_invalid_rows_are_reported(app, tmp_path):
+    path = write_jsonl(tmp_path / 'venues.jsonl', [
+        venue('Good'),
+        venue('', city='Austin'),
+        venue('Bad State', state='XX'),
+        venue('Good'),
+    ])
+    result, errors = run_import(app, 'venues', path)
+    assert (result.inserted, result.rejected) == (1, 3)
+    assert errors == {2: {'name': ['This field is required.']},
+                      3: {'state': ['Not a valid choice.']},
+                      4: {'name': ['A record with this name already exists.']}}
+    assert names(app, Venue) == ['Good']
+
+
+def test_malformed_lines_do_not_stop_the_import(app, tmp_path):
+    path = write_jsonl(tmp_path / 'venues.jsonl', [
+        venue('First'),
+        b'{"name": "Broken", ',
+        b'[1, 2]',
+        b'"a string"',
+        json.dumps(venue('Caf\xe9'), ensure_ascii=False).encode('latin-1'),
+        venue('Last'),
+    ])
+    result, errors = run_import(app, 'venues', path, batch_size=1)
+    assert (result.inserted, result.rejected) == (2, 4)
+    assert errors == {2: {'row': ["Not valid JSON: Expecting property name enclosed in double quotes."]},
+                      3: {'row': ['Each line must be a JSON object.']},
+                      4: {'row': ['Each line must be a JSON object.']},
+                      5: {'row': ['The line is not valid UTF-8.']}}
+    assert names(app, Venue) == ['First', 'Last']
+
+
+def test_malformed_csv_rows_do_not_stop_the_import(app, tmp_path):
+    path = tmp_path / 'venues.csv'
+    path.write_bytes(b'name,city,state,address,genres\n'
+                     b'First,Austin,TX,1 Main St,Jazz;Blues\n'
+                     b'Caf\xe9,Austin,TX,1 Main St,Jazz\n'
+                     b'"' + b'x' * 200000 + b'",Austin,TX,1 Main St,Jazz\n'
+                     b'Last,Austin,TX,1 Main St,Jazz\n')
+    result, errors = run_import(app, 'venues', str(path))
+    assert (result.inserted, result.rejected) == (2, 2)
+    assert errors == {3: {'row': ['The line is not valid UTF-8.']},
+                      4: {'row': ['field larger than field limit (131072)']}}
+    assert names(app, Venue) == ['First', 'Last']
+    with app.app_context():
+        assert Venue.query.filter_by(name='First').one().genres == ['Jazz', 'Blues']
+
+
+def test_importing_again_changes_nothing(app, tmp_path):
+    venues = write_jsonl(tmp_path / 'venues.jsonl', [venue('The Hall'), venue('The Club')])
+    artists = write_jsonl(tmp_path / 'artists.jsonl', [{'name': 'Ann', 'city': 'Austin', 'state': 'TX',
+                                                        'genres': ['Jazz']}])
+    shows = write_jsonl(tmp_path / 'shows.jsonl', [
+        {'venue': 'The Hall', 'artist': 'Ann', 'start_time': '2030-01-01 20:00'},
+        {'venue': 'The Club', 'artist': 'Ann', 'start_time': '2030-01-02 20:00'},
+    ])
+    for kind, path in (('venues', venues), ('artists', artists), ('shows', shows)):
+        assert run_import(app, kind, path)[0].inserted > 0
+
+    result, errors = run_import(app, 'venues', venues)
+    assert (result.inserted, result.rejected) == (0, 2)
+    assert errors[1] == {'name': ['A record with this name already exists.']}
+    # The same shows again would double-book the artist.
+    result, errors = run_import(app, 'shows', shows)
+    assert (result.inserted, result.rejected) == (0, 2)
+    assert set(errors[1]) == {'venue_id', 'artist_id'}
+    assert names(app, Venue) == ['The Club', 'The Hall']
+    with app.app_context():
+        assert Show.query.count() == 2
+
+
+def test_import_command(app, tmp_path):
+    path = write_jsonl(tmp_path / 'venues.jsonl', [venue('The Hall'), b'not json', venue('The Club')])
+    errors_path = tmp_path / 'rejected.jsonl'
+    result = app.test_cli_runner().invoke(args=['import', 'venues', path, '--errors', str(errors_path)])
+    assert result.exit_code == 1
+    assert 'venues: 2 imported, 1 rejected' in result.output
+    assert [json.loads(line)['line'] for line in errors_path.read_text().splitlines()] == [2]
+    assert names(app, Venue) == ['The Club', 'The Hall']
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm import configure_mappers
+
+from models import db, Venue, Artist, Show
+from readmodels import ARTIST_CARD, VENUE_CARD, VENUE_LISTING, latest
+from views.aio import _shows_of
+from views.common import VENUE_ORDER
+
+
+# The hot queries must be served by the indexes declared in models.py (and created by the
+# migrations), including their ORDER BY: checked against SQLite's EXPLAIN QUERY PLAN.
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    # Show.venue and Show.artist are backrefs, set up once the mappers are configured.
+    configure_mappers()
+    with app.app_context():
+        yield
+
+
+def query_plan(statement):
+    compiled = statement.compile(dialect=db.engine.dialect)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), parameters)
+    return [row[-1] for row in rows]
+
+
+def assert_uses(plan, *uses):
+    # Every table is read through an index, in the order the query asks for.
+    for use in uses:
+        assert any(use in step for step in plan), plan
+    for step in plan:
+        assert 'USING' in step and 'TEMP B-TREE' not in step, plan
+
+
+@pytest.mark.parametrize('upcoming', [True, False])
+@pytest.mark.parametrize('owner, other, index', [
+    ('venue_id', 'artist', 'ix_shows_venue_id_show_time'),
+    ('artist_id', 'venue', 'ix_shows_artist_id_show_time'),
+])
+def test_upcoming_and_past_shows_use_the_composite_indexes(owner, other, index, upcoming):
+    statement = _shows_of(getattr(Show, owner) == 1, getattr(Show, other), datetime.utcnow(), upcoming)
+    search = 'SEARCH shows USING INDEX %s (%s=? AND show_time%s?)' % (index, owner, '>' if upcoming else '<')
+    assert_uses(query_plan(statement), search)
+
+
+def test_detail_pages_find_their_shows_by_index():
+    venue = Venue.query.options(db.joinedload(Venue.shows).joinedload(Show.artist)).filter(Venue.id == 1)
+    assert_uses(query_plan(venue.statement), 'USING INDEX ix_shows_venue_id_show_time (venue_id=?)')
+    artist = Artist.query.options(db.joinedload(Artist.shows).joinedload(Show.venue)).filter(Artist.id == 1)
+    assert_uses(query_plan(artist.statement), 'USING INDEX ix_shows_artist_id_show_time (artist_id=?)')
+
+
+def test_listings_are_read_in_index_order():
+    assert_uses(query_plan(latest(VENUE_CARD.select(), Venue)), 'SCAN venues USING INDEX ix_venues_date_created')
+    assert_uses(query_plan(latest(ARTIST_CARD.select(), Artist)), 'SCAN artists USING INDEX ix_artists_date_created')
+    assert_uses(query_plan(VENUE_LISTING.select().order_by(*VENUE_ORDER)),
+                'SCAN venues USING INDEX ix_venues_state_city_id')
+    assert_uses(query_plan(Show.query.order_by(Show.show_time, Show.id).statement),
+                'SCAN shows USING INDEX ix_shows_show_time_id')
@@ -0,0 +1,65 @@
+import json
+import logging
+
+import pytest
+
+from instrumentation import slow_log
+
+
+# /metrics is only served to scrapers holding METRICS_TOKEN, and the slow request log keeps the
+# names of the query args but not their values.
+
+@pytest.mark.parametrize('token, authorization', [
+    (None, None),
+    (None, 'Bearer '),
+    ('scrape-me', None),
+    ('scrape-me', 'scrape-me'),
+    ('scrape-me', 'Bearer scrape-you'),
+])
+def test_metrics_need_the_token(make_app, token, authorization):
+    app = make_app(METRICS_TOKEN=token)
+    headers = {'Authorization': authorization} if authorization else {}
+    assert app.test_client().get('/metrics', headers=headers).status_code == 404
+
+
+def test_metrics_are_served_with_the_token(make_app):
+    app = make_app(METRICS_TOKEN='scrape-me')
+    client = app.test_client()
+    client.get('/venues').close()
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200
+    assert 'fyyur_requests_total{endpoint="venues.venues",method="GET",status="200"} 1' in response.get_data(
+        as_text=True)
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+@pytest.fixture
+def slow_requests():
+    handler = Records()
+    level = slow_log.level
+    slow_log.addHandler(handler)
+    slow_log.setLevel(logging.INFO)
+    yield handler.records
+    slow_log.removeHandler(handler)
+    slow_log.setLevel(level)
+
+
+def test_slow_requests_are_logged_without_arg_values(make_app, slow_requests):
+    app = make_app(SLOW_REQUEST_MS=0)
+    client = app.test_client()
+    client.get('/venues/search?search_term=private+words&token=abc123&token=def456').close()
+    client.get('/artists?utm_source=mail').close()
+    assert [(record['path'], record['args'], record['endpoint']) for record in slow_requests] == [
+        ('/venues/search', ['search_term', 'token'], 'venues.search_venues'),
+        ('/artists', ['utm_source'], 'artists.artists'),
+    ]
+    logged = json.dumps(slow_requests)
+    assert 'private' not in logged and 'abc123' not in logged and 'mail' not in logged
@@ -0,0 +1,95 @@
+import re
+
+import pytest
+
+import views.venues
+from models import db, Venue, Artist
+
+
+# The full-page cache: conditional GETs, streamed listings, the query args that make a page, and
+# purges through the surrogate keys of the pages, including one that arrives while a page renders.
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(PAGE_CACHE_ENABLED=True)
+    with app.app_context():
+        db.session.add_all([Venue(name='The Hall', city='Austin', state='TX', address='1 Main St', genres=['Jazz']),
+                            Venue(name='The Club', city='Austin', state='TX', address='2 Main St', genres=['Jazz']),
+                            Artist(name='Ann', city='Austin', state='TX', genres=['Jazz'])])
+        db.session.commit()
+    return app
+
+
+def entries(app):
+    return len(app.extensions['page_cache'].pages)
+
+
+def test_current_pages_are_not_sent_again(client, get):
+    first = get('/venues/1')
+    assert first.headers['X-Cache'] == 'MISS'
+    etag = first.headers['ETag']
+
+    for status in ('HIT', 'HIT'):
+        response = get('/venues/1', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['X-Cache'] == status
+        assert response.data == b''
+    assert get('/venues/1', headers={'If-None-Match': '"stale"'}).data == first.data
+
+
+def test_streamed_pages_are_cached_once_sent_in_full(app, client, get):
+    response = client.get('/artists')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert 'ETag' not in response.headers
+    next(iter(response.response))
+    response.close()
+    # A page that was not sent in full is not stored.
+    assert entries(app) == 0
+
+    body = get('/artists').data
+    assert entries(app) == 1
+    hit = get('/artists')
+    assert hit.headers['X-Cache'] == 'HIT'
+    assert hit.data == body
+    assert hit.headers['ETag']
+
+
+def test_only_the_args_a_page_reads_make_a_new_entry(app, get):
+    app.config['PAGE_SIZE'] = 1
+    first = get('/venues')
+    assert first.headers['X-Cache'] == 'MISS'
+    assert get('/venues?utm_source=mail&sort=name').headers['X-Cache'] == 'HIT'
+    assert entries(app) == 1
+    after = re.search(r'after=([^"&]+)', first.get_data(as_text=True)).group(1)
+    assert get('/venues?after=%s&utm_source=mail' % after).headers['X-Cache'] == 'MISS'
+    assert get('/venues?utm_source=feed&after=%s' % after).headers['X-Cache'] == 'HIT'
+    assert entries(app) == 2
+
+
+def test_an_edit_purges_the_pages_showing_the_venue(app, client, get):
+    pages = ['/', '/venues', '/venues/1', '/venues/2', '/artists', '/artists/1']
+    for path in pages:
+        get(path)
+    assert [get(path).headers['X-Cache'] for path in pages] == ['HIT'] * len(pages)
+
+    response = client.post('/venues/1/edit', data={'name': 'The Big Hall', 'city': 'Austin', 'state': 'TX',
+                                                   'address': '1 Main St', 'phone': '', 'genres': ['Jazz']})
+    assert response.status_code == 302
+    assert [get(path).headers['X-Cache'] for path in pages] == ['MISS', 'MISS', 'MISS', 'HIT', 'HIT', 'HIT']
+    assert b'The Big Hall' in get('/venues/1').data
+
+
+def test_a_purge_while_rendering_leaves_the_page_stale(app, get, monkeypatch):
+    cached_venue = views.venues.cached_venue
+
+    def purged_meanwhile(venue_id):
+        # A commit from another request lands after the page took its key versions.
+        app.extensions['page_cache'].purge('venue:%s' % venue_id)
+        return cached_venue(venue_id)
+    monkeypatch.setattr(views.venues, 'cached_venue', purged_meanwhile)
+    assert get('/venues/1').headers['X-Cache'] == 'MISS'
+    assert get('/venues/1').headers['X-Cache'] == 'MISS'
+
+    monkeypatch.setattr(views.venues, 'cached_venue', cached_venue)
+    assert get('/venues/1').headers['X-Cache'] == 'MISS'
+    assert get('/venues/1').headers['X-Cache'] == 'HIT'
@@ -0,0 +1,68 @@
+import html
+import re
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Venue, Artist
+
+
+# Listings are paged with a keyset cursor over their sort key, which a NULL would break: the rows
+# after it compare as neither before nor after the cursor and never show up. Names may be NULL and
+# are sorted as ''; venue cities, part of the /venues key, may not be NULL at all.
+
+NAMES = ['Bob', None, 'Ann', None, 'Cat', 'Dan', None]
+
+
+@pytest.fixture
+def app(make_app, request):
+    app = make_app(PAGE_SIZE=2, STREAM_TEMPLATES=getattr(request, 'param', True))
+    with app.app_context():
+        db.session.add_all([Artist(name=name, city='Austin', state='TX', genres=['Jazz']) for name in NAMES] +
+                           [Venue(name=name, city='Austin', state='TX', genres=['Jazz']) for name in NAMES])
+        db.session.commit()
+    return app
+
+
+def walk(get, path, link):
+    # The artist ids on every page reached from `path` by following the `link` ("next"/"previous"),
+    # and the path of the last of those pages.
+    pages = []
+    while True:
+        page = get(path).get_data(as_text=True)
+        pages.append([int(id) for id in re.findall(r'href="/artists/(\d+)"', page)])
+        found = re.search(r'<li class="%s"><a href="([^"]+)"' % link, page)
+        if not found:
+            return pages, path
+        path = html.unescape(found.group(1))
+
+
+# Ids in name order, the NULL names first as ''.
+BY_NAME = [2, 4, 7, 3, 1, 5, 6]
+
+
+@pytest.mark.parametrize('app', [True, False], ids=['streamed', 'buffered'], indirect=True)
+def test_artists_with_null_names_are_on_the_pages(app, get):
+    pages, last = walk(get, '/artists', 'next')
+    assert pages == [BY_NAME[0:2], BY_NAME[2:4], BY_NAME[4:6], BY_NAME[6:]]
+    pages, _ = walk(get, last, 'previous')
+    assert pages == [BY_NAME[6:], BY_NAME[4:6], BY_NAME[2:4], BY_NAME[0:2]]
+
+
+def test_browse_pages_through_null_names(get):
+    ids, cursor = [], None
+    while True:
+        response = get('/venues/browse.json' + ('?after=%s' % cursor if cursor else ''))
+        ids.extend(row['id'] for row in response.json['results'])
+        assert all(row['name'] is not None for row in response.json['results'])
+        cursor = response.json['next']
+        if cursor is None:
+            break
+    assert ids == BY_NAME
+
+
+def test_venue_cities_are_required(app):
+    with app.app_context():
+        db.session.add(Venue(name='Nowhere Hall', city=None, state='TX'))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Venue, Artist, Show
+
+
+# Queries per request must not grow with the data: these run each page against small and larger
+# databases and pin the number of statements it sends.
+
+CITIES = [('Austin', 'TX'), ('Seattle', 'WA'), ('New York', 'NY'), ('San Francisco', 'CA')]
+
+
+def generate(app, shows):
+    # A venue and an artist for every ten shows, spread over a few cities, and `shows` shows between
+    # them, half of them past.
+    with app.app_context():
+        count = shows // 10
+        venues = [Venue(name='The Hall %d' % i, city=city, state=state, genres=['Jazz'])
+                  for i, (city, state) in zip(range(count), CITIES * count)]
+        artists = [Artist(name='The Band %d' % i, city=city, state=state, genres=['Jazz'])
+                   for i, (city, state) in zip(range(count), CITIES * count)]
+        db.session.add_all(venues + artists)
+        db.session.flush()
+        now = datetime.utcnow()
+        db.session.add_all(Show(venue_id=venues[i % count].id, artist_id=artists[i * 7 % count].id,
+                                show_time=now + timedelta(hours=i - shows // 2)) for i in range(shows))
+        db.session.commit()
+
+
+def booked_venue(app, shows):
+    # A venue with `shows` shows, half of them past, each by another artist. Returns the venue id
+    # and the id of one of the artists.
+    with app.app_context():
+        venue = Venue(name='The Hall', city='Austin', state='TX', address='1 Main St', genres=['Jazz'])
+        artists = [Artist(name='Artist %d' % i, city='Austin', state='TX', genres=['Jazz']) for i in range(shows)]
+        db.session.add_all([venue] + artists)
+        db.session.flush()
+        now = datetime.utcnow()
+        db.session.add_all(Show(venue_id=venue.id, artist_id=artist.id, show_time=now + timedelta(days=i - shows // 2))
+                           for i, artist in enumerate(artists))
+        db.session.commit()
+        return venue.id, artists[0].id
+
+
+@pytest.mark.parametrize('shows', [100, 1000])
+def test_venue_listing_is_one_query(app, get, queries, shows):
+    generate(app, shows)
+    with queries:
+        response = get('/venues')
+    assert response.status_code == 200
+    assert response.data.count(b'The Hall ') == min(shows // 10, app.config['PAGE_SIZE'])
+    assert queries.count == 1
+
+
+@pytest.mark.parametrize('shows', [3, 30])
+def test_detail_pages_are_one_query(app, get, queries, shows):
+    venue_id, artist_id = booked_venue(app, shows)
+    with queries:
+        response = get('/venues/%d' % venue_id)
+    assert response.status_code == 200
+    assert response.data.count(b'Artist ') >= shows
+    assert queries.count == 1
+
+    with queries:
+        response = get('/artists/%d' % artist_id)
+    assert response.status_code == 200
+    assert b'The Hall' in response.data
+    assert queries.count == 1
+
+    # From then on the page is served from the object cache.
+    with queries:
+        get('/venues/%d' % venue_id)
+    assert queries.count == 0
+
+
+# Statements per page with cold caches, in this order (a search builds the in-process index once,
+# browse caches its facet counts).
+ROUTE_QUERIES = {
+    '/': 2,
+    '/venues': 1,
+    '/artists': 1,
+    '/shows': 1,
+    '/venues/5': 1,
+    '/artists/5': 1,
+    '/venues/search?search_term=hall': 2,
+    '/artists/search?search_term=the': 2,
+    '/venues/browse?genre=Jazz': 2,
+    '/artists/browse.json?state=TX': 2,
+    '/venues/near?city=Austin&state=TX': 2,
+    '/shows/create': 0,
+    '/venues.csv': 1,
+    '/shows.jsonl': 1,
+}
+
+
+@pytest.mark.parametrize('shows', [100, 1000])
+def test_queries_per_route(app, get, queries, shows):
+    generate(app, shows)
+    counts = {}
+    for path in ROUTE_QUERIES:
+        with queries:
+            response = get(path)
+        assert response.status_code == 200, path
+        counts[path] = queries.count
+    assert counts == ROUTE_QUERIES
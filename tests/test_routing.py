@@ -0,0 +1,100 @@
+import pytest
+from sqlalchemy import text
+
+import routing
+from models import db, Venue
+
+
+# Read-only views read from the replica and everything else writes to the primary. Here the two are
+# SQLite files holding different venues, so every page shows which one it was read from.
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1000000.0)
+    monkeypatch.setattr(routing, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def make_routed_app(make_app, tmp_path, clock):
+    def make(**settings):
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'primary.db'),
+                       SQLALCHEMY_REPLICA_URIS=['sqlite:///%s' % (tmp_path / 'replica.db')],
+                       REPLICA_STICKY_SECONDS=5, **settings)
+        with app.app_context():
+            replica = db.get_engine(app, bind='replica0')
+            db.Model.metadata.create_all(replica)
+            db.session.add(Venue(name='Primary Hall', city='Austin', state='TX', genres=['Jazz']))
+            db.session.commit()
+            with replica.begin() as connection:
+                connection.execute(Venue.__table__.insert(), {'name': 'Replica Hall', 'city': 'Austin',
+                                                              'state': 'TX', 'genres': ['Jazz']})
+        return app
+    return make
+
+
+def create_venue(client, name):
+    response = client.post('/venues/create', data={'name': name, 'city': 'Austin', 'state': 'TX',
+                                                   'address': '1 Main St', 'phone': '', 'genres': ['Jazz']})
+    assert response.status_code == 302
+    # Show the flashed message, so that the client's next pages may come from the page cache.
+    client.get('/').close()
+
+
+def listed(client):
+    # The venues /venues lists, and whether the page came from the page cache.
+    response = client.get('/venues')
+    page = response.get_data()
+    response.close()
+    assert response.status_code == 200
+    names = [name for name in ('Primary Hall', 'Replica Hall', 'New Hall') if name.encode() in page]
+    return names, response.headers.get('X-Cache')
+
+
+def names(app, bind=None):
+    with app.app_context():
+        with db.get_engine(app, bind=bind).connect() as connection:
+            return sorted(name for name, in connection.execute(text('SELECT name FROM venues')))
+
+
+def test_reads_go_to_the_replica_and_writes_to_the_primary(make_routed_app):
+    app = make_routed_app()
+    client = app.test_client()
+    assert listed(client)[0] == ['Replica Hall']
+    create_venue(client, 'New Hall')
+    assert names(app) == ['New Hall', 'Primary Hall']
+    assert names(app, 'replica0') == ['Replica Hall']
+
+
+def test_writers_read_the_primary_for_a_while(make_routed_app, clock):
+    app = make_routed_app()
+    writer, other = app.test_client(), app.test_client()
+    create_venue(writer, 'New Hall')
+    assert listed(writer)[0] == ['Primary Hall', 'New Hall']
+    assert listed(other)[0] == ['Replica Hall']
+
+    clock.now += 4
+    assert listed(writer)[0] == ['Primary Hall', 'New Hall']
+    clock.now += 2
+    assert listed(writer)[0] == ['Replica Hall']
+
+
+def test_replica_pages_are_not_cached_right_after_a_write(make_routed_app, clock):
+    app = make_routed_app(PAGE_CACHE_ENABLED=True)
+    writer, other = app.test_client(), app.test_client()
+    create_venue(writer, 'New Hall')
+    # The replica may not have the new venue yet: its page must not refill the purged cache.
+    assert listed(other) == (['Replica Hall'], None)
+    assert listed(other) == (['Replica Hall'], None)
+
+    clock.now += 6
+    assert listed(other) == (['Replica Hall'], 'MISS')
+    assert listed(other) == (['Replica Hall'], 'HIT')
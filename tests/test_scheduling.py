@@ -0,0 +1,111 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Venue, Artist, Show
+from scheduling import IntervalTree, find_conflicts
+
+
+# Shows occupy [show_time, end_time): a show may start the minute the previous one ends, and two
+# shows starting at the same time always clash.
+
+EIGHT_PM = datetime(2030, 1, 1, 20, 0)
+
+
+def at(minutes):
+    return EIGHT_PM + timedelta(minutes=minutes)
+
+
+def test_interval_tree_matches_a_scan():
+    rng = random.Random(42)
+    # Small integer bounds, so many intervals share or touch their endpoints.
+    intervals = []
+    for item in range(300):
+        start = rng.randrange(100)
+        intervals.append((start, start + rng.randrange(1, 10), item))
+    tree = IntervalTree(intervals)
+    for start in range(-1, 110):
+        for length in (1, 3, 20):
+            expected = {item for s, e, item in intervals if s < start + length and e > start}
+            assert {interval[2] for interval in tree.overlapping(start, start + length)} == expected
+
+
+@pytest.fixture
+def booked(app):
+    # Venue 1 and artist 1 play from 20:00 to 21:30; venue 2 and artist 2 are free.
+    with app.app_context():
+        db.session.add_all([Venue(name='Venue %d' % i, city='Austin', state='TX') for i in (1, 2)] +
+                           [Artist(name='Artist %d' % i, city='Austin', state='TX') for i in (1, 2)])
+        db.session.flush()
+        db.session.add(Show(venue_id=1, artist_id=1, show_time=at(0), end_time=at(90)))
+        db.session.commit()
+        yield
+
+
+def proposal(start, end, venue_id=1, artist_id=2):
+    return {'venue_id': venue_id, 'artist_id': artist_id, 'show_time': at(start), 'end_time': at(end)}
+
+
+@pytest.mark.parametrize('start, end, clash', [
+    (-90, 0, False),   # ends as the show starts
+    (90, 180, False),  # starts as the show ends
+    (-90, 1, True),
+    (89, 180, True),
+    (0, 90, True),     # the same slot
+    (0, 30, True),     # same start, ends first
+    (30, 60, True),    # inside
+    (-30, 120, True),  # around
+])
+def test_conflicts_with_existing_shows(booked, start, end, clash):
+    for venue_id, artist_id, field in ((1, 2, 'venue_id'), (2, 1, 'artist_id')):
+        conflicts = find_conflicts(db.session, [('new', proposal(start, end, venue_id, artist_id))])
+        if clash:
+            assert conflicts == [('new', {field: [
+                'The %s is already booked at this time (show 1).' % field[:-3]]})]
+        else:
+            assert conflicts == []
+
+
+def test_free_venue_and_artist_never_clash(booked):
+    assert find_conflicts(db.session, [('new', proposal(0, 90, venue_id=2, artist_id=2))]) == []
+
+
+def test_conflicts_within_a_batch(booked):
+    proposals = [
+        ('a', proposal(120, 180, venue_id=2)),
+        ('b', proposal(180, 240, venue_id=2)),  # right after a
+        ('c', proposal(180, 200, venue_id=2)),  # same start as b
+    ]
+    conflicts = dict(find_conflicts(db.session, proposals))
+    assert set(conflicts) == {'b', 'c'}
+    assert conflicts['b'] == {field: ['The %s is already booked at this time (entry c of this batch).' % noun]
+                              for field, noun in (('venue_id', 'venue'), ('artist_id', 'artist'))}
+
+
+def test_schedule_dry_run(booked, client, queries):
+    shows = [
+        {'venue_id': 1, 'artist_id': 2, 'start_time': '2030-01-01 21:30', 'duration': 60},
+        {'venue_id': 2, 'artist_id': 1, 'start_time': '2030-01-01 18:00', 'duration': 120},
+        {'venue_id': 1, 'artist_id': 2, 'start_time': '2030-01-01 20:00', 'duration': 30},
+        {'venue_id': 2, 'artist_id': 2, 'start_time': '2030-01-01 21:00'},
+    ]
+    with queries:
+        response = client.post('/shows/schedule', json={'shows': shows})
+    assert response.status_code == 200
+    # 0 and 1 touch show 1 at its venue and for its artist; the default two hours of 3 overlap 0.
+    assert response.json == {'valid': 1, 'errors': [
+        {'index': 0, 'errors': {'artist_id': ['The artist is already booked at this time (entry 3 of this batch).']}},
+        {'index': 2, 'errors': {'venue_id': ['The venue is already booked at this time (show 1).']}},
+        {'index': 3, 'errors': {'artist_id': ['The artist is already booked at this time (entry 0 of this batch).']}},
+    ]}
+    assert queries.count == 3
+    with db.engine.connect() as connection:
+        assert connection.execute(db.select(db.func.count()).select_from(Show)).scalar() == 1
+
+
+def test_schedule_rejects_oversized_batches(app, client):
+    app.config['BULK_MAX_RECORDS'] = 2
+    shows = [{'venue_id': 1, 'artist_id': 1, 'start_time': '2030-01-01 20:00'}] * 3
+    assert client.post('/shows/schedule', json={'shows': shows}).status_code == 413
+    assert client.post('/shows/schedule', json={'shows': shows[:2]}).status_code == 200
@@ -0,0 +1,90 @@
+import re
+
+import pytest
+
+from models import db, Venue, Artist
+
+
+# On SQLite, search runs against the in-process inverted index (search.InvertedIndex), which has to
+# match words by prefix in any case and follow every write made through this process.
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        db.session.add_all([
+            Venue(name='The Hall', city='Austin', state='TX', genres=['Jazz']),
+            Venue(name='Blue Note Club', city='Seattle', state='WA', genres=['Jazz']),
+            Venue(name='Hall of Fame', city='San Francisco', state='CA', genres=['Jazz']),
+            Venue(name='Austin Arms', city='Dallas', state='TX', genres=['Jazz']),
+            Artist(name='Ann Lee', city='Austin', state='TX', genres=['Jazz']),
+            Artist(name='The Hall Band', city='Seattle', state='WA', genres=['Jazz']),
+        ])
+        db.session.commit()
+    return app
+
+
+def found(get, kind, term):
+    # The names on the search page, in order, checked against its count of matches.
+    page = get('/%s/search' % kind, query_string={'search_term': term}).get_data(as_text=True)
+    names = re.findall(r'<h5>(.*?)</h5>', page)
+    assert 'Number of search results for "%s": %d' % (term, len(names)) in page
+    return names
+
+
+def venue_form(name, **values):
+    return dict({'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St', 'phone': '',
+                 'genres': ['Jazz']}, **values)
+
+
+def test_words_match_by_prefix_in_any_case(get):
+    assert found(get, 'venues', 'HAL') == ['The Hall', 'Hall of Fame']
+    assert found(get, 'venues', 'note cl') == ['Blue Note Club']
+    assert found(get, 'venues', 'san FRAN') == ['Hall of Fame']
+    # Names rank above cities.
+    assert found(get, 'venues', 'austin') == ['Austin Arms', 'The Hall']
+    assert found(get, 'venues', 'hall seattle') == []
+    assert found(get, 'artists', 'ann') == ['Ann Lee']
+    assert found(get, 'artists', 'Hal') == ['The Hall Band']
+    assert found(get, 'artists', 'hall seattle') == ['The Hall Band']
+
+
+def test_the_index_follows_the_forms(app, client, get):
+    assert found(get, 'venues', 'cellar') == []
+    client.post('/venues/create', data=venue_form('Jazz Cellar'))
+    assert found(get, 'venues', 'cellar') == ['Jazz Cellar']
+
+    with app.app_context():
+        venue_id = Venue.query.filter_by(name='Jazz Cellar').one().id
+    client.post('/venues/%d/edit' % venue_id, data=venue_form('Blues Cellar'))
+    assert found(get, 'venues', 'jazz') == []
+    assert found(get, 'venues', 'blues cel') == ['Blues Cellar']
+
+    client.get('/venues/delete/%d' % venue_id)
+    assert found(get, 'venues', 'cellar') == []
+
+    assert found(get, 'artists', 'cat') == []
+    client.post('/artists/create', data={'name': 'Cat Power', 'city': 'Austin', 'state': 'TX', 'phone': '',
+                                         'genres': ['Folk']})
+    assert found(get, 'artists', 'power') == ['Cat Power']
+    client.post('/artists/1/edit', data={'name': 'Annie Lee', 'city': 'Austin', 'state': 'TX', 'phone': '',
+                                         'genres': ['Jazz']})
+    assert found(get, 'artists', 'annie') == ['Annie Lee']
+    assert found(get, 'artists', 'ann l') == ['Annie Lee']
+
+
+def test_batch_inserts_are_indexed(client, get):
+    # Built before the batches below, which are Core inserts the session listeners do not see.
+    assert found(get, 'venues', 'cellar') == []
+    assert found(get, 'artists', 'power') == []
+    response = client.post('/api/venues:batch', json=[
+        {'name': 'Jazz Cellar', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St', 'genres': ['Jazz']},
+        {'name': 'Cellar Door', 'city': 'Seattle', 'state': 'WA', 'address': '2 Main St', 'genres': ['Jazz']}])
+    assert response.status_code == 201
+    assert found(get, 'venues', 'cellar') == ['Jazz Cellar', 'Cellar Door']
+    assert found(get, 'venues', 'cellar sea') == ['Cellar Door']
+
+    response = client.post('/api/artists:batch', json=[
+        {'name': 'Cat Power', 'city': 'Austin', 'state': 'TX', 'genres': ['Folk']}])
+    assert response.status_code == 201
+    assert found(get, 'artists', 'power') == ['Cat Power']
@@ -0,0 +1,82 @@
+import gc
+import tracemalloc
+from datetime import datetime, timedelta
+
+import filters
+from models import db, Venue, Artist, Show
+
+
+# Listing pages are rendered while they are sent (views.common.stream_template), reading their rows
+# in batches, so the memory a page needs must not grow with the number of rows on it.
+
+def add_shows(app, count):
+    # `count` shows spread over ten venues and ten artists.
+    with app.app_context():
+        db.session.add_all([Venue(name='Venue %d' % i, city='Austin', state='TX') for i in range(10)] +
+                           [Artist(name='Artist %d' % i, city='Austin', state='TX') for i in range(10)])
+        db.session.flush()
+        start = datetime(2030, 1, 1)
+        db.session.execute(Show.__table__.insert(), [
+            {'venue_id': i % 10 + 1, 'artist_id': i % 10 + 1, 'show_time': start + timedelta(hours=i),
+             'end_time': start + timedelta(hours=i + 1)} for i in range(count)])
+        db.session.commit()
+
+
+def peak_memory(app, path):
+    # Peak traced memory while the response is generated and sent, and the body size.
+    client = app.test_client()
+    client.get(path).close()  # compile the templates first
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(3):
+            tracemalloc.reset_peak()
+            response = client.get(path)
+            size = sum(len(chunk) for chunk in response.response)
+            response.close()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        return min(peaks), size
+    finally:
+        tracemalloc.stop()
+
+
+def test_streamed_listing_memory_does_not_grow_with_rows(make_app, monkeypatch):
+    # Formatted show times are cached per process (up to 4096 of them), not per page.
+    monkeypatch.setattr(filters, '_format_datetime', filters._format_datetime.__wrapped__)
+    peaks, sizes = [], []
+    for count in (1000, 4000):
+        # One page holding every show, read in two and then eight batches of STREAM_BATCH_SIZE.
+        app = make_app(PAGE_SIZE=count)
+        add_shows(app, count)
+        peak, size = peak_memory(app, '/shows')
+        peaks.append(peak)
+        sizes.append(size)
+    assert sizes[1] > 3 * sizes[0]
+    assert peaks[1] < 1.25 * peaks[0], peaks
+
+
+def test_buffered_listing_memory_grows_with_rows(make_app):
+    # The baseline the test above guards against.
+    peaks = []
+    for count in (1000, 4000):
+        app = make_app(PAGE_SIZE=count, STREAM_TEMPLATES=False)
+        add_shows(app, count)
+        peaks.append(peak_memory(app, '/shows')[0])
+    assert peaks[1] > 2.5 * peaks[0], peaks
+
+
+def test_streamed_pages_are_measured_once_sent(app):
+    add_shows(app, 20)
+    client = app.test_client()
+    response = client.get('/shows')
+    # The body has not been generated yet when the headers go out.
+    assert 'Server-Timing' not in response.headers
+    response.get_data()
+    response.close()
+    metrics = app.extensions['metrics']
+    assert metrics.queries['shows.shows'] == 1
+    assert metrics.histograms['fyyur_request_template_seconds']['shows.shows'].sum > 0
+
+    response = client.get('/venues')
+    assert 'desc="1 queries"' in response.headers['Server-Timing']
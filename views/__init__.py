@@ -0,0 +1,3 @@
+from views import artists, main, shows, venues
+
+BLUEPRINTS = (main.bp, venues.bp, artists.bp, shows.bp)
@@ -0,0 +1,133 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import abort, render_template
+from sqlalchemy import select
+
+from asyncdb import fetch, fetch_all
+from models import Venue, Artist, Show
+from pagecache import cached_page
+from pagination import keyset_page, keyset_statement
+from readmodels import ARTIST_CARD, ARTIST_LISTING, BY_NAME, VENUE_CARD, VENUE_LISTING, latest
+from routing import read_only
+from views.common import (ARTIST_FIELDS, CURSOR_ARGS, VENUE_FIELDS, VENUE_ORDER, cursor_args, object_cache,
+                          split_shows, venue_areas)
+
+# Async versions of the read-heavy pages, which asgi.py serves in place of the sync views of the same
+# endpoint. They render the same templates from the same snapshots, with the same page and object
+# caching, but read through asyncdb.py and run the lookups that do not depend on each other
+# concurrently. Listings are rendered in full rather than streamed.
+
+
+@cached_page('index')
+@read_only
+async def index():
+    async def load():
+        artists, venues = await fetch_all(latest(ARTIST_CARD.select(), Artist), latest(VENUE_CARD.select(), Venue))
+        return {'recent_artists': ARTIST_CARD.all(artists), 'recent_venues': VENUE_CARD.all(venues)}
+    return render_template('pages/home.html', **await object_cache().get_or_load_async('index', load))
+
+
+async def _listing(projection, columns):
+    args = cursor_args()
+    rows = await fetch(keyset_statement(projection.select(), columns, **args))
+    return keyset_page(rows, columns, factory=projection.make, **args)
+
+
+@cached_page('venues', args=CURSOR_ARGS)
+@read_only
+async def venues():
+    page = await _listing(VENUE_LISTING, VENUE_ORDER)
+    return render_template('pages/venues.html', areas=venue_areas(page), page=page)
+
+
+@cached_page('artists', args=CURSOR_ARGS)
+@read_only
+async def artists():
+    page = await _listing(ARTIST_LISTING, BY_NAME[Artist])
+    return render_template('pages/artists.html', artists=page, page=page)
+
+
+def _show_tile(row):
+    # Shows without an artist or venue are listed too, as in the sync view; that side is None (the
+    # foreign keys make a set id a row that exists).
+    id, show_time, artist_id, venue_id, artist_name, image_link, venue_name = row
+    return SimpleNamespace(id=id, show_time=show_time, artist_id=artist_id, venue_id=venue_id,
+                           artist=SimpleNamespace(id=artist_id, name=artist_name, image_link=image_link)
+                           if artist_id is not None else None,
+                           venue=SimpleNamespace(id=venue_id, name=venue_name)
+                           if venue_id is not None else None)
+
+
+@cached_page('shows', args=CURSOR_ARGS)
+@read_only
+async def shows():
+    args = cursor_args()
+    columns = (Show.show_time, Show.id)
+    statement = (select(Show.id, Show.show_time, Show.artist_id, Show.venue_id, Artist.name, Artist.image_link,
+                        Venue.name).outerjoin(Show.artist).outerjoin(Show.venue))
+    rows = await fetch(keyset_statement(statement, columns, **args))
+    page = keyset_page(rows, columns, factory=_show_tile, **args)
+    return render_template('pages/shows.html', shows=page, page=page)
+
+
+def _shows_of(condition, relationship, now, upcoming):
+    # The shows matching `condition`, each with the id, name and image of the artist or venue at the
+    # other end of `relationship`.
+    other = relationship.property.mapper.class_
+    statement = (select(Show.id, Show.show_time, Show.artist_id, Show.venue_id, other.id, other.name,
+                        other.image_link).join(relationship).where(condition))
+    if upcoming:
+        return statement.where(Show.show_time > now).order_by(Show.show_time)
+    return statement.where(Show.show_time <= now).order_by(Show.show_time.desc())
+
+
+async def _load(model, fields, model_id, owner, relationship):
+    # The snapshot of views.common.load_venue()/load_artist(): the row itself, its upcoming shows and
+    # its past shows are three queries run at once.
+    now = datetime.utcnow()
+    rows, upcoming, past = await fetch_all(
+        select(*[getattr(model, field) for field in fields]).where(model.id == model_id),
+        _shows_of(owner == model_id, relationship, now, upcoming=True),
+        _shows_of(owner == model_id, relationship, now, upcoming=False))
+    if not rows:
+        return None
+    data = SimpleNamespace(**dict(zip(fields, rows[0])))
+    data.shows = [SimpleNamespace(id=id, show_time=show_time, artist_id=artist_id, venue_id=venue_id,
+                                  **{relationship.key: SimpleNamespace(id=other_id, name=name, image_link=image)})
+                  for id, show_time, artist_id, venue_id, other_id, name, image in upcoming + past]
+    return data
+
+
+@cached_page('venue:{venue_id}')
+@read_only
+async def show_venue(venue_id):
+    venue = await object_cache().get_or_load_async(
+        'venue:%s' % venue_id, lambda: _load(Venue, VENUE_FIELDS, venue_id, Show.venue_id, Show.artist))
+    if venue is None:
+        abort(404)
+    upcoming_shows, past_shows = split_shows(venue.shows)
+    return render_template('pages/show_venue.html', venue=venue, upcoming_shows=upcoming_shows, past_shows=past_shows)
+
+
+@cached_page('artist:{artist_id}')
+@read_only
+async def show_artist(artist_id):
+    artist = await object_cache().get_or_load_async(
+        'artist:%s' % artist_id, lambda: _load(Artist, ARTIST_FIELDS, artist_id, Show.artist_id, Show.venue))
+    if artist is None:
+        abort(404)
+    upcoming_shows, past_shows = split_shows(artist.shows)
+    return render_template('pages/show_artist.html', artist=artist, upcoming_shows=upcoming_shows,
+                           past_shows=past_shows)
+
+
+# The endpoints asgi.py serves with these views.
+ASYNC_VIEWS = {
+    'main.index': index,
+    'venues.venues': venues,
+    'artists.artists': artists,
+    'shows.shows': shows,
+    'venues.show_venue': show_venue,
+    'artists.show_artist': show_artist,
+}
@@ -0,0 +1,116 @@
+from flask import Blueprint, render_template, request, flash, redirect, url_for
+
+import search
+from forms import ArtistForm
+from models import db, Artist
+from pagecache import cached_page
+from readmodels import ARTIST_LISTING, BY_NAME
+from routing import read_only
+from views.common import CURSOR_ARGS, cached_artist, render_listing, split_shows, stream_listing, cursor_args
+
+bp = Blueprint('artists', __name__)
+
+
+@bp.route('/artists')
+@cached_page('artists', args=CURSOR_ARGS)
+@read_only
+def artists():
+    data = stream_listing(ARTIST_LISTING.query(), BY_NAME[Artist], ARTIST_LISTING.make)
+    return render_listing('pages/artists.html', artists=data, page=data)
+
+
+@bp.route('/artists/search', methods=['GET', 'POST'])
+@read_only
+def search_artists():
+    searched_term = request.values.get('search_term', '')
+    results, count = search.search(Artist, searched_term, **cursor_args())
+    return render_listing('pages/search_artists.html', results=results, count=count, search_term=searched_term)
+
+
+@bp.route('/artists/<int:artist_id>')
+@cached_page('artist:{artist_id}')
+@read_only
+def show_artist(artist_id):
+    # shows the artist page with the given artist_id; the artist and its shows come from the object cache
+    artist = cached_artist(artist_id)
+    upcoming_shows, past_shows = split_shows(artist.shows)
+    return render_template('pages/show_artist.html', artist=artist, upcoming_shows=upcoming_shows,
+                           past_shows=past_shows)
+
+
+#  Update
+#  ----------------------------------------------------------------
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+    artist = cached_artist(artist_id)
+    form = ArtistForm()
+    form.name.data = artist.name
+    form.genres.data = artist.genres
+    form.state.data = artist.state
+    form.city.data = artist.state
+    form.phone.data = artist.phone
+    form.image_link.data = artist.image_link
+    form.facebook_link.data = artist.facebook_link
+    form.website_link.data = artist.website_link
+    form.seeking_venue.data = artist.looking_for_venues
+    form.seeking_description.data = artist.seeking_description
+    # TODO: populate form with fields from artist with ID <artist_id>
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    artist = Artist.query.get(artist_id)
+    form = ArtistForm(request.form)
+    if form.validate():
+        artist.name = form.name.data
+        artist.phone = form.phone.data
+        artist.city = form.city.data
+        artist.state = form.state.data
+        artist.genres = form.genres.data
+        artist.image_link = form.image_link.data
+        artist.website_link = form.website_link.data
+        artist.looking_for_venues = form.seeking_venue.data
+        artist.seeking_description = form.seeking_description.data
+        db.session.commit()
+        return redirect(url_for('.show_artist', artist_id=artist_id))
+    else:
+        flash(f'An error occurred, Please check form and try again')
+        return redirect(url_for('.show_artist', artist_id=artist_id))
+
+    # TODO: take values from the form submitted, and update existing
+    # artist record with ID <artist_id> using the new attributes
+
+
+
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@bp.route('/artists/create', methods=['GET'])
+def create_artist_form():
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+
+@bp.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+    add = request.form.get
+    form = ArtistForm(request.form)
+    if form.validate():
+        try:
+            new_artist = Artist(name=add('name'), city=add('city'), state=add('state'),
+                                phone=add('phone'), website_link=add('website_link'), genres=request.form.getlist('genres'),
+                                facebook_link=add('facebook_link'), image_link=add('image_link'),
+                                looking_for_venues=form.seeking_venue.data, seeking_description=add('seeking_description'))
+            db.session.add(new_artist)
+            db.session.commit()
+            flash('Artist' + request.form['name'] + ' was successfully listed!')
+            return redirect(url_for('main.index'))
+        except:
+            db.session.rollback()
+            flash('Artist' + request.form['name'] + ' could not listed!')
+            return redirect(url_for('main.index'))
+    else:
+        flash(f'An error occurred, Please check form and try again')
+        return redirect(url_for('main.index'))
@@ -0,0 +1,124 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import Response, abort, current_app, render_template, request, stream_with_context
+
+from models import db, Venue, Artist, Show
+from pagination import keyset_paginate, stream_paginate
+
+
+# Helpers shared by the blueprints.
+
+# Query args of the listing pages' cursor, see cursor_args(); they are part of the page cache key.
+CURSOR_ARGS = ('after', 'before')
+
+
+def cursor_args():
+    # Listing pages are paged with a (sort key, id) cursor taken from the `after`/`before` query args.
+    return {'after': request.args.get('after'), 'before': request.args.get('before'),
+            'per_page': current_app.config['PAGE_SIZE']}
+
+
+def paginate(query, columns, factory=None):
+    return keyset_paginate(query, columns, factory=factory, **cursor_args())
+
+
+def stream_template(template_name, **context):
+    # Flask 2.1 has no stream_template yet: renders the template chunk by chunk while the response
+    # is sent, so the layout header goes out before the rows are read.
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    # Send a few rows at a time rather than one tiny chunk per tile.
+    stream.enable_buffering(app.config['STREAM_BUFFER_CHUNKS'])
+    return Response(stream_with_context(stream))
+
+
+def render_listing(template_name, **context):
+    # Listing and search pages are streamed unless STREAM_TEMPLATES is off.
+    if current_app.config['STREAM_TEMPLATES']:
+        return stream_template(template_name, **context)
+    return render_template(template_name, **context)
+
+
+def stream_listing(query, columns, factory=None):
+    # Streamed pages read their rows lazily; a buffered render needs them all up front anyway.
+    if current_app.config['STREAM_TEMPLATES']:
+        return stream_paginate(query, columns, factory=factory, **cursor_args())
+    return paginate(query, columns, factory)
+
+
+# Sort key of the venue listing: venues come grouped by area.
+VENUE_ORDER = (Venue.state, Venue.city, Venue.id)
+
+
+def venue_areas(rows):
+    # Buckets the listing rows, sorted by area, into city/state groups in a single pass.
+    areas = {}
+    for row in rows:
+        area = areas.get((row.city, row.state))
+        if area is None:
+            area = areas[(row.city, row.state)] = {"city": row.city, "state": row.state, "venues": []}
+        area['venues'].append({'id': row.id, 'name': row.name, 'num_upcoming_shows': row.num_upcoming_shows})
+    return list(areas.values())
+
+
+def split_shows(shows):
+    # Upcoming shows soonest first, past shows most recent first.
+    now = datetime.utcnow()
+    shows = sorted(shows, key=lambda show: show.show_time)
+    upcoming_shows = [show for show in shows if show.show_time > now]
+    past_shows = [show for show in reversed(shows) if show.show_time <= now]
+    return upcoming_shows, past_shows
+
+
+def record(instance, *fields):
+    # Detached, picklable copy of the given columns, safe to keep in the object cache.
+    return SimpleNamespace(**{field: getattr(instance, field) for field in fields})
+
+
+VENUE_FIELDS = ('id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'website_link',
+                'facebook_link', 'looking_for_talent', 'seeking_description')
+ARTIST_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link', 'website_link',
+                 'looking_for_venues', 'seeking_description')
+
+
+def load_venue(venue_id):
+    # The venue, its shows and each show's artist come back in one joined query.
+    venue = Venue.query.options(db.joinedload(Venue.shows).joinedload(Show.artist)).get(venue_id)
+    if venue is None:
+        return None
+    data = record(venue, *VENUE_FIELDS)
+    data.shows = [SimpleNamespace(id=show.id, show_time=show.show_time, artist_id=show.artist_id,
+                                  venue_id=show.venue_id, artist=record(show.artist, 'id', 'name', 'image_link'))
+                  for show in venue.shows if show.artist is not None]
+    return data
+
+
+def load_artist(artist_id):
+    artist = Artist.query.options(db.joinedload(Artist.shows).joinedload(Show.venue)).get(artist_id)
+    if artist is None:
+        return None
+    data = record(artist, *ARTIST_FIELDS)
+    data.shows = [SimpleNamespace(id=show.id, show_time=show.show_time, artist_id=show.artist_id,
+                                  venue_id=show.venue_id, venue=record(show.venue, 'id', 'name', 'image_link'))
+                  for show in artist.shows if show.venue is not None]
+    return data
+
+
+def object_cache():
+    return current_app.extensions['object_cache']
+
+
+def cached_venue(venue_id):
+    venue = object_cache().get_or_load('venue:%s' % venue_id, lambda: load_venue(venue_id))
+    if venue is None:
+        abort(404)
+    return venue
+
+
+def cached_artist(artist_id):
+    artist = object_cache().get_or_load('artist:%s' % artist_id, lambda: load_artist(artist_id))
+    if artist is None:
+        abort(404)
+    return artist
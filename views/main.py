@@ -0,0 +1,109 @@
+from datetime import datetime
+
+from flask import Blueprint, Response, render_template, request, abort, jsonify, current_app, stream_with_context
+
+import bulk
+import exports
+import facets
+from models import db, Venue, Artist
+from pagecache import cached_page
+from readmodels import ARTIST_CARD, VENUE_CARD, recent
+from routing import read_only
+from views.common import CURSOR_ARGS, cursor_args, object_cache
+
+# The home page, browse, exports, the bulk write API and the error pages.
+bp = Blueprint('main', __name__)
+
+
+@bp.route('/')
+@cached_page('index')
+@read_only
+def index():
+    # Shows Recent Listed Artists and Recently Listed Venues on the homepage, returning results
+    # for Artists and Venues sorting by newly created. Limit to the 10 most recently
+    # listed items.
+    def load():
+        return {'recent_artists': recent(ARTIST_CARD, Artist), 'recent_venues': recent(VENUE_CARD, Venue)}
+    return render_template('pages/home.html', **object_cache().get_or_load('index', load))
+
+
+#  Bulk writes
+#  ----------------------------------------------------------------
+
+@bp.route('/api/<any(venues, artists, shows):kind>:batch', methods=['POST'])
+def write_batch(kind):
+    # A JSON array of records, written all together or not at all; see bulk.py.
+    records = request.get_json(silent=True)
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        abort(400)
+    if len(records) > current_app.config['BULK_MAX_RECORDS']:
+        abort(413)
+    key = request.headers.get('Idempotency-Key')
+    if not bulk.valid_key(key):
+        abort(400)
+    result = bulk.write_batch(db.session, kind, records, key)
+    response = jsonify(result.body)
+    response.status_code = result.status
+    if result.replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+#  Browse
+#  ----------------------------------------------------------------
+
+@bp.route('/<any(artists, venues):kind>/browse', defaults={'format': 'html'})
+@bp.route('/<any(artists, venues):kind>/browse.json', defaults={'format': 'json'})
+@cached_page('{kind}', args=CURSOR_ARGS + facets.Filters.ARGS)
+@read_only
+def browse(kind, format):
+    # e.g. /artists/browse?genre=Jazz&genre=Blues&state=CA&seeking=1; every filter narrows the match
+    # and the facet counts are taken over the whole match, not just this page.
+    model = Artist if kind == 'artists' else Venue
+    filters = facets.Filters.from_args(request.args)
+    page, counts = facets.browse(model, filters, **cursor_args())
+    if format == 'json':
+        return jsonify({'results': [row._asdict() for row in page], 'facets': counts,
+                        'next': page.next_cursor if page.has_next else None,
+                        'prev': page.prev_cursor if page.has_prev else None})
+    return render_template('pages/browse.html', kind=kind, results=page, counts=counts, filters=filters)
+
+
+#  Exports
+#  ----------------------------------------------------------------
+
+@bp.route('/<any(venues, artists, shows):kind>.<any(jsonl, csv):format>')
+@read_only
+def export(kind, format):
+    # e.g. /shows.csv?since=2022-06-01T00:00:00 for shows starting from June 2022
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            abort(400)
+    query = exports.export_query(kind, since or None)
+    if format == 'csv':
+        body, mimetype = exports.stream_csv(query), 'text/csv'
+    else:
+        body, mimetype = exports.stream_jsonl(query), 'application/x-ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={kind}.{format}'})
+
+
+@bp.route('/cache/stats')
+def cache_stats():
+    stats = object_cache().stats()
+    if 'page_cache' in current_app.extensions:
+        stats['pages'] = current_app.extensions['page_cache'].stats()
+    return jsonify(stats)
+
+
+@bp.app_errorhandler(404)
+def not_found_error(error):
+    return render_template('errors/404.html'), 404
+
+
+@bp.app_errorhandler(500)
+def server_error(error):
+    return render_template('errors/500.html'), 500
@@ -0,0 +1,79 @@
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, jsonify, current_app
+
+from forms import ShowForm
+from importer import validate_rows, RowError, ShowRows
+from models import db, Show
+from pagecache import cached_page
+from routing import read_only
+from scheduling import find_conflicts
+from views.common import CURSOR_ARGS, render_listing, stream_listing
+
+bp = Blueprint('shows', __name__)
+
+
+@bp.route('/shows')
+@cached_page('shows', args=CURSOR_ARGS)
+@read_only
+def shows():
+    # displays list of shows at shows, with the artist and venue of every tile joined in
+    data = stream_listing(Show.query.options(db.joinedload(Show.artist), db.joinedload(Show.venue)),
+                          (Show.show_time, Show.id))
+    return render_listing('pages/shows.html', shows=data, page=data)
+
+
+@bp.route('/shows/create')
+def create_shows():
+    # renders form. do not touch.
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+
+@bp.route('/shows/create', methods=['POST'])
+def create_show_submission():
+    # called to create new shows in the db, upon submitting new show listing form
+    # TODO: insert form data as a new Show record in the db, instead
+
+    form = ShowForm(request.form)
+    if form.validate():
+        try:
+            values = ShowRows().values(form, request.form)
+        except RowError:
+            flash('An error occurred, check the form and try again')
+            return redirect(url_for('main.index'))
+        # Unknown artist/venue ids are caught by the foreign keys on insert.
+        conflicts = find_conflicts(db.session, [(0, values)])
+        if conflicts:
+            for messages in conflicts[0][1].values():
+                flash(messages[0])
+            return redirect(url_for('.create_shows'))
+        try:
+            db.session.add(Show(**values))
+            db.session.commit()
+            flash('Show was successfully listed!')
+            return redirect(url_for('main.index'))
+        except:
+            db.session.rollback()
+            flash('Show could not be listed, Check submission and try again!')
+            return redirect(url_for('main.index'))
+    else:
+        flash('An error occurred, check the form and try again')
+        return redirect(url_for('main.index'))
+
+
+@bp.route('/shows/schedule', methods=['POST'])
+def check_schedule():
+    # Dry run for a batch of proposed shows, e.g. {"shows": [{"artist_id": 1, "venue_id": 2,
+    # "start_time": "2026-11-01 20:00", "duration": 90}, ...]}. Every show is checked with the show
+    # form, its artist/venue references and for double bookings against the database and the rest of
+    # the batch, in three queries whatever the size of the batch. Nothing is written. Batches are
+    # capped at BULK_MAX_RECORDS shows like the bulk write API.
+    payload = request.get_json(silent=True)
+    shows = payload.get('shows') if isinstance(payload, dict) else None
+    if not isinstance(shows, list) or not all(isinstance(show, dict) for show in shows):
+        abort(400)
+    if len(shows) > current_app.config['BULK_MAX_RECORDS']:
+        abort(413)
+    form = ShowForm(formdata=None, meta={'csrf': False})
+    accepted, errors = validate_rows(ShowRows(), form, db.session, list(enumerate(shows)))
+    return jsonify({'valid': len(accepted),
+                    'errors': [{'index': index, 'errors': problems} for index, problems in errors]})
@@ -0,0 +1,183 @@
+from flask import Blueprint, abort, current_app, jsonify, render_template, request, flash, redirect, url_for
+
+import geo
+import search
+from forms import VenueForm
+from models import db, Venue
+from pagecache import cached_page
+from readmodels import VENUE_LISTING
+from routing import read_only
+from views.common import CURSOR_ARGS, VENUE_ORDER, cached_venue, cursor_args, paginate, render_listing, split_shows, venue_areas
+
+bp = Blueprint('venues', __name__)
+
+
+@bp.route('/venues')
+@cached_page('venues', args=CURSOR_ARGS)
+@read_only
+def venues():
+    # Upcoming show counts are read from the venue's own counter, so the shows table is not touched.
+    page = paginate(VENUE_LISTING.query(), VENUE_ORDER, VENUE_LISTING.make)
+    return render_template('pages/venues.html', areas=venue_areas(page), page=page)
+
+
+@bp.route('/venues/search', methods=['GET', 'POST'])
+@read_only
+def search_venues():
+    # GET is accepted as well so the next/previous page links can carry the search term.
+    searched_term = request.values.get('search_term', '')
+    results, count = search.search(Venue, searched_term, **cursor_args())
+    return render_listing('pages/search_venues.html', results=results, count=count, search_term=searched_term)
+
+
+@bp.route('/venues/near', defaults={'format': 'html'})
+@bp.route('/venues/near.json', defaults={'format': 'json'})
+@read_only
+def nearby_venues(format):
+    # e.g. /venues/near?lat=30.27&lon=-97.74&radius=10, /venues/near?city=Austin&state=TX, or
+    # /venues/near.json?bbox=-97.8,30.2,-97.7,30.3 (west,south,east,north) for the venues on a map.
+    # Without a radius, venues up to GEO_DEFAULT_RADIUS_KM away are considered.
+    config, args = current_app.config, request.args
+    center, box = None, None
+    try:
+        limit = max(1, min(int(args.get('limit', config['GEO_RESULTS'])), config['GEO_MAX_RESULTS']))
+        radius = float(args.get('radius') or config['GEO_DEFAULT_RADIUS_KM'])
+        if not 0 < radius <= config['GEO_MAX_RADIUS_KM']:
+            raise ValueError(radius)
+        if args.get('bbox'):
+            west, south, east, north = map(float, args['bbox'].split(','))
+            box = geo.Box(*geo.check_location(south, west), *geo.check_location(north, east))
+            if box.south > box.north or box.west > box.east:
+                raise ValueError(box)
+        elif args.get('lat') or args.get('lon'):
+            center = geo.check_location(args.get('lat'), args.get('lon'))
+        elif args.get('city'):
+            center = geo.geocode(args['city'], args.get('state'))
+    except (TypeError, ValueError):
+        abort(400)
+    if box is not None:
+        center, results = box.center, geo.in_box(box, limit)
+    elif center is not None:
+        results = geo.nearby(*center, radius, limit)
+    else:
+        # Nothing searched yet, or a city the gazetteer does not know.
+        results = None
+    if format == 'json':
+        return jsonify({'center': center and {'latitude': center[0], 'longitude': center[1]},
+                        'results': [row._asdict() for row in results or []]})
+    return render_template('pages/venues_near.html', results=results, center=center, radius=radius,
+                           city=args.get('city', ''), state=args.get('state', ''))
+
+
+@bp.route('/venues/<int:venue_id>')
+@cached_page('venue:{venue_id}')
+@read_only
+def show_venue(venue_id):
+    data = cached_venue(venue_id)
+    upcoming_shows, past_shows = split_shows(data.shows)
+    return render_template('pages/show_venue.html', venue=data, upcoming_shows=upcoming_shows, past_shows=past_shows)
+
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@bp.route('/venues/create', methods=['GET'])
+def create_venue_form():
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+
+@bp.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+    form = VenueForm(request.form)
+    if form.validate():
+        add = request.form.get  # to avoid repetition
+        try:
+            print(request.form.getlist('genres'))
+            new_venue = Venue(name=add('name'), city=add('city'), state=add('state'), address=add('address'),
+                              phone=add('phone'), genres=request.form.getlist('genres'), website_link=add('website_link'),
+                              facebook_link=add('facebook_link'),
+                              looking_for_talent=form.seeking_talent.data,
+                              seeking_description=add('seeking_description'))
+
+            db.session.add(new_venue)
+            db.session.commit()
+            flash('Venue ' + request.form['name'] + ' was successfully listed!')
+        except:
+            db.session.rollback()
+            flash('An error occurred. Venue ' + add('name') + ' could not be listed.')
+        return redirect(url_for('main.index'))
+    else:
+        print(form.form_errors)
+        flash('An error occurred with the form')
+        return redirect(url_for('main.index'))
+
+
+@bp.route('/venues/delete/<venue_id>')
+def delete_venue(venue_id):
+    venue = Venue.query.get(venue_id)
+    try:
+        db.session.delete(venue)
+        db.session.commit()
+        flash(f'Venue {venue.name} has been deleted')
+        return redirect(url_for('main.index'))
+    except:
+        db.session.rollback()
+        flash(f'Venue {venue.name} could not be deleted')
+        return redirect(url_for('main.index'))
+
+    # TODO: Complete this endpoint for taking a venue_id, and using
+    # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+
+    # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
+    # clicking that button delete it from the db then redirect the user to the homepage
+
+
+
+
+#  Update
+#  ----------------------------------------------------------------
+
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+    form = VenueForm()
+    venue = cached_venue(venue_id)
+    form.name.data = venue.name
+    form.genres.data = venue.genres
+    form.state.data = venue.state
+    form.address.data = venue.address
+    form.city.data = venue.city
+    form.phone.data = venue.phone
+    form.seeking_talent.data = venue.looking_for_talent
+    form.image_link.data = venue.image_link
+    form.facebook_link.data = venue.facebook_link
+    form.website_link.data = venue.website_link
+    form.seeking_description.data = venue.seeking_description
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+    # TODO: populate form with values from venue with ID <venue_id>
+
+
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    venue = Venue.query.get(venue_id)
+    form = VenueForm(request.form)
+    if form.validate():
+        venue.name = form.name.data
+        venue.phone = form.phone.data
+        venue.city = form.city.data
+        venue.state = form.state.data
+        venue.address = form.address.data
+        venue.genres = form.genres.data
+        venue.image_link = form.image_link.data
+        venue.website_link = form.website_link.data
+        venue.looking_for_talent = form.seeking_talent.data
+        venue.seeking_description = form.seeking_description.data
+        db.session.commit()
+        return redirect(url_for('.show_venue', venue_id=venue_id))
+    else:
+        flash(f'Check submission and try again')
+        return redirect(url_for('.show_venue', venue_id=venue_id))
+
+    # TODO: take values from the form submitted, and update existing
+    # venue record with ID <venue_id> using the new attributes